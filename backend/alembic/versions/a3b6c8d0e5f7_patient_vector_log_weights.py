@@ -0,0 +1,45 @@
+"""patient vectors: log-space weights and folded note ids
+
+Revision ID: a3b6c8d0e5f7
+Revises: f2a5b7c9d4e6
+Create Date: 2025-10-29 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'a3b6c8d0e5f7'
+down_revision: Union[str, Sequence[str], None] = 'f2a5b7c9d4e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - store log(total weight) and the note IDs folded into each patient vector."""
+    op.add_column('patient_vectors', sa.Column('log_total_weight', sa.Float(), server_default='0', nullable=False))
+    op.add_column('patient_vectors', sa.Column('note_ids', postgresql.ARRAY(sa.UUID()), server_default='{}', nullable=False))
+    op.execute("UPDATE patient_vectors SET log_total_weight = ln(total_weight) WHERE total_weight > 0")
+    # Existing vectors were built from the notes embedded at the time; POST /rag/patients/vectors/rebuild repairs drift
+    op.execute("""
+        UPDATE patient_vectors pv SET note_ids = notes.ids
+        FROM (
+            SELECT s.patient_id, array_agg(n.note_id) AS ids
+            FROM session_soap_notes n JOIN patient_visit_sessions s ON s.session_id = n.session_id
+            WHERE n.embedding IS NOT NULL
+            GROUP BY s.patient_id
+        ) notes
+        WHERE pv.patient_id = notes.patient_id AND pv.embedding IS NOT NULL
+    """)
+    op.drop_column('patient_vectors', 'total_weight')
+
+
+def downgrade() -> None:
+    """Downgrade schema - restore linear total weights."""
+    op.add_column('patient_vectors', sa.Column('total_weight', sa.Float(), server_default='0', nullable=False))
+    op.execute("UPDATE patient_vectors SET total_weight = exp(least(log_total_weight, 700)) WHERE note_count > 0")
+    op.drop_column('patient_vectors', 'note_ids')
+    op.drop_column('patient_vectors', 'log_total_weight')
@@ -0,0 +1,38 @@
+"""add pipeline stage samples
+
+Revision ID: b4c7d9e1f6a8
+Revises: a3b6c8d0e5f7
+Create Date: 2025-10-29 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b4c7d9e1f6a8'
+down_revision: Union[str, Sequence[str], None] = 'a3b6c8d0e5f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - persist recent pipeline stage timings."""
+    op.create_table('pipeline_stage_samples',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('stage', sa.String(length=50), nullable=False),
+    sa.Column('input_tokens', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('output_tokens', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('latency_seconds', sa.Float(), nullable=True),
+    sa.Column('estimated', sa.Boolean(), server_default='false', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_pipeline_stage_samples_stage_id', 'pipeline_stage_samples', ['stage', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema - drop pipeline stage samples."""
+    op.drop_index('ix_pipeline_stage_samples_stage_id', table_name='pipeline_stage_samples')
+    op.drop_table('pipeline_stage_samples')
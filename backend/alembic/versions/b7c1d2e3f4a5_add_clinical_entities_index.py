@@ -0,0 +1,52 @@
+"""add clinical entities index
+
+Revision ID: b7c1d2e3f4a5
+Revises: a1b2c3d4e5f6
+Create Date: 2025-10-20 10:15:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b7c1d2e3f4a5'
+down_revision: Union[str, Sequence[str], None] = 'a1b2c3d4e5f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - add normalized clinical entity index table."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    op.create_table('clinical_entities',
+    sa.Column('entity_id', sa.UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+    sa.Column('note_id', sa.UUID(), nullable=False),
+    sa.Column('patient_id', sa.UUID(), nullable=False),
+    sa.Column('entity_type', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Text(), nullable=False),
+    sa.Column('normalized_value', sa.String(length=255), nullable=False),
+    sa.Column('confidence', sa.Float(), server_default='1.0', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['session_soap_notes.note_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['patient_id'], ['patients.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('entity_id'),
+    sa.UniqueConstraint('note_id', 'entity_type', 'normalized_value', name='uq_clinical_entities_note_type_value')
+    )
+    op.create_index('ix_clinical_entities_type_value', 'clinical_entities', ['entity_type', 'normalized_value'], unique=False)
+    op.create_index('ix_clinical_entities_value', 'clinical_entities', ['normalized_value'], unique=False)
+    op.create_index('ix_clinical_entities_patient_type', 'clinical_entities', ['patient_id', 'entity_type'], unique=False)
+    op.create_index('ix_clinical_entities_note', 'clinical_entities', ['note_id'], unique=False)
+    op.create_index('ix_clinical_entities_value_trgm', 'clinical_entities', ['normalized_value'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'normalized_value': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema - drop clinical entity index table."""
+    op.drop_index('ix_clinical_entities_value_trgm', table_name='clinical_entities', postgresql_using='gin')
+    op.drop_index('ix_clinical_entities_note', table_name='clinical_entities')
+    op.drop_index('ix_clinical_entities_patient_type', table_name='clinical_entities')
+    op.drop_index('ix_clinical_entities_value', table_name='clinical_entities')
+    op.drop_index('ix_clinical_entities_type_value', table_name='clinical_entities')
+    op.drop_table('clinical_entities')
@@ -0,0 +1,54 @@
+"""track notes folded into patient vectors on the note rows
+
+Revision ID: c5d8e0f2a7b9
+Revises: b4c7d9e1f6a8
+Create Date: 2025-10-30 09:00:00.000000
+
+"""
+import math
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'c5d8e0f2a7b9'
+down_revision: Union[str, Sequence[str], None] = 'b4c7d9e1f6a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - replace patient_vectors.note_ids with a per-note folded log weight."""
+    op.add_column('session_soap_notes', sa.Column('vector_log_weight', sa.Float(), nullable=True))
+    # Same weighting as PatientVectorService.note_log_weight: days since 2000-01-01 / tau
+    tau_days = float(os.getenv("PATIENT_VECTOR_HALF_LIFE_DAYS", "365")) / math.log(2)
+    op.execute(f"""
+        UPDATE session_soap_notes n
+        SET vector_log_weight = (
+            extract(epoch FROM s.visit_date) - extract(epoch FROM timestamptz '2000-01-01 00:00:00+00')
+        ) / 86400.0 / {tau_days!r}
+        FROM patient_visit_sessions s, patient_vectors pv
+        WHERE s.session_id = n.session_id
+          AND pv.patient_id = s.patient_id
+          AND n.note_id = ANY(pv.note_ids)
+    """)
+    op.drop_column('patient_vectors', 'note_ids')
+
+
+def downgrade() -> None:
+    """Downgrade schema - restore the folded note ID arrays."""
+    op.add_column('patient_vectors', sa.Column('note_ids', postgresql.ARRAY(sa.UUID()), server_default='{}', nullable=False))
+    op.execute("""
+        UPDATE patient_vectors pv SET note_ids = notes.ids
+        FROM (
+            SELECT s.patient_id, array_agg(n.note_id) AS ids
+            FROM session_soap_notes n JOIN patient_visit_sessions s ON s.session_id = n.session_id
+            WHERE n.vector_log_weight IS NOT NULL
+            GROUP BY s.patient_id
+        ) notes
+        WHERE pv.patient_id = notes.patient_id
+    """)
+    op.drop_column('session_soap_notes', 'vector_log_weight')
@@ -0,0 +1,44 @@
+"""add precomputed answers
+
+Revision ID: c8d2e4f6a1b3
+Revises: b7c1d2e3f4a5
+Create Date: 2025-10-21 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'c8d2e4f6a1b3'
+down_revision: Union[str, Sequence[str], None] = 'b7c1d2e3f4a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - add precomputed standard-question answers table."""
+    op.create_table('precomputed_answers',
+    sa.Column('answer_id', sa.UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+    sa.Column('patient_id', sa.UUID(), nullable=False),
+    sa.Column('question_key', sa.String(length=100), nullable=False),
+    sa.Column('question', sa.Text(), nullable=False),
+    sa.Column('answer', sa.Text(), nullable=False),
+    sa.Column('sources', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('source_note_id', sa.UUID(), nullable=True),
+    sa.Column('source_note_updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('generation_time', sa.Float(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['patient_id'], ['patients.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['source_note_id'], ['session_soap_notes.note_id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('answer_id'),
+    sa.UniqueConstraint('patient_id', 'question_key', name='uq_precomputed_answers_patient_question')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema - drop precomputed answers table."""
+    op.drop_table('precomputed_answers')
@@ -0,0 +1,40 @@
+"""add patient vectors
+
+Revision ID: d9e3f5a7b2c4
+Revises: c8d2e4f6a1b3
+Create Date: 2025-10-22 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import vector
+
+
+revision: str = 'd9e3f5a7b2c4'
+down_revision: Union[str, Sequence[str], None] = 'c8d2e4f6a1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - add patient-level vectors with an HNSW index."""
+    op.create_table('patient_vectors',
+    sa.Column('patient_id', sa.UUID(), nullable=False),
+    sa.Column('embedding', vector.VECTOR(dim=768), nullable=True),
+    sa.Column('total_weight', sa.Float(), server_default='0', nullable=False),
+    sa.Column('note_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['patient_id'], ['patients.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('patient_id')
+    )
+    op.create_index('ix_patient_vectors_embedding_hnsw', 'patient_vectors', ['embedding'],
+                    unique=False, postgresql_using='hnsw',
+                    postgresql_ops={'embedding': 'vector_cosine_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema - drop patient vectors."""
+    op.drop_index('ix_patient_vectors_embedding_hnsw', table_name='patient_vectors', postgresql_using='hnsw')
+    op.drop_table('patient_vectors')
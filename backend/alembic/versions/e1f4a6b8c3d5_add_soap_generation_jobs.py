@@ -0,0 +1,66 @@
+"""add bulk soap generation jobs
+
+Revision ID: e1f4a6b8c3d5
+Revises: d9e3f5a7b2c4
+Create Date: 2025-10-24 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'e1f4a6b8c3d5'
+down_revision: Union[str, Sequence[str], None] = 'd9e3f5a7b2c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - add bulk SOAP generation jobs and their items."""
+    op.create_table('soap_generation_jobs',
+    sa.Column('job_id', sa.UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+    sa.Column('professional_id', sa.UUID(), nullable=True),
+    sa.Column('status', sa.String(length=20), server_default='pending', nullable=False),
+    sa.Column('concurrency', sa.Integer(), server_default='4', nullable=False),
+    sa.Column('options', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('total_items', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['professional_id'], ['professional.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('job_id')
+    )
+    op.create_table('soap_generation_job_items',
+    sa.Column('item_id', sa.UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+    sa.Column('job_id', sa.UUID(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.UUID(), nullable=False),
+    sa.Column('document_id', sa.UUID(), nullable=True),
+    sa.Column('text', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), server_default='pending', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('note_id', sa.UUID(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('processing_time', sa.Float(), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['job_id'], ['soap_generation_jobs.job_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['session_id'], ['patient_visit_sessions.session_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['document_id'], ['uploaded_documents.document_id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['note_id'], ['session_soap_notes.note_id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('item_id')
+    )
+    op.create_index('ix_soap_generation_job_items_job_status', 'soap_generation_job_items',
+                    ['job_id', 'status', 'position'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema - drop bulk SOAP generation jobs."""
+    op.drop_index('ix_soap_generation_job_items_job_status', table_name='soap_generation_job_items')
+    op.drop_table('soap_generation_job_items')
+    op.drop_table('soap_generation_jobs')
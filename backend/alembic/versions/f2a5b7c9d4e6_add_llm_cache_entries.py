@@ -0,0 +1,43 @@
+"""add llm response cache
+
+Revision ID: f2a5b7c9d4e6
+Revises: e1f4a6b8c3d5
+Create Date: 2025-10-28 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'f2a5b7c9d4e6'
+down_revision: Union[str, Sequence[str], None] = 'e1f4a6b8c3d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - add the LLM response cache."""
+    op.create_table('llm_cache_entries',
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('provider', sa.String(length=20), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('operation', sa.String(length=50), nullable=False),
+    sa.Column('response', sa.Text(), nullable=False),
+    sa.Column('size_bytes', sa.Integer(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_hit_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('cache_key')
+    )
+    op.create_index('ix_llm_cache_entries_expires_at', 'llm_cache_entries', ['expires_at'], unique=False)
+    op.create_index('ix_llm_cache_entries_last_hit_at', 'llm_cache_entries', ['last_hit_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema - drop the LLM response cache."""
+    op.drop_index('ix_llm_cache_entries_last_hit_at', table_name='llm_cache_entries')
+    op.drop_index('ix_llm_cache_entries_expires_at', table_name='llm_cache_entries')
+    op.drop_table('llm_cache_entries')
@@ -12,9 +12,12 @@ from fastapi import HTTPException, status
 from app.schemas.rag_schemas import (
     RAGQueryRequest, RAGQueryResponse, EmbeddingRequest, EmbeddingResponse,
     SimilaritySearchRequest, SimilaritySearchResponse, BatchEmbeddingRequest,
-    BatchEmbeddingResponse
+    BatchEmbeddingResponse, EntitySearchResponse, EntityBackfillRequest,
+    EntityBackfillResponse, SimilarPatientsResponse, PatientVectorRebuildResponse
 )
 from app.services.rag_service import RAGService
+from app.services.rag_conversation_cache import ConversationAccessError
+from app.services.entity_index_service import EntityIndexService
 
 logger = structlog.get_logger(__name__)
 
@@ -25,19 +28,21 @@ class RAGController:
     def __init__(self):
         """Initialize RAG controller."""
         self.rag_service = RAGService()
+        self.entity_index_service = EntityIndexService()
     
-    async def query_knowledge_base(self, query_data: RAGQueryRequest) -> RAGQueryResponse:
+    async def query_knowledge_base(self, query_data: RAGQueryRequest, user_id: Optional[uuid.UUID] = None) -> RAGQueryResponse:
         """
         Query the knowledge base using RAG.
         
         Args:
             query_data: RAG query request data
+            user_id: Requesting user, owner of the conversation
         
         Returns:
             RAGQueryResponse: Query results with sources
         
         Raises:
-            HTTPException: If query fails
+            HTTPException: If the conversation belongs to another user or the query fails
         """
         try:
             logger.info(
@@ -46,8 +51,13 @@ class RAGController:
                 patient_id=str(query_data.patient_id) if query_data.patient_id else None
             )
             print("jaidev reached query routes",query_data)
-            return await self.rag_service.query_rag(query_data)
+            return await self.rag_service.query_rag(query_data, user_id)
             
+        except ConversationAccessError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
         except Exception as e:
             logger.error("RAG query error", error=str(e))
             raise HTTPException(
@@ -310,3 +320,166 @@ class RAGController:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to embed approved notes"
             )
+
+    async def search_entities(
+        self,
+        value: Optional[str] = None,
+        entity_type: Optional[str] = None,
+        match: str = "exact",
+        patient_id: Optional[uuid.UUID] = None,
+        min_confidence: float = 0.0,
+        limit: int = 100
+    ) -> EntitySearchResponse:
+        """
+        Search the normalized clinical entity index.
+        
+        Args:
+            value: Entity value to look up
+            entity_type: Optional entity type filter
+            match: Match mode (exact, prefix, contains)
+            patient_id: Optional patient filter
+            min_confidence: Minimum entity confidence
+            limit: Maximum number of entity rows
+        
+        Returns:
+            EntitySearchResponse: Matching entities, patients and notes
+        
+        Raises:
+            HTTPException: If search fails
+        """
+        try:
+            if not value and not entity_type:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Either value or entity_type must be provided"
+                )
+            
+            logger.info("Entity index search requested", value=value, entity_type=entity_type, match=match)
+            
+            return await self.entity_index_service.search(
+                value=value,
+                entity_type=entity_type,
+                match=match,
+                patient_id=patient_id,
+                min_confidence=min_confidence,
+                limit=limit
+            )
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Entity index search error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to search clinical entities"
+            )
+    
+    async def backfill_entity_index(self, backfill_data: EntityBackfillRequest) -> EntityBackfillResponse:
+        """
+        Backfill the clinical entity index from stored NER context data.
+        
+        Args:
+            backfill_data: Backfill options
+        
+        Returns:
+            EntityBackfillResponse: Backfill statistics
+        
+        Raises:
+            HTTPException: If backfill fails
+        """
+        try:
+            logger.info("Entity index backfill requested", only_missing=backfill_data.only_missing)
+            
+            return await self.entity_index_service.backfill(
+                only_missing=backfill_data.only_missing,
+                batch_size=backfill_data.batch_size
+            )
+            
+        except Exception as e:
+            logger.error("Entity index backfill error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to backfill clinical entity index"
+            )
+    
+    def end_conversation(self, conversation_id: str, user_id: Optional[uuid.UUID] = None) -> bool:
+        """
+        End a multi-turn RAG conversation.
+        
+        Args:
+            conversation_id: Conversation ID
+            user_id: Requesting user; only the owner can end a conversation
+        
+        Returns:
+            bool: True if the user's conversation existed
+        """
+        logger.info("RAG conversation ended", conversation_id=conversation_id)
+        return self.rag_service.end_conversation(conversation_id, user_id)
+    
+    async def find_similar_patients(
+        self,
+        patient_id: uuid.UUID,
+        top_k: int = 10,
+        notes_per_patient: int = 3
+    ) -> SimilarPatientsResponse:
+        """
+        Find patients similar to the given patient using patient-level vectors.
+        
+        Args:
+            patient_id: Reference patient ID
+            top_k: Number of similar patients
+            notes_per_patient: Contributing notes per patient
+        
+        Returns:
+            SimilarPatientsResponse: Nearest patients with contributing notes
+        
+        Raises:
+            HTTPException: If patient has no vector or search fails
+        """
+        try:
+            logger.info("Similar patients requested", patient_id=str(patient_id), top_k=top_k)
+            
+            result = await self.rag_service.patient_vectors.find_similar_patients(
+                patient_id=patient_id,
+                top_k=top_k,
+                notes_per_patient=notes_per_patient
+            )
+            if not result.success:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=result.message
+                )
+            return result
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Similar patients search error", error=str(e), patient_id=str(patient_id))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to find similar patients"
+            )
+    
+    async def rebuild_patient_vectors(self, patient_id: Optional[uuid.UUID] = None) -> PatientVectorRebuildResponse:
+        """
+        Recompute patient vectors from stored note embeddings.
+        
+        Args:
+            patient_id: Optional single patient to rebuild
+        
+        Returns:
+            PatientVectorRebuildResponse: Rebuild statistics
+        
+        Raises:
+            HTTPException: If rebuild fails
+        """
+        try:
+            logger.info("Patient vector rebuild requested", patient_id=str(patient_id) if patient_id else None)
+            return await self.rag_service.patient_vectors.rebuild(patient_id=patient_id)
+            
+        except Exception as e:
+            logger.error("Patient vector rebuild error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to rebuild patient vectors"
+            )
@@ -3,20 +3,30 @@ SOAP Note Controller
 Handles SOAP note generation, retrieval, and management business logic
 """
 import uuid
+import asyncio
 from typing import Optional, List
 import structlog
 
-from fastapi import HTTPException, status
+from fastapi import HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import Response
 
 from app.schemas.soap_schemas import (
     SOAPGenerationRequest, SOAPGenerationResponse, SOAPNoteResponse,
-    SOAPNoteUpdate, SOAPNoteRead
+    SOAPNoteUpdate, SOAPNoteRead, BulkGenerationJobRequest, BulkGenerationJobResponse,
+    BulkGenerationItemResponse, SOAPDraftStart, PipelineEstimateRequest, PipelineEstimateResponse
 )
+from app.schemas.auth_schemas import UserRead
 from app.services.soap_generation_service import SOAPGenerationService
+from app.services.bulk_generation_service import BulkGenerationService
+from app.services.soap_draft_service import SOAPDraftService, DraftAccessError
+from app.services.pipeline_estimator import PipelineEstimator
 from app.services.rag_service import RAGService
 from app.services.pdf_service import PDFService
+from app.services.prompt_budget import token_usage
+from app.services.llm_response_cache import llm_cache
 from app.data.soap_notes_repository import SOAPNotesRepository
+from app.data.uploaded_documents_repository import UploadedDocumentsRepository
 from app.database.db import async_session_maker
 
 logger = structlog.get_logger(__name__)
@@ -30,6 +40,9 @@ class SOAPController:
         self.soap_service = SOAPGenerationService()
         self.rag_service = RAGService()
         self.pdf_service = PDFService()
+        self.bulk_generation = BulkGenerationService(self.soap_service)
+        self.drafts = SOAPDraftService(self.soap_service)
+        self.estimator = PipelineEstimator(self.soap_service)
     
     async def generate_soap_note(self, generation_data: SOAPGenerationRequest) -> SOAPGenerationResponse:
         """
@@ -208,6 +221,9 @@ class SOAPController:
                     except Exception as e:
                         # Log error but don't fail the approval process
                         logger.error("❌ RAG embedding failed after approval", note_id=str(note_id), error=str(e))
+                    
+                    # Refresh standard-question answers for the patient in the background
+                    self.rag_service.precomputed_answers.schedule_for_notes([note_id])
                 
                 return SOAPNoteResponse(
                     note_id=updated_note.note_id,
@@ -304,6 +320,9 @@ class SOAPController:
                     except Exception as e:
                         # Log error but don't fail the approval process
                         logger.error("❌ Batch RAG embedding failed after approval", error=str(e))
+                    
+                    # Refresh standard-question answers for affected patients in the background
+                    self.rag_service.precomputed_answers.schedule_for_notes([note.note_id for note in approved_notes])
                 
                 # Return updated notes
                 return [
@@ -493,6 +512,311 @@ class SOAPController:
                 detail="Failed to trigger embedding for approved notes"
             )
 
+    async def create_bulk_generation_job(self, request: BulkGenerationJobRequest) -> BulkGenerationJobResponse:
+        """
+        Create a bulk SOAP generation job and start processing it.
+        
+        Args:
+            request: Bulk generation request with items and generation options
+            
+        Returns:
+            BulkGenerationJobResponse: Initial job progress
+            
+        Raises:
+            HTTPException: If the job cannot be created
+        """
+        try:
+            logger.info("Bulk SOAP generation requested", items=len(request.items), concurrency=request.concurrency)
+            return await self.bulk_generation.create_job(request)
+            
+        except Exception as e:
+            logger.error("Create bulk generation job error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to create bulk generation job"
+            )
+    
+    async def get_bulk_generation_job(self, job_id: uuid.UUID) -> BulkGenerationJobResponse:
+        """
+        Get progress of a bulk SOAP generation job.
+        
+        Args:
+            job_id: Bulk job UUID
+            
+        Returns:
+            BulkGenerationJobResponse: Job progress, throughput and ETA
+            
+        Raises:
+            HTTPException: If job not found or retrieval fails
+        """
+        try:
+            progress = await self.bulk_generation.get_progress(job_id)
+            if progress is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Bulk generation job not found"
+                )
+            return progress
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Get bulk generation job error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to retrieve bulk generation job"
+            )
+    
+    async def list_bulk_generation_items(
+        self,
+        job_id: uuid.UUID,
+        item_status: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 100
+    ) -> List[BulkGenerationItemResponse]:
+        """
+        List items of a bulk SOAP generation job.
+        
+        Args:
+            job_id: Bulk job UUID
+            item_status: Optional status filter
+            offset: Items to skip
+            limit: Maximum items to return
+            
+        Returns:
+            List[BulkGenerationItemResponse]: Item statuses in input order
+            
+        Raises:
+            HTTPException: If retrieval fails
+        """
+        try:
+            return await self.bulk_generation.list_items(job_id, item_status, offset, limit)
+            
+        except Exception as e:
+            logger.error("List bulk generation items error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to retrieve bulk generation items"
+            )
+    
+    async def cancel_bulk_generation_job(self, job_id: uuid.UUID) -> BulkGenerationJobResponse:
+        """
+        Cancel a bulk SOAP generation job.
+        
+        Args:
+            job_id: Bulk job UUID
+            
+        Returns:
+            BulkGenerationJobResponse: Job progress after cancellation
+            
+        Raises:
+            HTTPException: If job not found or cancellation fails
+        """
+        try:
+            progress = await self.bulk_generation.cancel_job(job_id)
+            if progress is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Bulk generation job not found"
+                )
+            return progress
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Cancel bulk generation job error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to cancel bulk generation job"
+            )
+    
+    async def estimate_generation(self, estimate_request: PipelineEstimateRequest) -> PipelineEstimateResponse:
+        """
+        Estimate tokens and latency of generating a SOAP note for a text or document.
+        
+        Args:
+            estimate_request: Text or document ID and pipeline options
+            
+        Returns:
+            PipelineEstimateResponse: Per-stage token and latency estimates
+            
+        Raises:
+            HTTPException: If the document is not found or estimation fails
+        """
+        try:
+            text = estimate_request.text
+            if not (text and text.strip()):
+                async with async_session_maker() as session:
+                    document = await UploadedDocumentsRepository(session).get_document_by_id(estimate_request.document_id)
+                if not document:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="Document not found"
+                    )
+                if not document.extracted_text:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Document has no extracted text"
+                    )
+                text = document.extracted_text
+            
+            return self.estimator.estimate(estimate_request, text)
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Pipeline estimate error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to estimate SOAP generation"
+            )
+    
+    async def run_draft_session(self, websocket: WebSocket, current_user: UserRead) -> None:
+        """
+        Serve an incremental SOAP drafting websocket.
+        
+        Client messages: {"type": "start", "data": SOAPDraftStart}, {"type": "chunk", "text": ...},
+        {"type": "flush"} and {"type": "finalize"}. Server messages: "draft" (the current
+        draft after each update), "final" (SOAPGenerationResponse) and "error".
+        Draft updates run in the background so chunks keep being accepted; a
+        disconnected client can reconnect and resume the same session's draft; only
+        the user who started a draft can resume it.
+        
+        Args:
+            websocket: Client websocket
+            current_user: Authenticated user
+        """
+        await websocket.accept()
+        state = None
+        update_task: Optional[asyncio.Task] = None
+        
+        async def send(event: str, data) -> None:
+            await websocket.send_json({"type": event, "data": jsonable_encoder(data)})
+        
+        async def run_update() -> None:
+            try:
+                if await self.drafts.update(state):
+                    await send("draft", state.snapshot())
+            except Exception as e:
+                logger.error("SOAP draft update delivery error", error=str(e))
+        
+        def schedule_update() -> None:
+            nonlocal update_task
+            if update_task is None or update_task.done():
+                update_task = asyncio.create_task(run_update())
+        
+        try:
+            while True:
+                message = await websocket.receive_json()
+                kind = message.get("type") if isinstance(message, dict) else None
+                
+                if kind == "start":
+                    start = SOAPDraftStart(**(message.get("data") or {}))
+                    try:
+                        state = self.drafts.open(
+                            start.session_id,
+                            professional_id=start.professional_id or current_user.id,
+                            enable_pii_masking=start.enable_pii_masking,
+                            preserve_medical_context=start.preserve_medical_context,
+                            owner_id=current_user.id
+                        )
+                    except DraftAccessError as e:
+                        logger.warning(
+                            "SOAP draft opened by another user",
+                            session_id=str(start.session_id),
+                            user_id=str(current_user.id)
+                        )
+                        await send("error", {"message": str(e)})
+                        continue
+                    await send("draft", state.snapshot())
+                elif state is None:
+                    await send("error", {"message": "Send a start message first"})
+                elif kind == "chunk":
+                    if self.drafts.append(state, str(message.get("text") or "")):
+                        schedule_update()
+                elif kind == "flush":
+                    schedule_update()
+                elif kind == "finalize":
+                    if update_task is not None:
+                        await update_task
+                    response = await self.drafts.finalize(state)
+                    await send("final", response)
+                    if response.success:
+                        await websocket.close()
+                        return
+                else:
+                    await send("error", {"message": f"Unknown message type: {kind}"})
+                    
+        except WebSocketDisconnect:
+            logger.info("SOAP draft websocket disconnected", session_id=str(state.session_id) if state else None)
+        except Exception as e:
+            logger.error("SOAP draft websocket error", error=str(e))
+            try:
+                await send("error", {"message": str(e)})
+                await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+            except Exception:
+                pass
+    
+    async def get_prejudge_stats(self) -> dict:
+        """
+        Get pre-judge rule hit counters.
+        
+        Returns:
+            dict: Decisions, per-rule hits and share of Judge LLM calls avoided
+            
+        Raises:
+            HTTPException: If stats retrieval fails
+        """
+        try:
+            return self.soap_service.prejudge.stats()
+            
+        except Exception as e:
+            logger.error("Get pre-judge stats error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to retrieve pre-judge statistics"
+            )
+
+    async def get_token_usage_stats(self) -> dict:
+        """
+        Get input/output token counters per pipeline stage.
+        
+        Returns:
+            dict: Per-stage token totals and averages with the configured budgets
+            
+        Raises:
+            HTTPException: If stats retrieval fails
+        """
+        try:
+            return token_usage.stats()
+            
+        except Exception as e:
+            logger.error("Get token usage stats error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to retrieve token usage statistics"
+            )
+
+    async def get_llm_cache_stats(self) -> dict:
+        """
+        Get LLM response cache counters.
+        
+        Returns:
+            dict: Mode, backend, hit/miss counters and stored entries
+            
+        Raises:
+            HTTPException: If stats retrieval fails
+        """
+        try:
+            return await llm_cache.stats()
+            
+        except Exception as e:
+            logger.error("Get LLM cache stats error", error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to retrieve LLM cache statistics"
+            )
+
     async def export_soap_note_pdf(self, note_id: uuid.UUID) -> Response:
         """
         Export SOAP note as PDF.
@@ -0,0 +1,98 @@
+"""Repository for the normalized clinical entity index.
+
+Provides async database access methods used by the entity index service and RAG prefiltering.
+"""
+from typing import List, Optional, Dict, Any
+from uuid import UUID
+from sqlalchemy import select, delete, func, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.clinical_entities import ClinicalEntities
+
+
+class ClinicalEntitiesRepository:
+    """Repository wrapper around ClinicalEntities model using an AsyncSession."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def replace_note_entities(self, note_id: UUID, rows: List[Dict[str, Any]]) -> int:
+        """Replace all indexed entities for a note. Caller must commit."""
+        await self.session.execute(delete(ClinicalEntities).where(ClinicalEntities.note_id == note_id))
+        if not rows:
+            return 0
+
+        stmt = insert(ClinicalEntities).values(rows).on_conflict_do_nothing(
+            constraint="uq_clinical_entities_note_type_value"
+        )
+        await self.session.execute(stmt)
+        return len(rows)
+
+    @staticmethod
+    def value_condition(value: str, match: str = "exact"):
+        """Build the normalized_value predicate for exact, prefix or substring matching."""
+        if match in ("prefix", "contains"):
+            # LIKE wildcards in the value match literally
+            escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            pattern = f"{escaped}%" if match == "prefix" else f"%{escaped}%"
+            return ClinicalEntities.normalized_value.like(pattern, escape="\\")
+        return ClinicalEntities.normalized_value == value
+
+    @classmethod
+    def note_ids_matching(cls, value: str, entity_type: Optional[str] = None, match: str = "exact",
+                          min_confidence: float = 0.0):
+        """Return a SELECT of note_ids having an entity that matches the filter (no session needed)."""
+        conditions = [cls.value_condition(value, match)]
+        if entity_type:
+            conditions.append(ClinicalEntities.entity_type == entity_type)
+        if min_confidence > 0:
+            conditions.append(ClinicalEntities.confidence >= min_confidence)
+        return select(ClinicalEntities.note_id).where(and_(*conditions))
+
+    async def search_entities(
+        self,
+        value: Optional[str] = None,
+        entity_type: Optional[str] = None,
+        match: str = "exact",
+        patient_id: Optional[UUID] = None,
+        min_confidence: float = 0.0,
+        limit: int = 100,
+    ) -> List[ClinicalEntities]:
+        """Return indexed entities matching the filters, highest confidence first."""
+        conditions = []
+        if value:
+            conditions.append(self.value_condition(value, match))
+        if entity_type:
+            conditions.append(ClinicalEntities.entity_type == entity_type)
+        if patient_id:
+            conditions.append(ClinicalEntities.patient_id == patient_id)
+        if min_confidence > 0:
+            conditions.append(ClinicalEntities.confidence >= min_confidence)
+
+        stmt = select(ClinicalEntities)
+        if conditions:
+            stmt = stmt.where(and_(*conditions))
+        stmt = stmt.order_by(ClinicalEntities.confidence.desc(), ClinicalEntities.created_at.desc()).limit(limit)
+
+        result = await self.session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def count_distinct_patients(
+        self,
+        value: Optional[str] = None,
+        entity_type: Optional[str] = None,
+        match: str = "exact",
+    ) -> int:
+        """Return how many distinct patients have a matching entity."""
+        conditions = []
+        if value:
+            conditions.append(self.value_condition(value, match))
+        if entity_type:
+            conditions.append(ClinicalEntities.entity_type == entity_type)
+
+        stmt = select(func.count(func.distinct(ClinicalEntities.patient_id)))
+        if conditions:
+            stmt = stmt.where(and_(*conditions))
+        result = await self.session.execute(stmt)
+        return result.scalar() or 0
@@ -0,0 +1,80 @@
+"""Repository for cached LLM responses.
+
+Provides async database access methods used by the LLM response cache.
+"""
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.llm_cache_entries import LLMCacheEntries
+
+
+class LLMCacheRepository:
+    """Repository wrapper around LLMCacheEntries model using an AsyncSession."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_live(self, cache_keys: List[str]) -> Dict[str, str]:
+        """Return {cache_key: response} for the unexpired entries among cache_keys."""
+        if not cache_keys:
+            return {}
+        stmt = select(LLMCacheEntries.cache_key, LLMCacheEntries.response).where(
+            LLMCacheEntries.cache_key.in_(cache_keys),
+            LLMCacheEntries.expires_at > func.now(),
+        )
+        result = await self.session.execute(stmt)
+        return {row[0]: row[1] for row in result.fetchall()}
+
+    async def mark_hit(self, cache_key: str) -> None:
+        """Record a hit on an entry. Caller must commit."""
+        await self.session.execute(
+            update(LLMCacheEntries)
+            .where(LLMCacheEntries.cache_key == cache_key)
+            .values(hit_count=LLMCacheEntries.hit_count + 1, last_hit_at=func.now())
+        )
+
+    async def upsert(self, row: Dict[str, Any]) -> None:
+        """Insert or replace an entry. Caller must commit."""
+        stmt = insert(LLMCacheEntries).values(**row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[LLMCacheEntries.cache_key],
+            set_={
+                "response": stmt.excluded.response,
+                "size_bytes": stmt.excluded.size_bytes,
+                "expires_at": stmt.excluded.expires_at,
+                "last_hit_at": func.now(),
+            },
+        )
+        await self.session.execute(stmt)
+
+    async def delete_expired(self, now: Optional[datetime] = None) -> int:
+        """Delete expired entries. Caller must commit. Returns the number deleted."""
+        cutoff = now if now is not None else func.now()
+        result = await self.session.execute(delete(LLMCacheEntries).where(LLMCacheEntries.expires_at <= cutoff))
+        return result.rowcount or 0
+
+    async def delete_over_budget(self, max_bytes: int) -> int:
+        """Delete the least recently hit entries beyond max_bytes of responses. Caller must commit."""
+        running = (
+            select(
+                LLMCacheEntries.cache_key,
+                func.sum(LLMCacheEntries.size_bytes)
+                .over(order_by=(LLMCacheEntries.last_hit_at.desc(), LLMCacheEntries.cache_key))
+                .label("running_bytes"),
+            )
+        ).subquery()
+        stmt = delete(LLMCacheEntries).where(
+            LLMCacheEntries.cache_key.in_(select(running.c.cache_key).where(running.c.running_bytes > max_bytes))
+        )
+        result = await self.session.execute(stmt)
+        return result.rowcount or 0
+
+    async def stats(self) -> Dict[str, Any]:
+        """Entry count and total response bytes."""
+        row = (await self.session.execute(
+            select(func.count(LLMCacheEntries.cache_key), func.coalesce(func.sum(LLMCacheEntries.size_bytes), 0))
+        )).first()
+        return {"entries": int(row[0]), "size_bytes": int(row[1])}
@@ -0,0 +1,99 @@
+"""Repository for patient-level vectors.
+
+Provides async database access methods used by the patient vector service.
+"""
+from typing import Dict, List, Optional, Tuple, Any
+from uuid import UUID
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.patient_vectors import PatientVectors
+from app.models.session_soap_notes import SessionSoapNotes
+from app.models.patient_visit_sessions import PatientVisitSessions
+
+
+class PatientVectorsRepository:
+    """Repository wrapper around PatientVectors model using an AsyncSession."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_for_update(self, patient_id: UUID) -> PatientVectors:
+        """Return the patient's vector row locked for update, creating an empty one if needed."""
+        await self.session.execute(
+            insert(PatientVectors).values(patient_id=patient_id).on_conflict_do_nothing(
+                index_elements=[PatientVectors.patient_id]
+            )
+        )
+        stmt = select(PatientVectors).where(PatientVectors.patient_id == patient_id).with_for_update()
+        result = await self.session.execute(stmt)
+        return result.scalar_one()
+
+    async def get_by_patient(self, patient_id: UUID) -> Optional[PatientVectors]:
+        """Return the patient's vector row or None."""
+        stmt = select(PatientVectors).where(PatientVectors.patient_id == patient_id)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def nearest(self, embedding: Any, exclude_patient_id: Optional[UUID], limit: int) -> List[Tuple[PatientVectors, float]]:
+        """Return the nearest patient vectors by cosine distance (served by the HNSW index)."""
+        distance = PatientVectors.embedding.cosine_distance(embedding)
+        stmt = select(PatientVectors, distance.label("distance")).where(PatientVectors.embedding.is_not(None))
+        if exclude_patient_id:
+            stmt = stmt.where(PatientVectors.patient_id != exclude_patient_id)
+        stmt = stmt.order_by(distance).limit(limit)
+        result = await self.session.execute(stmt)
+        return [(row[0], float(row[1])) for row in result.fetchall()]
+
+    async def embedded_notes(self, patient_ids: List[UUID]) -> List[Tuple[UUID, UUID, UUID, Any, Any]]:
+        """Return (patient_id, note_id, session_id, visit_date, embedding) for the patients' embedded notes."""
+        if not patient_ids:
+            return []
+        stmt = (
+            select(
+                PatientVisitSessions.patient_id,
+                SessionSoapNotes.note_id,
+                SessionSoapNotes.session_id,
+                PatientVisitSessions.visit_date,
+                SessionSoapNotes.embedding,
+            )
+            .join(PatientVisitSessions, SessionSoapNotes.session_id == PatientVisitSessions.session_id)
+            .where(
+                PatientVisitSessions.patient_id.in_(patient_ids),
+                SessionSoapNotes.embedding.is_not(None),
+            )
+        )
+        result = await self.session.execute(stmt)
+        return [tuple(row) for row in result.fetchall()]
+
+    async def set_folded_log_weights(self, patient_ids: List[UUID], log_weights: Dict[UUID, float]) -> None:
+        """Mark exactly the given notes of the patients as folded into their vectors, with these log weights."""
+        if not patient_ids:
+            return
+        patient_sessions = select(PatientVisitSessions.session_id).where(PatientVisitSessions.patient_id.in_(patient_ids))
+        await self.session.execute(
+            update(SessionSoapNotes)
+            .where(SessionSoapNotes.session_id.in_(patient_sessions), SessionSoapNotes.vector_log_weight.is_not(None))
+            .values(vector_log_weight=None)
+        )
+        if log_weights:
+            await self.session.execute(
+                update(SessionSoapNotes),
+                [{"note_id": note_id, "vector_log_weight": log_weight} for note_id, log_weight in log_weights.items()],
+            )
+
+    async def patients_with_embedded_notes(self, after_patient_id: Optional[UUID] = None, limit: int = 100) -> List[UUID]:
+        """Return patient IDs that have embedded notes, in ID order (keyset pagination)."""
+        stmt = (
+            select(PatientVisitSessions.patient_id)
+            .join(SessionSoapNotes, SessionSoapNotes.session_id == PatientVisitSessions.session_id)
+            .where(SessionSoapNotes.embedding.is_not(None))
+            .distinct()
+            .order_by(PatientVisitSessions.patient_id)
+            .limit(limit)
+        )
+        if after_patient_id is not None:
+            stmt = stmt.where(PatientVisitSessions.patient_id > after_patient_id)
+        result = await self.session.execute(stmt)
+        return [row[0] for row in result.fetchall()]
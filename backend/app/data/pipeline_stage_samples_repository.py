@@ -0,0 +1,50 @@
+"""Repository for persisted pipeline stage samples.
+
+Provides async database access methods used by the stage history service.
+"""
+from typing import List, Dict, Any
+from sqlalchemy import select, delete, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.pipeline_stage_samples import PipelineStageSamples
+
+
+class PipelineStageSamplesRepository:
+    """Repository wrapper around PipelineStageSamples model using an AsyncSession."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add_many(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert samples. Caller must commit."""
+        if rows:
+            await self.session.execute(insert(PipelineStageSamples), rows)
+
+    def _ranked(self):
+        return select(
+            PipelineStageSamples.id,
+            func.row_number().over(
+                partition_by=PipelineStageSamples.stage, order_by=PipelineStageSamples.id.desc()
+            ).label("rank"),
+        ).subquery()
+
+    async def recent(self, per_stage: int) -> List[PipelineStageSamples]:
+        """Latest per_stage samples of every stage, oldest first."""
+        ranked = self._ranked()
+        stmt = (
+            select(PipelineStageSamples)
+            .where(PipelineStageSamples.id.in_(select(ranked.c.id).where(ranked.c.rank <= per_stage)))
+            .order_by(PipelineStageSamples.id)
+        )
+        result = await self.session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def prune(self, per_stage: int) -> int:
+        """Delete all but the latest per_stage samples of every stage. Caller must commit."""
+        ranked = self._ranked()
+        result = await self.session.execute(
+            delete(PipelineStageSamples).where(
+                PipelineStageSamples.id.in_(select(ranked.c.id).where(ranked.c.rank > per_stage))
+            )
+        )
+        return result.rowcount or 0
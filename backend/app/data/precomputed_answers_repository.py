@@ -0,0 +1,75 @@
+"""Repository for precomputed standard-question answers.
+
+Provides async database access methods used by the precomputed answer service.
+"""
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+from uuid import UUID
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.precomputed_answers import PrecomputedAnswers
+from app.models.session_soap_notes import SessionSoapNotes
+from app.models.patient_visit_sessions import PatientVisitSessions
+
+
+class PrecomputedAnswersRepository:
+    """Repository wrapper around PrecomputedAnswers model using an AsyncSession."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_answer(self, patient_id: UUID, question_key: str) -> Optional[PrecomputedAnswers]:
+        """Return the stored answer for a patient's standard question, or None."""
+        stmt = select(PrecomputedAnswers).where(
+            PrecomputedAnswers.patient_id == patient_id,
+            PrecomputedAnswers.question_key == question_key,
+        )
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def upsert_answer(self, row: Dict[str, Any]) -> None:
+        """Insert or replace the answer for (patient_id, question_key). Caller must commit."""
+        stmt = insert(PrecomputedAnswers).values(**row)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_precomputed_answers_patient_question",
+            set_={
+                "question": stmt.excluded.question,
+                "answer": stmt.excluded.answer,
+                "sources": stmt.excluded.sources,
+                "source_note_id": stmt.excluded.source_note_id,
+                "source_note_updated_at": stmt.excluded.source_note_updated_at,
+                "generation_time": stmt.excluded.generation_time,
+                "updated_at": func.now(),
+            },
+        )
+        await self.session.execute(stmt)
+
+    async def latest_approved_note_version(self, patient_id: UUID) -> Optional[Tuple[UUID, datetime]]:
+        """Return (note_id, updated_at) of the patient's most recently changed approved note."""
+        stmt = (
+            select(SessionSoapNotes.note_id, SessionSoapNotes.updated_at)
+            .join(PatientVisitSessions, SessionSoapNotes.session_id == PatientVisitSessions.session_id)
+            .where(
+                PatientVisitSessions.patient_id == patient_id,
+                SessionSoapNotes.user_approved == True,
+            )
+            .order_by(SessionSoapNotes.updated_at.desc())
+            .limit(1)
+        )
+        row = (await self.session.execute(stmt)).first()
+        return (row[0], row[1]) if row else None
+
+    async def patient_ids_for_notes(self, note_ids: List[UUID]) -> List[UUID]:
+        """Return the distinct patients owning the given notes."""
+        if not note_ids:
+            return []
+        stmt = (
+            select(PatientVisitSessions.patient_id)
+            .join(SessionSoapNotes, SessionSoapNotes.session_id == PatientVisitSessions.session_id)
+            .where(SessionSoapNotes.note_id.in_(note_ids))
+            .distinct()
+        )
+        result = await self.session.execute(stmt)
+        return [row[0] for row in result.fetchall()]
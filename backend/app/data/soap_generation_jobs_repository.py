@@ -0,0 +1,112 @@
+"""Repository for bulk SOAP generation jobs and their items.
+
+Provides async database access methods used by the bulk generation service.
+"""
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Any
+from uuid import UUID
+from sqlalchemy import select, update, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.soap_generation_jobs import SOAPGenerationJobs
+from app.models.soap_generation_job_items import SOAPGenerationJobItems
+
+
+class SOAPGenerationJobsRepository:
+    """Repository wrapper around the bulk generation job models using an AsyncSession."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def create_job(self, job: Dict[str, Any], items: List[Dict[str, Any]]) -> UUID:
+        """Insert a job and its items, returning the job ID. Caller must commit."""
+        job_id = (await self.session.execute(
+            insert(SOAPGenerationJobs).values(**job, total_items=len(items)).returning(SOAPGenerationJobs.job_id)
+        )).scalar_one()
+        if items:
+            await self.session.execute(
+                insert(SOAPGenerationJobItems),
+                [{**item, "job_id": job_id, "position": position} for position, item in enumerate(items)],
+            )
+        return job_id
+
+    async def get_job(self, job_id: UUID) -> Optional[SOAPGenerationJobs]:
+        """Return a job by ID, or None."""
+        result = await self.session.execute(select(SOAPGenerationJobs).where(SOAPGenerationJobs.job_id == job_id))
+        return result.scalar_one_or_none()
+
+    async def set_job_status(self, job_id: UUID, status: str, **values: Any) -> None:
+        """Update a job's status (and any other columns). Caller must commit."""
+        await self.session.execute(
+            update(SOAPGenerationJobs).where(SOAPGenerationJobs.job_id == job_id).values(status=status, **values)
+        )
+
+    async def claim_next_item(self, job_id: UUID) -> Optional[SOAPGenerationJobItems]:
+        """
+        Atomically move the job's next pending item to running and return it.
+
+        Uses FOR UPDATE SKIP LOCKED so concurrent workers never claim the same item.
+        Caller must commit.
+        """
+        next_item = (
+            select(SOAPGenerationJobItems.item_id)
+            .where(SOAPGenerationJobItems.job_id == job_id, SOAPGenerationJobItems.status == "pending")
+            .order_by(SOAPGenerationJobItems.position)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(SOAPGenerationJobItems)
+            .where(SOAPGenerationJobItems.item_id == next_item)
+            .values(
+                status="running",
+                attempts=SOAPGenerationJobItems.attempts + 1,
+                started_at=datetime.now(timezone.utc),
+            )
+            .returning(SOAPGenerationJobItems)
+        )
+        return (await self.session.execute(stmt)).scalar_one_or_none()
+
+    async def update_item(self, item_id: UUID, **values: Any) -> None:
+        """Update columns of one item. Caller must commit."""
+        await self.session.execute(
+            update(SOAPGenerationJobItems).where(SOAPGenerationJobItems.item_id == item_id).values(**values)
+        )
+
+    async def item_status_counts(self, job_id: UUID) -> Dict[str, int]:
+        """Return {status: count} over the job's items."""
+        stmt = (
+            select(SOAPGenerationJobItems.status, func.count())
+            .where(SOAPGenerationJobItems.job_id == job_id)
+            .group_by(SOAPGenerationJobItems.status)
+        )
+        return {status: count for status, count in (await self.session.execute(stmt)).all()}
+
+    async def list_items(
+        self, job_id: UUID, status: Optional[str] = None, offset: int = 0, limit: int = 100
+    ) -> List[SOAPGenerationJobItems]:
+        """List a job's items in input order, optionally filtered by status."""
+        stmt = select(SOAPGenerationJobItems).where(SOAPGenerationJobItems.job_id == job_id)
+        if status:
+            stmt = stmt.where(SOAPGenerationJobItems.status == status)
+        stmt = stmt.order_by(SOAPGenerationJobItems.position).offset(offset).limit(limit)
+        return list((await self.session.execute(stmt)).scalars().all())
+
+    async def resumable_job_ids(self) -> List[UUID]:
+        """Return jobs that were pending or running when the process stopped."""
+        stmt = (
+            select(SOAPGenerationJobs.job_id)
+            .where(SOAPGenerationJobs.status.in_(["pending", "running"]))
+            .order_by(SOAPGenerationJobs.created_at)
+        )
+        return [row[0] for row in (await self.session.execute(stmt)).all()]
+
+    async def requeue_running_items(self, job_id: UUID) -> int:
+        """Return items left running by a stopped process to pending. Caller must commit."""
+        result = await self.session.execute(
+            update(SOAPGenerationJobItems)
+            .where(SOAPGenerationJobItems.job_id == job_id, SOAPGenerationJobItems.status == "running")
+            .values(status="pending")
+        )
+        return result.rowcount or 0
@@ -85,6 +85,12 @@ async def init_database():
             patient_visit_sessions,
             uploaded_documents,
             session_soap_notes,
+            clinical_entities,
+            precomputed_answers,
+            patient_vectors,
+            soap_generation_jobs,
+            soap_generation_job_items,
+            llm_cache_entries,
             audit_log
         )
         
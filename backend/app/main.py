@@ -38,6 +38,22 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Application lifespan manager for startup and shutdown events."""
     # Startup
     logger.info("🚀 Starting MediNote AI Backend...")
+    
+    # Resume bulk SOAP generation jobs interrupted by the last shutdown
+    if os.getenv("SOAP_BULK_RESUME_ON_STARTUP", "true").lower() == "true":
+        try:
+            from app.routes.soap_routes import soap_controller
+            await soap_controller.bulk_generation.resume_incomplete_jobs()
+        except Exception as e:
+            logger.error("❌ Failed to resume bulk generation jobs", error=str(e))
+
+    # Seed the pipeline estimator with the stage timings of earlier runs
+    try:
+        from app.services.stage_history_service import stage_history
+        await stage_history.load()
+        stage_history.start()
+    except Exception as e:
+        logger.error("❌ Failed to load pipeline stage history", error=str(e))
 
     logger.info("✅ MediNote AI Backend started successfully")
     
@@ -45,7 +61,20 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     
     # Shutdown
     logger.info("🛑 Shutting down MediNote AI Backend...")
-    
+
+    try:
+        from app.services.stage_history_service import stage_history
+        await stage_history.stop()
+    except Exception as e:
+        logger.error("❌ Failed to persist pipeline stage history", error=str(e))
+
+    # Close the shared AI provider connection pools
+    try:
+        from app.services.ai_provider_utils import provider_clients
+        await provider_clients.aclose()
+    except Exception as e:
+        logger.error("❌ Failed to close AI provider clients", error=str(e))
+
     logger.info("✅ MediNote AI Backend shutdown complete")
 
 
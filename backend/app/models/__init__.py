@@ -9,6 +9,13 @@ from app.models.patients import Patients
 from app.models.patient_visit_sessions import PatientVisitSessions
 from app.models.uploaded_documents import UploadedDocuments
 from app.models.session_soap_notes import SessionSoapNotes
+from app.models.clinical_entities import ClinicalEntities
+from app.models.precomputed_answers import PrecomputedAnswers
+from app.models.patient_vectors import PatientVectors
+from app.models.soap_generation_jobs import SOAPGenerationJobs
+from app.models.soap_generation_job_items import SOAPGenerationJobItems
+from app.models.llm_cache_entries import LLMCacheEntries
+from app.models.pipeline_stage_samples import PipelineStageSamples
 
 __all__ = [
     "professional",
@@ -16,10 +23,24 @@ __all__ = [
     "patient_visit_sessions",
     "uploaded_documents",
     "session_soap_notes",
+    "clinical_entities",
+    "precomputed_answers",
+    "patient_vectors",
+    "soap_generation_jobs",
+    "soap_generation_job_items",
+    "llm_cache_entries",
+    "pipeline_stage_samples",
     "Professional",
     "ProfessionalRole",
     "Patients",
     "PatientVisitSessions",
     "UploadedDocuments",
     "SessionSoapNotes",
+    "ClinicalEntities",
+    "PrecomputedAnswers",
+    "PatientVectors",
+    "SOAPGenerationJobs",
+    "SOAPGenerationJobItems",
+    "LLMCacheEntries",
+    "PipelineStageSamples",
 ]
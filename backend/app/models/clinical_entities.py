@@ -0,0 +1,74 @@
+"""Clinical entities index model."""
+from sqlalchemy import (
+    Column,
+    String,
+    Text,
+    Float,
+    DateTime,
+    ForeignKey,
+    func,
+    Index,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
+
+from app.database.db import Base
+
+
+class ClinicalEntities(Base):
+    """Normalized NER entities extracted from SOAP note context data.
+
+    One row per (note, entity type, normalized value). Rows are derived from
+    `session_soap_notes.context_data` and are rebuilt whenever a note is saved,
+    so the table can always be regenerated by the backfill job.
+    """
+
+    __tablename__ = "clinical_entities"
+
+    entity_id = Column(
+        PostgresUUID(as_uuid=True),
+        primary_key=True,
+        server_default=func.gen_random_uuid(),
+    )
+    note_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("session_soap_notes.note_id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    patient_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("patients.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    entity_type = Column(String(50), nullable=False)
+    value = Column(Text, nullable=False)
+    normalized_value = Column(String(255), nullable=False)
+    confidence = Column(Float, nullable=False, server_default="1.0")
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        UniqueConstraint(
+            "note_id", "entity_type", "normalized_value",
+            name="uq_clinical_entities_note_type_value",
+        ),
+        Index("ix_clinical_entities_type_value", "entity_type", "normalized_value"),
+        Index("ix_clinical_entities_value", "normalized_value"),
+        Index("ix_clinical_entities_patient_type", "patient_id", "entity_type"),
+        Index("ix_clinical_entities_note", "note_id"),
+        Index(
+            "ix_clinical_entities_value_trgm",
+            "normalized_value",
+            postgresql_using="gin",
+            postgresql_ops={"normalized_value": "gin_trgm_ops"},
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<ClinicalEntities(note_id={self.note_id}, type={self.entity_type}, "
+            f"value={self.normalized_value})>"
+        )
@@ -0,0 +1,51 @@
+"""LLM response cache entry model."""
+from sqlalchemy import (
+    Column,
+    String,
+    Text,
+    Integer,
+    DateTime,
+    func,
+    Index,
+)
+
+from app.database.db import Base
+
+
+class LLMCacheEntries(Base):
+    """A cached chat model response, keyed by a hash of everything that determines it.
+
+    `cache_key` covers provider, model, temperature, operation, prompt-template
+    version, output schema and the full prompt, so an entry can only be served
+    for an identical request. Entries expire at `expires_at`; the least recently
+    hit entries are evicted once the table exceeds its size budget.
+    """
+
+    __tablename__ = "llm_cache_entries"
+
+    cache_key = Column(String(64), primary_key=True)
+    provider = Column(String(20), nullable=False)
+    model = Column(String(100), nullable=False)
+    operation = Column(String(50), nullable=False)
+    response = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    hit_count = Column(Integer, nullable=False, server_default="0")
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+    last_hit_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_llm_cache_entries_expires_at", "expires_at"),
+        Index("ix_llm_cache_entries_last_hit_at", "last_hit_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<LLMCacheEntries(cache_key={self.cache_key}, provider={self.provider}, operation={self.operation})>"
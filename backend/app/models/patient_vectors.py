@@ -0,0 +1,55 @@
+"""Patient-level vector model."""
+from sqlalchemy import (
+    Column,
+    Integer,
+    Float,
+    DateTime,
+    ForeignKey,
+    func,
+    Index,
+)
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
+from pgvector.sqlalchemy import Vector
+
+from app.database.db import Base
+
+
+class PatientVectors(Base):
+    """Recency-weighted centroid of a patient's note embeddings.
+
+    `embedding` is the weighted mean of the patient's note embeddings, where a
+    note's weight grows exponentially with its visit date. `log_total_weight` is
+    the log of the sum of those weights, which lets a note be added or removed in
+    O(1) without reading the patient's other notes. The notes folded into the
+    mean are marked by `SessionSoapNotes.vector_log_weight`, so only those are
+    ever subtracted, with the weight they were added with.
+    """
+
+    __tablename__ = "patient_vectors"
+
+    patient_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("patients.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    embedding = Column(Vector(768), nullable=True)
+    log_total_weight = Column(Float, nullable=False, server_default="0")
+    note_count = Column(Integer, nullable=False, server_default="0")
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_patient_vectors_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return f"<PatientVectors(patient_id={self.patient_id}, note_count={self.note_count})>"
@@ -0,0 +1,43 @@
+"""Pipeline stage sample model."""
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    String,
+    Integer,
+    Float,
+    Boolean,
+    DateTime,
+    func,
+    Index,
+)
+
+from app.database.db import Base
+
+
+class PipelineStageSamples(Base):
+    """Tokens and latency of one call of a SOAP pipeline stage (ner, soap, judge, ...).
+
+    Only the latest PIPELINE_STAGE_HISTORY_WINDOW samples of each stage are kept;
+    they seed the pipeline estimator after a restart.
+    """
+
+    __tablename__ = "pipeline_stage_samples"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    stage = Column(String(50), nullable=False)
+    input_tokens = Column(Integer, nullable=False, server_default="0")
+    output_tokens = Column(Integer, nullable=False, server_default="0")
+    latency_seconds = Column(Float, nullable=True)
+    estimated = Column(Boolean, nullable=False, server_default="false")
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        Index("ix_pipeline_stage_samples_stage_id", "stage", "id"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<PipelineStageSamples(id={self.id}, stage={self.stage}, latency_seconds={self.latency_seconds})>"
@@ -0,0 +1,71 @@
+"""Precomputed standard-question answers model."""
+from sqlalchemy import (
+    Column,
+    String,
+    Text,
+    Float,
+    DateTime,
+    ForeignKey,
+    func,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID, JSONB
+
+from app.database.db import Base
+
+
+class PrecomputedAnswers(Base):
+    """RAG answers to standard questions, generated when a patient's note is approved.
+
+    Each row records the approved note version (note id + updated_at) it was
+    derived from; an answer is only served while that note is still the
+    patient's latest approved note.
+    """
+
+    __tablename__ = "precomputed_answers"
+
+    answer_id = Column(
+        PostgresUUID(as_uuid=True),
+        primary_key=True,
+        server_default=func.gen_random_uuid(),
+    )
+    patient_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("patients.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    question_key = Column(String(100), nullable=False)
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    sources = Column(JSONB, nullable=True)
+    source_note_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("session_soap_notes.note_id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    source_note_updated_at = Column(DateTime(timezone=True), nullable=True)
+    generation_time = Column(Float, nullable=False, server_default="0")
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        UniqueConstraint(
+            "patient_id", "question_key",
+            name="uq_precomputed_answers_patient_question",
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<PrecomputedAnswers(patient_id={self.patient_id}, question_key={self.question_key}, "
+            f"source_note_id={self.source_note_id})>"
+        )
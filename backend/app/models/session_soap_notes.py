@@ -7,6 +7,7 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Boolean,
+    Float,
     func,
     Index,
     text,
@@ -49,6 +50,8 @@ class SessionSoapNotes(Base):
     context_data = Column(JSONB, nullable=True)
     content_fts = Column(TSVECTOR, nullable=True)
     embedding = Column(Vector(768), nullable=True)
+    # Log weight the embedding was folded into the patient vector with; NULL if not folded
+    vector_log_weight = Column(Float, nullable=True)
     created_at = Column(
         DateTime(timezone=True),
         server_default=func.now(),
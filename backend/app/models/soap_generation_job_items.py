@@ -0,0 +1,66 @@
+"""Bulk SOAP generation job item model."""
+from sqlalchemy import (
+    Column,
+    String,
+    Text,
+    Integer,
+    Float,
+    DateTime,
+    ForeignKey,
+    func,
+    Index,
+)
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
+
+from app.database.db import Base
+
+
+class SOAPGenerationJobItems(Base):
+    """One input of a bulk SOAP generation job and its outcome.
+
+    Items move pending -> running -> succeeded/failed. Items left running by a
+    crashed process are returned to pending when jobs are resumed.
+    """
+
+    __tablename__ = "soap_generation_job_items"
+
+    item_id = Column(
+        PostgresUUID(as_uuid=True),
+        primary_key=True,
+        server_default=func.gen_random_uuid(),
+    )
+    job_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("soap_generation_jobs.job_id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    position = Column(Integer, nullable=False)
+    session_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("patient_visit_sessions.session_id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    document_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("uploaded_documents.document_id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    text = Column(Text, nullable=True)
+    status = Column(String(20), nullable=False, server_default="pending")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    note_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("session_soap_notes.note_id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    error = Column(Text, nullable=True)
+    processing_time = Column(Float, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_soap_generation_job_items_job_status", "job_id", "status", "position"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<SOAPGenerationJobItems(job_id={self.job_id}, position={self.position}, status={self.status})>"
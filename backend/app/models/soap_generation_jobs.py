@@ -0,0 +1,56 @@
+"""Bulk SOAP generation job model."""
+from sqlalchemy import (
+    Column,
+    String,
+    Text,
+    Integer,
+    DateTime,
+    ForeignKey,
+    func,
+)
+from sqlalchemy.dialects.postgresql import UUID as PostgresUUID, JSONB
+
+from app.database.db import Base
+
+
+class SOAPGenerationJobs(Base):
+    """A bulk SOAP generation job over many (session, document/text) items.
+
+    `options` holds the SOAPGenerationRequest parameters applied to every item.
+    Progress is derived from the items' statuses, which are also what a resumed
+    job continues from.
+    """
+
+    __tablename__ = "soap_generation_jobs"
+
+    job_id = Column(
+        PostgresUUID(as_uuid=True),
+        primary_key=True,
+        server_default=func.gen_random_uuid(),
+    )
+    professional_id = Column(
+        PostgresUUID(as_uuid=True),
+        ForeignKey("professional.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    status = Column(String(20), nullable=False, server_default="pending")
+    concurrency = Column(Integer, nullable=False, server_default="4")
+    options = Column(JSONB, nullable=True)
+    total_items = Column(Integer, nullable=False, server_default="0")
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:
+        return f"<SOAPGenerationJobs(job_id={self.job_id}, status={self.status}, total_items={self.total_items})>"
@@ -3,10 +3,12 @@ AI SOAP Generation API Routes
 Direct AI-powered SOAP note generation without external service
 """
 import uuid
-from typing import Optional
+import json
+from typing import Optional, Dict, Any, Tuple, AsyncIterator
 import structlog
 
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas.soap_schemas import SOAPGenerationRequest, SOAPGenerationResponse
@@ -49,6 +51,59 @@ def get_pii_service() -> PIIService:
     return pii_service
 
 
+async def _prepare_generation_input(
+    request: SOAPGenerationRequest,
+    ner_svc: NERService,
+    pii_svc: PIIService
+) -> Tuple[str, bool, int, Optional[Dict[str, Any]]]:
+    """
+    Run PII masking and NER context extraction ahead of SOAP generation.
+    
+    Returns:
+        Tuple: (processed_text, pii_masked, pii_entities_found, context_data)
+    """
+    # Step 1: Apply PII masking if enabled
+    processed_text = request.text
+    pii_masked = False
+    pii_entities_found = 0
+    
+    if request.enable_pii_masking:
+        logger.info("🔒 Applying PII masking")
+        from app.schemas.pii_schemas import PIIAnonymizationRequest
+        
+        pii_request = PIIAnonymizationRequest(
+            text=request.text,
+            preserve_medical_context=request.preserve_medical_context,
+            score_threshold=0.5
+        )
+        
+        pii_response = await pii_svc.anonymize_text(pii_request)
+        
+        if pii_response.success:
+            processed_text = pii_response.anonymized_text
+            pii_masked = pii_response.has_pii
+            pii_entities_found = pii_response.entities_count
+            
+            if pii_masked:
+                logger.info("✅ PII masking completed", entities_masked=pii_entities_found)
+        else:
+            logger.warning("PII masking failed, using original text", error=pii_response.message)
+    
+    # Step 2: Extract NER context data if requested
+    context_data = None
+    if request.include_context:
+        logger.info("🔍 Extracting NER context")
+        context_data = await ner_svc.extract_context_data(processed_text)
+        logger.info("✅ NER context extracted", entity_count=context_data.get("total_entities", 0))
+    
+    return processed_text, pii_masked, pii_entities_found, context_data
+
+
+def _format_sse(event: str, data: Any) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 @router.post("/generate", response_model=SOAPGenerationResponse, summary="Generate SOAP Note")
 async def generate_soap_note(
     request: SOAPGenerationRequest,
@@ -76,39 +131,10 @@ async def generate_soap_note(
                    session_id=str(request.session_id),
                    text_length=len(request.text))
         
-        # Step 1: Apply PII masking if enabled
-        processed_text = request.text
-        pii_masked = False
-        pii_entities_found = 0
-        
-        if request.enable_pii_masking:
-            logger.info("🔒 Applying PII masking")
-            from app.schemas.pii_schemas import PIIAnonymizationRequest
-            
-            pii_request = PIIAnonymizationRequest(
-                text=request.text,
-                preserve_medical_context=request.preserve_medical_context,
-                score_threshold=0.5
-            )
-            
-            pii_response = await pii_svc.anonymize_text(pii_request)
-            
-            if pii_response.success:
-                processed_text = pii_response.anonymized_text
-                pii_masked = pii_response.has_pii
-                pii_entities_found = pii_response.entities_count
-                
-                if pii_masked:
-                    logger.info("✅ PII masking completed", entities_masked=pii_entities_found)
-            else:
-                logger.warning("PII masking failed, using original text", error=pii_response.message)
-        
-        # Step 2: Extract NER context data if requested
-        context_data = None
-        if request.include_context:
-            logger.info("🔍 Extracting NER context")
-            context_data = await ner_svc.extract_context_data(processed_text)
-            logger.info("✅ NER context extracted", entity_count=context_data.get("total_entities", 0))
+        # Steps 1-2: PII masking and NER context extraction
+        processed_text, pii_masked, pii_entities_found, context_data = await _prepare_generation_input(
+            request, ner_svc, pii_svc
+        )
         
         # Step 3: Generate SOAP note
         logger.info("🤖 Generating SOAP note")
@@ -136,6 +162,57 @@ async def generate_soap_note(
         )
 
 
+@router.post("/generate/stream", summary="Generate SOAP Note (Streaming)")
+async def generate_soap_note_stream(
+    request: SOAPGenerationRequest,
+    soap_svc: SOAPGenerationService = Depends(get_soap_service),
+    ner_svc: NERService = Depends(get_ner_service),
+    pii_svc: PIIService = Depends(get_pii_service)
+):
+    """
+    Generate SOAP note as a Server-Sent Events stream.
+    
+    Runs the same pipeline as /generate, but each SOAP section is sent as a
+    `section` event as soon as the model has finished writing it, followed by
+    a `judge` event with the verdict (`regenerating` if it is rejected and the
+    note is generated again) and a final `complete` event carrying the
+    SOAPGenerationResponse.
+    
+    Args:
+        request: SOAP generation request with clinical text and parameters
+        
+    Returns:
+        StreamingResponse: text/event-stream of generation events
+    """
+    logger.info("Streaming SOAP generation requested",
+               session_id=str(request.session_id),
+               text_length=len(request.text))
+    
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            processed_text, pii_masked, pii_entities_found, context_data = await _prepare_generation_input(
+                request, ner_svc, pii_svc
+            )
+            async for event in soap_svc.stream_soap_note(
+                request=request,
+                context_data=context_data,
+                pii_masked_text=processed_text if pii_masked else None
+            ):
+                if event["event"] == "complete":
+                    event["data"]["pii_masked"] = pii_masked
+                    event["data"]["pii_entities_found"] = pii_entities_found
+                yield _format_sse(event["event"], event["data"])
+        except Exception as e:
+            logger.error("❌ Streaming SOAP generation failed", error=str(e))
+            yield _format_sse("error", {"detail": f"SOAP generation failed: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/health", summary="AI SOAP Service Health Check")
 async def ai_soap_health_check(
     soap_svc: SOAPGenerationService = Depends(get_soap_service),
@@ -5,14 +5,15 @@ HTTP endpoints for knowledge base queries and embedding operations
 import uuid
 from typing import Optional, List, Dict
 
-from fastapi import APIRouter, Depends, Query, Path
+from fastapi import APIRouter, Depends, Query, Path, HTTPException
 
 from app.schemas.auth_schemas import UserRead
 from app.schemas.rag_schemas import (
     RAGQueryRequest, RAGQueryResponse, EmbeddingRequest, EmbeddingResponse,
     SimilaritySearchRequest, SimilaritySearchResponse, BatchEmbeddingRequest,
     BatchEmbeddingResponse, RAGEmbeddingResponse, NotesNeedingEmbeddingRequest,
-    EmbedApprovedNotesRequest
+    EmbedApprovedNotesRequest, EntitySearchResponse, EntityBackfillRequest,
+    EntityBackfillResponse, SimilarPatientsResponse, PatientVectorRebuildResponse
 )
 from app.controllers.rag_controller import RAGController
 from app.routes.auth_routes import get_current_user_dependency
@@ -48,8 +49,11 @@ async def query_knowledge_base(
         2. Vector similarity search with metadata filtering
         3. Reranking of results
         4. Answer generation with source attribution
+        
+        Follow-up questions pass the conversation_id returned by a previous query;
+        conversations can only be continued by the user who started them.
     """
-    return await rag_controller.query_knowledge_base(query_data)
+    return await rag_controller.query_knowledge_base(query_data, current_user.id)
 
 
 @router.post("/embed", response_model=EmbeddingResponse, summary="Embed SOAP Notes")
@@ -238,3 +242,148 @@ async def embed_approved_notes(
         patient_id=request.patient_id,
         force_reembed=request.force_reembed
     )
+
+
+@router.get("/entities/search", response_model=EntitySearchResponse, summary="Search Clinical Entity Index")
+async def search_entities(
+    value: Optional[str] = Query(None, description="Entity value, e.g. 'tinnitus'"),
+    entity_type: Optional[str] = Query(None, description="Entity type, e.g. 'disease'"),
+    match: str = Query("exact", pattern="^(exact|prefix|contains)$", description="Match mode"),
+    patient_id: Optional[uuid.UUID] = Query(None, description="Restrict to a patient"),
+    min_confidence: float = Query(0.0, ge=0.0, le=1.0, description="Minimum entity confidence"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of entities to return"),
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Search the normalized clinical entity index built from SOAP note NER data.
+    
+    Args:
+        value: Entity value to look up (normalized before matching)
+        entity_type: Optional entity type filter
+        match: exact, prefix or contains
+        patient_id: Optional patient filter
+        min_confidence: Minimum entity confidence
+        limit: Maximum number of entity rows
+        current_user: Current authenticated user
+        
+    Returns:
+        EntitySearchResponse: Matching entities with distinct patients and notes
+        
+    Requires:
+        Valid JWT access token in Authorization header
+        
+    Note:
+        Answers questions like "all patients with tinnitus" from the index
+        without scanning JSONB or running the RAG pipeline.
+    """
+    return await rag_controller.search_entities(
+        value=value,
+        entity_type=entity_type,
+        match=match,
+        patient_id=patient_id,
+        min_confidence=min_confidence,
+        limit=limit
+    )
+
+
+@router.post("/entities/backfill", response_model=EntityBackfillResponse, summary="Backfill Clinical Entity Index")
+async def backfill_entity_index(
+    backfill_data: EntityBackfillRequest,
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Build clinical entity index rows for existing SOAP notes.
+    
+    Args:
+        backfill_data: Backfill options
+        current_user: Current authenticated user
+        
+    Returns:
+        EntityBackfillResponse: Backfill statistics
+        
+    Requires:
+        Valid JWT access token in Authorization header
+        
+    Note:
+        Safe to re-run; notes are processed in batches with one transaction per batch.
+        New notes are indexed automatically when they are saved.
+    """
+    return await rag_controller.backfill_entity_index(backfill_data)
+
+
+@router.delete("/conversations/{conversation_id}", summary="End RAG Conversation")
+async def end_conversation(
+    conversation_id: str = Path(..., description="Conversation ID returned by /rag/query"),
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Discard the cached turns and retrieved context of a RAG conversation.
+    
+    Args:
+        conversation_id: Conversation ID
+        current_user: Current authenticated user
+        
+    Returns:
+        dict: Confirmation message
+        
+    Requires:
+        Valid JWT access token in Authorization header
+        
+    Note:
+        Conversations also expire automatically after RAG_CONVERSATION_TTL_SECONDS of inactivity.
+    """
+    if rag_controller.end_conversation(conversation_id, current_user.id):
+        return {"message": "Conversation ended successfully"}
+    raise HTTPException(status_code=404, detail="Conversation not found")
+
+
+@router.get("/patients/{patient_id}/similar", response_model=SimilarPatientsResponse, summary="Find Similar Patients")
+async def find_similar_patients(
+    patient_id: uuid.UUID = Path(..., description="Reference patient ID"),
+    top_k: int = Query(10, ge=1, le=50, description="Number of similar patients to return"),
+    notes_per_patient: int = Query(3, ge=0, le=10, description="Contributing notes to return per patient"),
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Find patients like this one using recency-weighted patient-level vectors.
+    
+    Args:
+        patient_id: Reference patient UUID
+        top_k: Number of similar patients
+        notes_per_patient: Contributing notes per patient
+        current_user: Current authenticated user
+        
+    Returns:
+        SimilarPatientsResponse: Nearest patients with the notes that contributed most
+        
+    Requires:
+        Valid JWT access token in Authorization header
+        
+    Note:
+        Patient vectors are updated incrementally whenever a note is embedded.
+    """
+    return await rag_controller.find_similar_patients(patient_id, top_k, notes_per_patient)
+
+
+@router.post("/patients/vectors/rebuild", response_model=PatientVectorRebuildResponse, summary="Rebuild Patient Vectors")
+async def rebuild_patient_vectors(
+    patient_id: Optional[uuid.UUID] = Query(None, description="Rebuild only this patient"),
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Recompute patient vectors from all stored note embeddings.
+    
+    Args:
+        patient_id: Optional patient UUID
+        current_user: Current authenticated user
+        
+    Returns:
+        PatientVectorRebuildResponse: Rebuild statistics
+        
+    Requires:
+        Valid JWT access token in Authorization header
+        
+    Note:
+        Only needed to backfill notes embedded before patient vectors existed.
+    """
+    return await rag_controller.rebuild_patient_vectors(patient_id)
@@ -5,16 +5,18 @@ HTTP endpoints for SOAP note generation, management, and approval
 import uuid
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Query, Path
+from fastapi import APIRouter, Depends, Query, Path, WebSocket, HTTPException, status
 from fastapi.responses import Response
 
 from app.schemas.auth_schemas import UserRead
 from app.schemas.soap_schemas import (
     SOAPGenerationRequest, SOAPGenerationResponse, SOAPNoteResponse,
-    SOAPNoteUpdate, SOAPBatchApprovalRequest, SOAPTriggerEmbeddingRequest
+    SOAPNoteUpdate, SOAPBatchApprovalRequest, SOAPTriggerEmbeddingRequest,
+    BulkGenerationJobRequest, BulkGenerationJobResponse, BulkGenerationItemResponse,
+    PipelineEstimateRequest, PipelineEstimateResponse
 )
 from app.controllers.soap_controller import SOAPController
-from app.routes.auth_routes import get_current_user_dependency
+from app.routes.auth_routes import get_current_user_dependency, auth_controller
 
 # Create router
 router = APIRouter()
@@ -250,6 +252,210 @@ async def trigger_embedding_for_approved_notes(
     )
 
 
+@router.post("/bulk-jobs", response_model=BulkGenerationJobResponse, summary="Create Bulk SOAP Generation Job")
+async def create_bulk_generation_job(
+    job_data: BulkGenerationJobRequest,
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Generate SOAP notes for many documents or texts in the background.
+    
+    Args:
+        job_data: Items (session ID plus document ID and/or text), concurrency and generation options
+        current_user: Current authenticated user
+        
+    Returns:
+        BulkGenerationJobResponse: Initial job progress
+        
+    Requires:
+        Valid JWT access token in Authorization header
+        
+    Note:
+        Items are processed with the job's concurrency, capped by SOAP_BULK_MAX_WORKERS
+        across all jobs and paced by SOAP_BULK_ITEMS_PER_MINUTE. Item status is stored,
+        so unfinished jobs resume after a restart. Failed items are retried up to
+        SOAP_BULK_MAX_ATTEMPTS times.
+    """
+    if job_data.professional_id is None:
+        job_data.professional_id = current_user.id
+    return await soap_controller.create_bulk_generation_job(job_data)
+
+
+@router.get("/bulk-jobs/{job_id}", response_model=BulkGenerationJobResponse, summary="Get Bulk SOAP Generation Job")
+async def get_bulk_generation_job(
+    job_id: uuid.UUID = Path(..., description="Bulk job ID"),
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Get progress, throughput and estimated time remaining of a bulk generation job.
+    
+    Args:
+        job_id: Bulk job UUID
+        current_user: Current authenticated user
+        
+    Returns:
+        BulkGenerationJobResponse: Job progress
+        
+    Requires:
+        Valid JWT access token in Authorization header
+    """
+    return await soap_controller.get_bulk_generation_job(job_id)
+
+
+@router.get("/bulk-jobs/{job_id}/items", response_model=List[BulkGenerationItemResponse], summary="List Bulk Job Items")
+async def list_bulk_generation_items(
+    job_id: uuid.UUID = Path(..., description="Bulk job ID"),
+    item_status: Optional[str] = Query(None, alias="status", pattern="^(pending|running|succeeded|failed)$", description="Filter by item status"),
+    offset: int = Query(0, ge=0, description="Items to skip"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum items to return"),
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    List the items of a bulk generation job, e.g. the failed ones and their errors.
+    
+    Args:
+        job_id: Bulk job UUID
+        item_status: Optional status filter
+        offset: Items to skip
+        limit: Maximum items to return
+        current_user: Current authenticated user
+        
+    Returns:
+        List[BulkGenerationItemResponse]: Item statuses in input order
+        
+    Requires:
+        Valid JWT access token in Authorization header
+    """
+    return await soap_controller.list_bulk_generation_items(job_id, item_status, offset, limit)
+
+
+@router.post("/bulk-jobs/{job_id}/cancel", response_model=BulkGenerationJobResponse, summary="Cancel Bulk SOAP Generation Job")
+async def cancel_bulk_generation_job(
+    job_id: uuid.UUID = Path(..., description="Bulk job ID"),
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Stop a bulk generation job from starting further items.
+    
+    Args:
+        job_id: Bulk job UUID
+        current_user: Current authenticated user
+        
+    Returns:
+        BulkGenerationJobResponse: Job progress after cancellation
+        
+    Requires:
+        Valid JWT access token in Authorization header
+    """
+    return await soap_controller.cancel_bulk_generation_job(job_id)
+
+
+@router.post("/estimate", response_model=PipelineEstimateResponse, summary="Estimate SOAP Generation Cost")
+async def estimate_soap_generation(
+    estimate_request: PipelineEstimateRequest,
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Estimate tokens per stage, latency and the pipeline mode for a text or document
+    without calling any model.
+    
+    Args:
+        estimate_request: Text or document ID and pipeline options
+        current_user: Current authenticated user
+        
+    Returns:
+        PipelineEstimateResponse: Per-stage token and latency estimates
+        
+    Requires:
+        Valid JWT access token in Authorization header
+    """
+    return await soap_controller.estimate_generation(estimate_request)
+
+
+@router.websocket("/draft/ws")
+async def soap_draft_websocket(
+    websocket: WebSocket,
+    token: str = Query(..., description="JWT access token")
+):
+    """
+    Build a SOAP note incrementally from transcript chunks sent during a visit.
+    
+    Send {"type": "start", "data": {"session_id": ...}}, then {"type": "chunk", "text": ...}
+    as the transcript arrives and {"type": "finalize"} at the end of the visit. The
+    server pushes {"type": "draft"} updates and a {"type": "final"} SOAPGenerationResponse.
+    
+    Args:
+        websocket: Client websocket
+        token: JWT access token (browsers cannot set headers on websockets)
+        
+    Requires:
+        Valid JWT access token in the token query parameter
+    """
+    try:
+        current_user = await auth_controller.get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await soap_controller.run_draft_session(websocket, current_user)
+
+
+@router.get("/prejudge/stats", summary="Get Pre-Judge Statistics")
+async def get_prejudge_stats(
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Get hit counters for the rule-based pre-judge that screens notes before the Judge LLM.
+    
+    Args:
+        current_user: Current authenticated user
+        
+    Returns:
+        dict: Decisions, per-rule hits and share of Judge LLM calls avoided
+        
+    Requires:
+        Valid JWT access token in Authorization header
+    """
+    return await soap_controller.get_prejudge_stats()
+
+
+@router.get("/token-usage", summary="Get Token Usage Statistics")
+async def get_token_usage_stats(
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Get input/output token counts recorded per pipeline stage (ner, soap, judge, ...).
+    
+    Args:
+        current_user: Current authenticated user
+        
+    Returns:
+        dict: Per-stage token totals and averages with the configured budgets
+        
+    Requires:
+        Valid JWT access token in Authorization header
+    """
+    return await soap_controller.get_token_usage_stats()
+
+
+@router.get("/llm-cache/stats", summary="Get LLM Response Cache Statistics")
+async def get_llm_cache_stats(
+    current_user: UserRead = Depends(get_current_user_dependency)
+):
+    """
+    Get hit/miss counters and size of the cache of LLM responses for repeated prompts.
+    
+    Args:
+        current_user: Current authenticated user
+        
+    Returns:
+        dict: Mode, backend, hit/miss counters and stored entries
+        
+    Requires:
+        Valid JWT access token in Authorization header
+    """
+    return await soap_controller.get_llm_cache_stats()
+
+
 @router.get("/notes/{note_id}/export-pdf", summary="Export SOAP Note as PDF")
 async def export_soap_note_pdf(
     note_id: uuid.UUID = Path(..., description="SOAP note ID"),
@@ -14,6 +14,11 @@ class Entity(BaseModel):
     end_pos: int = Field(default=0, description="End position in original text")
 
 
+class NERLLMOutput(BaseModel):
+    """Internal schema for entities as returned by the NER LLM."""
+    entities: List[Entity] = Field(default_factory=list, description="List of extracted biomedical entities")
+
+
 class NEROutput(BaseModel):
     """Output format for NER model results."""
     entities: List[Entity] = Field(default_factory=list, description="List of extracted biomedical entities")
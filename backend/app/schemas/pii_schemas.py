@@ -25,6 +25,17 @@ class PIIEntity(BaseModel):
     text: str = Field(..., description="Original text of the entity")
 
 
+class PIIAnalysisOutput(BaseModel):
+    """Internal schema for PII entities as returned by the LLM."""
+    entities: List[PIIEntity] = Field(default_factory=list, description="Detected PII entities")
+
+
+class PIIAnonymizationOutput(BaseModel):
+    """Internal schema for LLM anonymization results."""
+    anonymized_text: str = Field(..., description="Text with PII replaced by placeholders")
+    entities: List[PIIEntity] = Field(default_factory=list, description="PII entities that were replaced")
+
+
 class PIIAnalysisRequest(BaseModel):
     """Internal request schema for PII analysis."""
     text: str = Field(..., description="Text to analyze for PII", min_length=1)
@@ -1,7 +1,7 @@
 """
 RAG (Retrieval-Augmented Generation) schemas for querying patient data
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime
 import uuid
 from pydantic import BaseModel, Field, validator
@@ -22,6 +22,14 @@ class RAGChunk(BaseModel):
     visit_date: Optional[datetime] = Field(default=None, description="Source visit date")
 
 
+class EntityFilter(BaseModel):
+    """Filter on the normalized clinical entity index."""
+    value: str = Field(..., description="Entity value to match (normalized before lookup)", min_length=1)
+    entity_type: Optional[str] = Field(default=None, description="Restrict to an entity type (disease, symptom, ...)")
+    match: Literal["exact", "prefix", "contains"] = Field(default="exact", description="Match mode: exact, prefix or contains")
+    min_confidence: float = Field(default=0.0, description="Minimum entity confidence", ge=0.0, le=1.0)
+
+
 class RAGQueryRequest(BaseModel):
     """Request schema for RAG querying."""
     query: str = Field(..., description="Natural language query", min_length=1)
@@ -38,10 +46,26 @@ class RAGQueryRequest(BaseModel):
     rerank_top_n: Optional[int] = Field(default=3, description="Number of chunks to rerank", ge=1, le=10)
     similarity_threshold: Optional[float] = Field(default=0.7, description="Minimum similarity threshold", ge=0.0, le=1.0)
     
+    # Entity index prefilter (all filters must match)
+    entity_filters: List[EntityFilter] = Field(default_factory=list, description="Clinical entity filters applied before vector search")
+    
+    # Multi-turn conversation (follow-ups reuse previously retrieved context)
+    conversation_id: Optional[str] = Field(default=None, description="Conversation ID returned by a previous query", max_length=64)
+    
+    # Standard questions answered at note-approval time
+    use_precomputed: bool = Field(default=True, description="Serve a fresh precomputed answer when the query is a standard question")
+    
     # Response parameters
     include_sources: bool = Field(default=True, description="Whether to include source attribution")
     max_response_length: int = Field(default=1000, description="Maximum response length", ge=100, le=5000)
     
+    @validator('conversation_id', pre=True)
+    def convert_empty_conversation_to_none(cls, v):
+        """Treat empty conversation IDs as a new conversation."""
+        if v == "" or v == "null" or v == "undefined":
+            return None
+        return v
+    
     @validator('professional_id', 'patient_id', 'session_id', pre=True)
     def convert_empty_strings_to_none(cls, v):
         """Convert empty strings to None for UUID fields."""
@@ -68,6 +92,12 @@ class RAGQueryResponse(BaseModel):
     rerank_time: float = Field(default=0.0, description="Reranking time")
     generation_time: float = Field(default=0.0, description="Answer generation time")
     
+    # Conversation state
+    conversation_id: Optional[str] = Field(default=None, description="Conversation ID to send with follow-up questions")
+    turn_number: int = Field(default=1, description="Turn number within the conversation")
+    reused_chunks: int = Field(default=0, description="Chunks reused from earlier turns instead of re-retrieved")
+    precomputed: bool = Field(default=False, description="Whether the answer was served from precomputed answers")
+    
     # Error information
     message: str = Field(default="", description="Status or error message")
     warnings: List[str] = Field(default_factory=list, description="Any warnings during processing")
@@ -209,3 +239,78 @@ class EmbedApprovedNotesRequest(BaseModel):
     session_id: Optional[uuid.UUID] = Field(None, description="Optional session ID to embed all notes from session")
     patient_id: Optional[uuid.UUID] = Field(None, description="Optional patient ID to embed all notes from patient")
     force_reembed: bool = Field(False, description="Force re-embedding even if exists")
+
+
+class IndexedEntity(BaseModel):
+    """Entity row from the normalized clinical entity index."""
+    note_id: uuid.UUID = Field(..., description="SOAP note the entity was extracted from")
+    patient_id: uuid.UUID = Field(..., description="Patient the note belongs to")
+    entity_type: str = Field(..., description="Entity type")
+    value: str = Field(..., description="Entity value as extracted")
+    normalized_value: str = Field(..., description="Normalized entity value used for lookups")
+    confidence: float = Field(default=1.0, description="Extraction confidence", ge=0.0, le=1.0)
+
+
+class EntitySearchResponse(BaseModel):
+    """Response schema for clinical entity index search."""
+    success: bool = Field(..., description="Whether search was successful")
+    query: str = Field(default="", description="Normalized value searched for")
+    entity_type: Optional[str] = Field(default=None, description="Entity type filter used")
+    entities: List[IndexedEntity] = Field(default_factory=list, description="Matching indexed entities")
+    patient_ids: List[uuid.UUID] = Field(default_factory=list, description="Distinct patients among the matches")
+    note_ids: List[uuid.UUID] = Field(default_factory=list, description="Distinct notes among the matches")
+    total_patients: int = Field(default=0, description="Total distinct patients with a matching entity")
+    processing_time: float = Field(default=0.0, description="Processing time")
+    message: str = Field(default="", description="Status message")
+
+
+class EntityBackfillRequest(BaseModel):
+    """Request schema for backfilling the clinical entity index."""
+    only_missing: bool = Field(default=True, description="Only index notes that have no indexed entities yet")
+    batch_size: int = Field(default=500, description="Notes processed per transaction", ge=1, le=5000)
+
+
+class EntityBackfillResponse(BaseModel):
+    """Response schema for clinical entity index backfill."""
+    success: bool = Field(..., description="Whether backfill was successful")
+    notes_scanned: int = Field(default=0, description="Notes with context data scanned")
+    notes_indexed: int = Field(default=0, description="Notes whose entities were (re)indexed")
+    entities_indexed: int = Field(default=0, description="Entity rows written")
+    processing_time: float = Field(default=0.0, description="Processing time")
+    message: str = Field(default="", description="Status message")
+
+
+class SimilarPatientNote(BaseModel):
+    """Note that contributed to a patient-similarity match."""
+    note_id: uuid.UUID = Field(..., description="SOAP note ID")
+    session_id: uuid.UUID = Field(..., description="Visit session ID")
+    visit_date: Optional[datetime] = Field(default=None, description="Visit date")
+    similarity: float = Field(..., description="Cosine similarity of the note to the reference patient vector")
+    contribution: float = Field(..., description="Recency-weighted share of the patient-level similarity")
+
+
+class SimilarPatient(BaseModel):
+    """Patient found by patient-level vector search."""
+    patient_id: uuid.UUID = Field(..., description="Patient ID")
+    patient_name: Optional[str] = Field(default=None, description="Patient name")
+    similarity: float = Field(..., description="Cosine similarity of patient vectors")
+    note_count: int = Field(default=0, description="Embedded notes in the patient vector")
+    contributing_notes: List[SimilarPatientNote] = Field(default_factory=list, description="Notes that contributed most")
+
+
+class SimilarPatientsResponse(BaseModel):
+    """Response schema for patient similarity search."""
+    success: bool = Field(..., description="Whether search was successful")
+    patient_id: uuid.UUID = Field(..., description="Reference patient ID")
+    similar_patients: List[SimilarPatient] = Field(default_factory=list, description="Nearest patients")
+    processing_time: float = Field(default=0.0, description="Processing time")
+    message: str = Field(default="", description="Status message")
+
+
+class PatientVectorRebuildResponse(BaseModel):
+    """Response schema for rebuilding patient vectors."""
+    success: bool = Field(..., description="Whether rebuild was successful")
+    patients_rebuilt: int = Field(default=0, description="Patient vectors rebuilt")
+    notes_included: int = Field(default=0, description="Embedded notes included")
+    processing_time: float = Field(default=0.0, description="Processing time")
+    message: str = Field(default="", description="Status message")
@@ -1,12 +1,12 @@
 """
 SOAP Note schemas for medical documentation
 """
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Literal
 from datetime import datetime
 import uuid
 from pydantic import BaseModel, Field, validator
 
-from app.schemas.ner_schemas import NEROutput
+from app.schemas.ner_schemas import NEROutput, Entity
 
 
 class SOAPSection(BaseModel):
@@ -29,6 +29,36 @@ class SOAPNote(BaseModel):
     total_confidence: float = Field(default=1.0, description="Overall confidence score", ge=0.0, le=1.0)
 
 
+class SOAPNoteOutput(BaseModel):
+    """Internal schema for the SOAP note as returned by the generation LLM."""
+    subjective: SOAPSection = Field(..., description="Subjective section - patient's symptoms and concerns")
+    objective: SOAPSection = Field(..., description="Objective section - clinical findings and test results")
+    assessment: SOAPSection = Field(..., description="Assessment section - clinical interpretation")
+    plan: SOAPSection = Field(..., description="Plan section - treatment recommendations")
+
+
+class SinglePassOutput(SOAPNoteOutput):
+    """Internal schema for single-pass generation: SOAP sections plus extracted entities."""
+    entities: List[Entity] = Field(default_factory=list, description="Biomedical entities extracted from the text")
+
+
+class ChunkFactsOutput(BaseModel):
+    """Internal schema for the facts extracted from one chunk in map-reduce generation."""
+    subjective: List[str] = Field(default_factory=list, description="Patient-reported symptoms, history and concerns")
+    objective: List[str] = Field(default_factory=list, description="Clinical findings, measurements and test results")
+    assessment: List[str] = Field(default_factory=list, description="Diagnoses and clinical interpretations")
+    plan: List[str] = Field(default_factory=list, description="Treatments, referrals, devices and follow-up")
+    entities: List[Entity] = Field(default_factory=list, description="Biomedical entities extracted from the chunk")
+
+
+class SOAPSectionsRewriteOutput(BaseModel):
+    """Internal schema for rewritten SOAP sections; only the requested sections are returned."""
+    subjective: Optional[SOAPSection] = Field(default=None, description="Rewritten subjective section")
+    objective: Optional[SOAPSection] = Field(default=None, description="Rewritten objective section")
+    assessment: Optional[SOAPSection] = Field(default=None, description="Rewritten assessment section")
+    plan: Optional[SOAPSection] = Field(default=None, description="Rewritten plan section")
+
+
 class SOAPGenerationRequest(BaseModel):
     """Request schema for SOAP note generation."""
     text: str = Field(..., description="Clinical text to convert to SOAP format", min_length=1)
@@ -45,6 +75,20 @@ class SOAPGenerationRequest(BaseModel):
     enable_pii_masking: bool = Field(default=True, description="Whether to anonymize PII before SOAP generation")
     preserve_medical_context: bool = Field(default=True, description="Whether to preserve medical terminology during PII masking")
     
+    # Speculative generation parameters
+    speculative: bool = Field(default=False, description="Generate and judge several candidates concurrently instead of retrying sequentially")
+    speculative_candidates: int = Field(default=3, description="Number of concurrent candidates in speculative mode", ge=2, le=5)
+    
+    # Pipeline mode
+    pipeline_mode: Literal["auto", "standard", "single_pass", "map_reduce"] = Field(
+        default="auto",
+        description=(
+            "standard: separate NER and SOAP calls; single_pass: one call returns entities and SOAP sections; "
+            "map_reduce: extract facts per chunk in parallel, then generate from the facts; "
+            "auto: map_reduce for long inputs, standard otherwise"
+        )
+    )
+    
     @validator('professional_id', pre=True)
     def convert_empty_strings_to_none(cls, v):
         """Convert empty strings to None for UUID fields."""
@@ -64,6 +108,7 @@ class SOAPGenerationResponse(BaseModel):
     # Processing metadata
     processing_time: float = Field(default=0.0, description="Total processing time in seconds")
     regeneration_count: int = Field(default=0, description="Number of times note was regenerated")
+    candidates_evaluated: int = Field(default=0, description="Candidates judged before a result was returned (speculative mode)")
     validation_feedback: str = Field(default="", description="Feedback from AI judge")
     message: str = Field(default="", description="Status or error message")
     
@@ -152,9 +197,153 @@ class SOAPListResponse(BaseModel):
     page_size: int = Field(default=20, description="Number of items per page")
 
 
+class SOAPSectionVerdict(BaseModel):
+    """Internal schema for the Judge LLM verdict on one SOAP section."""
+    approved: bool = Field(..., description="Whether the section is approved")
+    reason: str = Field(default="", description="Reason for approval/rejection")
+    suggestions: List[str] = Field(default_factory=list, description="Improvement suggestions for this section")
+
+
 class JudgeLLMResponse(BaseModel):
     """Internal schema for Judge LLM validation response."""
     approved: bool = Field(..., description="Whether the SOAP note is approved")
     reason: str = Field(..., description="Reason for approval/rejection")
     confidence: float = Field(default=1.0, description="Judge confidence", ge=0.0, le=1.0)
     suggestions: List[str] = Field(default_factory=list, description="Improvement suggestions")
+    sections: Dict[str, SOAPSectionVerdict] = Field(default_factory=dict, description="Per-section verdicts, keyed by section name")
+    
+    def failing_sections(self) -> List[str]:
+        """Return the rejected sections in SOAP order."""
+        return [
+            name for name in ("subjective", "objective", "assessment", "plan")
+            if name in self.sections and not self.sections[name].approved
+        ]
+
+
+class BatchJudgeVerdict(JudgeLLMResponse):
+    """Internal schema for one verdict of a batched Judge LLM call."""
+    id: int = Field(..., description="1-based number of the judged note")
+
+
+class BatchJudgeOutput(BaseModel):
+    """Internal schema for a batched Judge LLM response."""
+    verdicts: List[BatchJudgeVerdict] = Field(default_factory=list, description="One verdict per note")
+
+
+class SOAPDraftStart(BaseModel):
+    """Start message of an incremental SOAP drafting websocket."""
+    session_id: uuid.UUID = Field(..., description="Patient visit session ID")
+    professional_id: Optional[uuid.UUID] = Field(default=None, description="ID of healthcare professional")
+    enable_pii_masking: bool = Field(default=True, description="Whether to anonymize PII before drafting")
+    preserve_medical_context: bool = Field(default=True, description="Whether to preserve medical terminology during PII masking")
+    
+    @validator('professional_id', pre=True)
+    def convert_empty_strings_to_none(cls, v):
+        """Convert empty strings to None for UUID fields."""
+        if v == "" or v == "null" or v == "undefined":
+            return None
+        return v
+
+
+class PipelineEstimateRequest(BaseModel):
+    """Request schema for estimating the cost and latency of SOAP generation."""
+    text: Optional[str] = Field(default=None, description="Clinical text to estimate for")
+    document_id: Optional[uuid.UUID] = Field(default=None, description="Document whose extracted text is estimated (when no text is given)")
+    pipeline_mode: Literal["auto", "standard", "single_pass", "map_reduce"] = Field(default="auto", description="SOAP generation pipeline mode")
+    include_context: bool = Field(default=True, description="Whether NER context data would be included")
+    enable_pii_masking: bool = Field(default=True, description="Whether PII masking would be applied")
+    
+    @validator('text', always=True)
+    def require_document_or_text(cls, v, values):
+        """An estimate needs a document to read or text to measure."""
+        if not (v and v.strip()) and values.get('document_id') is None:
+            raise ValueError("Either document_id or text is required")
+        return v
+
+
+class StageEstimate(BaseModel):
+    """Estimated cost and latency of one pipeline stage."""
+    stage: str = Field(..., description="Pipeline stage (pii, ner, map, single_pass, soap, judge, embedding)")
+    calls: float = Field(..., description="Expected calls (fractional when the pre-judge skips some judge calls)")
+    input_tokens: int = Field(default=0, description="Expected input tokens across calls")
+    output_tokens: int = Field(default=0, description="Expected output tokens across calls")
+    latency_seconds: float = Field(default=0.0, description="Expected wall-clock time of the stage")
+    source: Literal["history", "default"] = Field(..., description="Whether recorded stage timings or built-in defaults were used")
+
+
+class PipelineEstimateResponse(BaseModel):
+    """Estimated cost and latency of generating a SOAP note."""
+    pipeline_mode: str = Field(..., description="Pipeline mode that would be chosen")
+    input_tokens: int = Field(..., description="Tokens in the clinical text")
+    chunk_count: int = Field(default=1, description="Chunks processed in parallel (map-reduce mode)")
+    stages: List[StageEstimate] = Field(default_factory=list, description="Per-stage estimates for a first-attempt approval")
+    total_input_tokens: int = Field(default=0, description="Input tokens across all LLM stages")
+    total_output_tokens: int = Field(default=0, description="Output tokens across all LLM stages")
+    latency_seconds: float = Field(default=0.0, description="Expected end-to-end latency when the first note is approved")
+    latency_seconds_worst_case: float = Field(default=0.0, description="Latency if every regeneration is used, for setting timeouts")
+
+
+class BulkGenerationItem(BaseModel):
+    """One input of a bulk SOAP generation job."""
+    session_id: uuid.UUID = Field(..., description="Patient visit session ID")
+    document_id: Optional[uuid.UUID] = Field(default=None, description="Source document ID (its extracted text is used when no text is given)")
+    text: Optional[str] = Field(default=None, description="Clinical text; a document record is created when no document ID is given")
+    
+    @validator('text', always=True)
+    def require_document_or_text(cls, v, values):
+        """Each item needs a document to read or text to generate from."""
+        if not (v and v.strip()) and values.get('document_id') is None:
+            raise ValueError("Either document_id or text is required")
+        return v
+
+
+class BulkGenerationJobRequest(BaseModel):
+    """Request schema for creating a bulk SOAP generation job."""
+    items: List[BulkGenerationItem] = Field(..., description="Items to generate SOAP notes for", min_items=1, max_items=10000)
+    professional_id: Optional[uuid.UUID] = Field(default=None, description="ID of healthcare professional")
+    concurrency: int = Field(default=4, description="Items processed concurrently by this job", ge=1, le=32)
+    
+    # Generation parameters applied to every item
+    include_context: bool = Field(default=True, description="Whether to include NER context data")
+    enable_pii_masking: bool = Field(default=True, description="Whether to anonymize PII before SOAP generation")
+    preserve_medical_context: bool = Field(default=True, description="Whether to preserve medical terminology during PII masking")
+    pipeline_mode: Literal["auto", "standard", "single_pass", "map_reduce"] = Field(default="auto", description="SOAP generation pipeline mode")
+    
+    @validator('professional_id', pre=True)
+    def convert_empty_strings_to_none(cls, v):
+        """Convert empty strings to None for UUID fields."""
+        if v == "" or v == "null" or v == "undefined":
+            return None
+        return v
+
+
+class BulkGenerationItemResponse(BaseModel):
+    """Status of one bulk generation item."""
+    item_id: uuid.UUID = Field(..., description="Item ID")
+    position: int = Field(..., description="Position in the submitted item list")
+    session_id: uuid.UUID = Field(..., description="Patient visit session ID")
+    document_id: Optional[uuid.UUID] = Field(default=None, description="Source document ID")
+    status: str = Field(..., description="pending, running, succeeded or failed")
+    attempts: int = Field(default=0, description="Generation attempts made")
+    note_id: Optional[uuid.UUID] = Field(default=None, description="Generated SOAP note ID")
+    error: Optional[str] = Field(default=None, description="Last failure reason")
+    processing_time: Optional[float] = Field(default=None, description="Processing time of the last attempt in seconds")
+
+
+class BulkGenerationJobResponse(BaseModel):
+    """Progress of a bulk SOAP generation job."""
+    job_id: uuid.UUID = Field(..., description="Job ID")
+    status: str = Field(..., description="pending, running, completed, cancelled or failed")
+    concurrency: int = Field(..., description="Items processed concurrently")
+    total_items: int = Field(default=0, description="Number of items in the job")
+    pending_items: int = Field(default=0, description="Items not started yet")
+    running_items: int = Field(default=0, description="Items in progress")
+    succeeded_items: int = Field(default=0, description="Items with a saved SOAP note")
+    failed_items: int = Field(default=0, description="Items that failed all attempts")
+    progress: float = Field(default=0.0, description="Finished share of items (0-1)")
+    throughput_per_minute: float = Field(default=0.0, description="Finished items per minute since the job started")
+    eta_seconds: Optional[float] = Field(default=None, description="Estimated seconds until all items finish")
+    error: Optional[str] = Field(default=None, description="Job-level error")
+    created_at: datetime = Field(..., description="When the job was created")
+    started_at: Optional[datetime] = Field(default=None, description="When processing started")
+    finished_at: Optional[datetime] = Field(default=None, description="When processing finished")
@@ -4,12 +4,12 @@ Implements biomedical entity extraction using Google Gemini
 """
 import os
 import time
-import json
 from typing import Dict, Any, List
 import structlog
-from langchain_google_genai import ChatGoogleGenerativeAI
+from app.services.ai_provider_utils import provider_clients
 
 from app.schemas.ner_schemas import NEROutput, Entity, NERRequest
+from app.services.json_extraction import extract_json
 
 logger = structlog.get_logger(__name__)
 
@@ -33,14 +33,9 @@ class NERService:
 
             logger.info("Initializing LangChain Gemini chat model for NER", model=gemini_model)
 
-            # Initialize Gemini chat model via LangChain
-            self.model = ChatGoogleGenerativeAI(
-                model=gemini_model,
-                google_api_key=google_api_key,
-                temperature=0.1,
-                max_output_tokens=2048,
-                top_p=0.95,
-                top_k=40,
+            # Shared Gemini chat model via LangChain
+            self.model = provider_clients.chat_model(
+                "google", gemini_model, 0.1, max_output_tokens=2048, top_p=0.95, top_k=40
             )
 
             logger.info("✅ LangChain Gemini NER model initialized successfully")
@@ -128,24 +123,11 @@ Rules:
             # Extract JSON from response
             response_text = self._extract_response_text(response).strip()
             
-            # Try to extract JSON from the response
-            try:
-                # Remove markdown code blocks if present
-                if response_text.startswith("```json"):
-                    response_text = response_text.replace("```json", "").replace("```", "").strip()
-                elif response_text.startswith("```"):
-                    response_text = response_text.replace("```", "").strip()
-                
-                raw_entities = json.loads(response_text)
-            except json.JSONDecodeError:
-                logger.warning("Failed to parse JSON response, attempting extraction")
-                # Try to find JSON array in the response
-                import re
-                json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-                if json_match:
-                    raw_entities = json.loads(json_match.group(0))
-                else:
-                    raw_entities = []
+            # Extract the JSON entity array from the response
+            raw_entities = extract_json(response_text, openers="[")
+            if raw_entities is None:
+                logger.warning("Failed to find a JSON entity array in the response")
+                raw_entities = []
             
             # Process and validate entities
             entities = []
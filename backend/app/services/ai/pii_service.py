@@ -5,15 +5,15 @@ Uses Google Gemini for PII detection and anonymization
 
 import os
 import structlog
-import json
-import re
-from typing import Any, List, Optional, Tuple
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import List, Optional, Tuple
 
 from app.schemas.pii_schemas import (
     PIIAnalysisRequest, PIIAnalysisResponse, PIIEntity,
-    PIIAnonymizationRequest, PIIAnonymizationResponse
+    PIIAnonymizationRequest, PIIAnonymizationResponse,
+    PIIAnalysisOutput, PIIAnonymizationOutput
 )
+from app.services.ai_provider_utils import with_structured_output, provider_clients
+from app.services.json_extraction import extract_json
 
 logger = structlog.get_logger(__name__)
 
@@ -32,14 +32,18 @@ class PIIService:
 
             logger.info("🔍 Initializing PII service with LangChain Gemini chat model")
 
-            # Initialize Gemini chat model via LangChain
-            self.model = ChatGoogleGenerativeAI(
-                model=gemini_model,
-                google_api_key=google_api_key,
-                temperature=0.1,
-                max_output_tokens=2048,
-                top_p=0.95,
-                top_k=40,
+            # Shared Gemini chat model via LangChain
+            self.model = provider_clients.chat_model(
+                "google", gemini_model, 0.1, max_output_tokens=2048, top_p=0.95, top_k=40
+            )
+            
+            # Gemini response schema; the text parsers below only run when it is unavailable
+            self.analysis_model = with_structured_output(
+                self.model, PIIAnalysisOutput, lambda text: extract_json(text) or []
+            )
+            self.anonymization_model = with_structured_output(
+                self.model, PIIAnonymizationOutput,
+                lambda text: extract_json(text, required_keys=("anonymized_text",)) or {}
             )
             
             # Set default entities to detect
@@ -59,28 +63,9 @@ class PIIService:
             logger.error("❌ Failed to initialize LangChain PII service", error=str(e))
             raise RuntimeError(f"PII service initialization failed: {e}")
 
-    @staticmethod
-    def _extract_response_text(response: Any) -> str:
-        """Extract plain text from a LangChain chat response."""
-        try:
-            content = getattr(response, "content", response)
-            if isinstance(content, str):
-                return content
-            if isinstance(content, list):
-                parts = []
-                for item in content:
-                    if isinstance(item, dict) and item.get("type") == "text":
-                        parts.append(item.get("text", ""))
-                    else:
-                        parts.append(str(item))
-                return "".join(parts)
-            return str(content)
-        except Exception:
-            return str(response)
-    
     def _create_analysis_prompt(self, text: str, entities: List[str]) -> str:
         """Create prompt for Gemini to analyze PII."""
-        return f"""Analyze the following text for personally identifiable information (PII). Return ONLY a JSON array.
+        return f"""Analyze the following text for personally identifiable information (PII). Return ONLY a JSON object.
 
 Text to analyze:
 {text}
@@ -88,21 +73,23 @@ Text to analyze:
 Detect these PII entity types: {', '.join(entities)}
 
 Return format (JSON only, no other text):
-[
-  {{
-    "entity_type": "PERSON",
-    "start": 0,
-    "end": 10,
-    "score": 0.95,
-    "text": "extracted text"
-  }}
-]
+{{
+  "entities": [
+    {{
+      "entity_type": "PERSON",
+      "start": 0,
+      "end": 10,
+      "score": 0.95,
+      "text": "extracted text"
+    }}
+  ]
+}}
 
 Rules:
 - Use exact entity type names from the provided list
 - Include exact character positions (start, end)
 - Score between 0.0 and 1.0 (confidence)
-- Return empty array [] if no PII found
+- Return an empty entities array [] if no PII found
 """
     
     def _create_anonymization_prompt(self, text: str, entities: List[str], preserve_medical: bool) -> str:
@@ -162,26 +149,10 @@ Rules:
             # Create prompt
             prompt = self._create_analysis_prompt(request.text, entities_to_detect)
             
-            # Generate response from Gemini via LangChain
-            response = await self.model.ainvoke(prompt)
-            response_text = self._extract_response_text(response).strip()
-            
-            # Parse JSON response
-            try:
-                # Remove markdown code blocks if present
-                if response_text.startswith("```json"):
-                    response_text = response_text.replace("```json", "").replace("```", "").strip()
-                elif response_text.startswith("```"):
-                    response_text = response_text.replace("```", "").strip()
-                
-                results = json.loads(response_text)
-            except json.JSONDecodeError:
-                # Try to extract JSON array
-                json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-                if json_match:
-                    results = json.loads(json_match.group(0))
-                else:
-                    results = []
+            # Generate structured response from Gemini via LangChain
+            results = await self.analysis_model.ainvoke(prompt)
+            if isinstance(results, dict):
+                results = results.get("entities", [])
             
             # Convert results to our schema
             detected_entities = []
@@ -268,26 +239,10 @@ Rules:
                 request.preserve_medical_context
             )
             
-            # Generate response from Gemini via LangChain
-            response = await self.model.ainvoke(prompt)
-            response_text = self._extract_response_text(response).strip()
-            
-            # Parse JSON response
-            try:
-                # Remove markdown code blocks if present
-                if response_text.startswith("```json"):
-                    response_text = response_text.replace("```json", "").replace("```", "").strip()
-                elif response_text.startswith("```"):
-                    response_text = response_text.replace("```", "").strip()
-                
-                result = json.loads(response_text)
-            except json.JSONDecodeError:
-                # Try to extract JSON object
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group(0))
-                else:
-                    result = {"anonymized_text": request.text, "entities": []}
+            # Generate structured response from Gemini via LangChain
+            result = await self.anonymization_model.ainvoke(prompt)
+            if not isinstance(result, dict):
+                result = {}
             
             anonymized_text = result.get("anonymized_text", request.text)
             entity_data = result.get("entities", [])
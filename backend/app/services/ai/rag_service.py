@@ -10,7 +10,7 @@ import numpy as np
 from typing import List, Dict, Any, Optional
 import structlog
 from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from app.services.ai_provider_utils import provider_clients
 
 # Load environment variables
 load_dotenv()
@@ -41,11 +41,8 @@ class RAGService:
 
             logger.info("Initializing LangChain Gemini embedding model")
 
-            # Initialize LangChain embedding model
-            self.embedding_model = GoogleGenerativeAIEmbeddings(
-                model=gemini_embedding_model,
-                google_api_key=google_api_key,
-            )
+            # Shared LangChain embedding model; concurrent single-text requests are batched
+            self.embedding_model = provider_clients.limited_embedding_model("google", gemini_embedding_model)
 
             logger.info("✅ LangChain Gemini embedding model initialized successfully", model=gemini_embedding_model)
             
@@ -72,7 +69,7 @@ class RAGService:
                 raise RuntimeError("Embedding model not initialized")
             
             # Generate embedding using LangChain Gemini embeddings
-            embedding_vector = self.embedding_model.embed_query(request.text)
+            embedding_vector = await self.embedding_model.aembed_query(request.text)
             
             # Normalize if requested
             if request.normalize:
@@ -136,7 +133,7 @@ class RAGService:
                 
                 try:
                     # Generate embeddings for batch using LangChain Gemini
-                    batch_embeddings = self.embedding_model.embed_documents(batch)
+                    batch_embeddings = await self.embedding_model.aembed_documents(batch)
                     
                     # Normalize if requested
                     if request.normalize:
@@ -6,17 +6,19 @@ import os
 import time
 import uuid
 import json
-import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 from datetime import datetime
 import structlog
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 from app.schemas.soap_schemas import (
     SOAPNote, SOAPSection, SOAPGenerationRequest, 
-    SOAPGenerationResponse, JudgeLLMResponse
+    SOAPGenerationResponse, JudgeLLMResponse, SOAPNoteOutput
 )
+from app.services.ai_provider_utils import with_structured_output, provider_clients
+from app.services.json_extraction import extract_json
 from app.schemas.ner_schemas import NEROutput
+from app.services.soap_prejudge import soap_prejudge
+from app.services.ai.soap_stream_parser import IncrementalSOAPParser
 
 logger = structlog.get_logger(__name__)
 
@@ -28,6 +30,9 @@ class SOAPGenerationService:
         """Initialize SOAP generation service."""
         self.soap_model = None
         self.judge_model = None
+        self.structured_soap_model = None
+        self.structured_judge_model = None
+        self.prejudge = soap_prejudge
         self._initialize_models()
     
     def _initialize_models(self):
@@ -45,13 +50,8 @@ class SOAPGenerationService:
 
             # Initialize Gemini model for SOAP generation via LangChain
             try:
-                self.soap_model = ChatGoogleGenerativeAI(
-                    model=gemini_model,
-                    google_api_key=google_api_key,
-                    temperature=temperature,
-                    max_output_tokens=2048,
-                    top_p=0.95,
-                    top_k=40,
+                self.soap_model = provider_clients.chat_model(
+                    "google", gemini_model, temperature, max_output_tokens=2048, top_p=0.95, top_k=40
                 )
             except Exception as e:
                 logger.error("Failed to initialize LangChain Gemini SOAP model", model=gemini_model, error=str(e))
@@ -62,18 +62,21 @@ class SOAPGenerationService:
 
             # Initialize Gemini model for Judge validation via LangChain
             try:
-                self.judge_model = ChatGoogleGenerativeAI(
-                    model=gemini_model,
-                    google_api_key=google_api_key,
-                    temperature=0.1,
-                    max_output_tokens=1024,
-                    top_p=0.95,
-                    top_k=40,
+                self.judge_model = provider_clients.chat_model(
+                    "google", gemini_model, 0.1, max_output_tokens=1024, top_p=0.95, top_k=40
                 )
             except Exception as e:
                 logger.error("Failed to initialize LangChain Gemini Judge model", model=gemini_model, error=str(e))
                 raise RuntimeError(f"Failed to initialize LangChain Gemini Judge model '{gemini_model}': {e}")
 
+            # Gemini response schema; streaming keeps using the raw SOAP model
+            self.structured_soap_model = with_structured_output(
+                self.soap_model, SOAPNoteOutput, self._extract_json_from_text
+            )
+            self.structured_judge_model = with_structured_output(
+                self.judge_model, JudgeLLMResponse, self._parse_judge_text
+            )
+
             logger.info("✅ LangChain Gemini models initialized for SOAP and Judge")
             
         except Exception as e:
@@ -99,6 +102,14 @@ class SOAPGenerationService:
         except Exception:
             return str(response)
     
+    @staticmethod
+    def _parse_judge_text(response_text: str) -> Dict[str, Any]:
+        """Parse a Judge verdict from model text that may contain fences or prose."""
+        judge_result = extract_json(response_text, required_keys=("approved",), openers="{")
+        if judge_result is None:
+            raise ValueError("Failed to parse judge response")
+        return judge_result
+    
     def _extract_json_from_text(self, text: str) -> Dict[str, Any]:
         """
         Extract JSON from Gemini model output that may contain extra text.
@@ -112,40 +123,14 @@ class SOAPGenerationService:
         if not text or not text.strip():
             logger.warning("Empty text received from model")
             return self._fallback_text_parsing("")
-            
-        try:
-            # Remove markdown code blocks if present
-            cleaned_text = text.strip()
-            if cleaned_text.startswith("```json"):
-                cleaned_text = cleaned_text.replace("```json", "").replace("```", "").strip()
-            elif cleaned_text.startswith("```"):
-                cleaned_text = cleaned_text.replace("```", "").strip()
-            
-            # First try to parse the entire text as JSON
-            return json.loads(cleaned_text)
-        except json.JSONDecodeError:
-            logger.info("Direct JSON parsing failed, attempting extraction from text")
-            
-            # Try to extract JSON from text using regex
-            json_pattern = r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}'
-            matches = re.findall(json_pattern, text, re.DOTALL)
-            
-            for match in matches:
-                try:
-                    parsed = json.loads(match)
-                    if isinstance(parsed, dict) and all(key in parsed for key in ['subjective', 'objective', 'assessment', 'plan']):
-                        logger.info("✅ Successfully extracted valid SOAP JSON from text")
-                        return parsed
-                except json.JSONDecodeError:
-                    continue
-            
-            # Last resort: create a minimal structure from the text
-            logger.warning("Failed to extract valid JSON, using fallback text parsing")
-            return self._fallback_text_parsing(text)
-            
-        except Exception as e:
-            logger.error("JSON extraction failed with exception", error=str(e))
-            return self._fallback_text_parsing(text)
+        
+        parsed = extract_json(text, required_keys=("subjective", "objective", "assessment", "plan"))
+        if parsed is not None:
+            return parsed
+        
+        # Last resort: create a minimal structure from the text
+        logger.warning("Failed to extract valid JSON, using fallback text parsing")
+        return self._fallback_text_parsing(text)
     
     def _fallback_text_parsing(self, text: str) -> Dict[str, Any]:
         """
@@ -275,27 +260,19 @@ Return ONLY the JSON assessment, no additional text."""
         Returns:
             JudgeLLMResponse: Validation result
         """
+        verdict = self.prejudge.evaluate(soap_note)
+        if not verdict.deferred:
+            logger.info("Pre-judge decided without Gemini Judge", decision=verdict.decision, rule=verdict.rule)
+            return JudgeLLMResponse(
+                approved=verdict.decision == "approve",
+                reason=f"Pre-judge ({verdict.rule}): {verdict.reason}",
+                confidence=verdict.confidence,
+                suggestions=verdict.suggestions
+            )
+        
         try:
             prompt = self._create_judge_prompt(soap_note)
-            response = await self.judge_model.ainvoke(prompt)
-            response_text = self._extract_response_text(response).strip()
-            
-            # Parse JSON response
-            try:
-                # Remove markdown code blocks if present
-                if response_text.startswith("```json"):
-                    response_text = response_text.replace("```json", "").replace("```", "").strip()
-                elif response_text.startswith("```"):
-                    response_text = response_text.replace("```", "").strip()
-                
-                judge_result = json.loads(response_text)
-            except json.JSONDecodeError:
-                # Try to extract JSON object
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    judge_result = json.loads(json_match.group(0))
-                else:
-                    raise ValueError("Failed to parse judge response")
+            judge_result = await self.structured_judge_model.ainvoke(prompt)
             
             return JudgeLLMResponse(
                 approved=judge_result.get("approved", False),
@@ -356,14 +333,8 @@ Return ONLY the JSON assessment, no additional text."""
                     # Create prompt
                     prompt = self._create_soap_prompt(processed_text, context_data)
                     
-                    # Call Gemini model via LangChain
-                    response = await self.soap_model.ainvoke(prompt)
-                    response_text = self._extract_response_text(response).strip()
-                    
-                    logger.info("✅ Gemini SOAP model responded", response_length=len(response_text))
-                    
-                    # Parse JSON response
-                    soap_result = self._extract_json_from_text(response_text)
+                    # Call Gemini model via LangChain with its response schema
+                    soap_result = await self.structured_soap_model.ainvoke(prompt)
                     
                     logger.info("✅ SOAP JSON parsed successfully", result_keys=list(soap_result.keys()))
                     
@@ -436,3 +407,100 @@ Return ONLY the JSON assessment, no additional text."""
                 pii_entities_found=0,
                 original_text_preserved=True
             )
+    
+    async def stream_soap_note(
+        self,
+        request: SOAPGenerationRequest,
+        context_data: Optional[Dict[str, Any]] = None,
+        pii_masked_text: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate a SOAP note while streaming, yielding each section as soon as it is complete.
+        
+        Events are dictionaries with "event" and "data" keys:
+        - section: one completed SOAP section ({"attempt", "section", "value"})
+        - judge: Judge verdict for the attempt
+        - regenerating: the attempt was rejected and generation restarts
+        - complete: final SOAPGenerationResponse
+        
+        Args:
+            request: SOAP generation request
+            context_data: Optional NER context data from external call
+            pii_masked_text: Optional PII-masked text from external call
+            
+        Yields:
+            Dict[str, Any]: Streaming events
+        """
+        start_time = time.time()
+        regeneration_count = 0
+        max_regenerations = int(os.getenv("SOAP_MAX_RETRIES", "3"))
+        processed_text = pii_masked_text if pii_masked_text else request.text
+        context_data = context_data if context_data is not None else {}
+        soap_note = None
+        validation_feedback = ""
+        ai_approved = False
+        
+        while regeneration_count <= max_regenerations:
+            attempt = regeneration_count + 1
+            try:
+                logger.info(f"🔄 Streaming SOAP generation attempt {attempt}/{max_regenerations + 1}")
+                
+                parser = IncrementalSOAPParser()
+                first_section_time = None
+                prompt = self._create_soap_prompt(processed_text, context_data)
+                async for chunk in self.soap_model.astream(prompt):
+                    for section, value in parser.feed(self._extract_response_text(chunk)):
+                        if first_section_time is None:
+                            first_section_time = time.time() - start_time
+                            logger.info("✅ First SOAP section streamed", section=section, elapsed=first_section_time)
+                        yield {"event": "section", "data": {"attempt": attempt, "section": section, "value": value}}
+                
+                # Sections the incremental parser could not recover come from the full text
+                soap_result = dict(parser.completed)
+                if parser.missing_sections:
+                    logger.warning("Incomplete streamed SOAP JSON, parsing full response", missing=parser.missing_sections)
+                    fallback = self._extract_json_from_text(parser.buffer)
+                    for section in parser.missing_sections:
+                        if section in fallback:
+                            soap_result[section] = fallback[section]
+                            yield {"event": "section", "data": {"attempt": attempt, "section": section, "value": fallback[section]}}
+                
+                judge_result = await self._validate_with_judge(soap_result)
+                validation_feedback = judge_result.reason
+                yield {"event": "judge", "data": {"attempt": attempt, **judge_result.dict()}}
+                
+                if judge_result.approved:
+                    soap_note = SOAPNote(**soap_result)
+                    ai_approved = True
+                    logger.info("✅ Streamed SOAP note approved by Gemini Judge", attempts=attempt)
+                    break
+                
+                regeneration_count += 1
+                logger.warning("❌ Streamed SOAP note rejected by Gemini Judge", attempt=regeneration_count, reason=judge_result.reason)
+                if regeneration_count <= max_regenerations:
+                    context_data["validation_feedback"] = judge_result.reason
+                    context_data["suggestions"] = judge_result.suggestions
+                    yield {"event": "regenerating", "data": {"attempt": attempt + 1, "reason": judge_result.reason}}
+            
+            except Exception as e:
+                regeneration_count += 1
+                validation_feedback = f"Generation failed: {str(e)}"
+                logger.error(f"❌ Streaming SOAP generation attempt {regeneration_count} failed", error=str(e))
+                if regeneration_count <= max_regenerations:
+                    yield {"event": "regenerating", "data": {"attempt": attempt + 1, "reason": validation_feedback}}
+        
+        response = SOAPGenerationResponse(
+            success=ai_approved,
+            soap_note=soap_note,
+            context_data=NEROutput(**context_data) if context_data else None,
+            ai_approved=ai_approved,
+            note_id=None,
+            processing_time=time.time() - start_time,
+            regeneration_count=regeneration_count,
+            validation_feedback=validation_feedback,
+            message="SOAP note generated and approved by Gemini" if ai_approved else "SOAP note generation failed validation",
+            pii_masked=bool(pii_masked_text),
+            pii_entities_found=0,
+            original_text_preserved=True
+        )
+        yield {"event": "complete", "data": response.dict()}
@@ -0,0 +1,139 @@
+"""
+Incremental SOAP JSON Parser
+Detects completed top-level SOAP sections while the model output is still streaming
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+SOAP_SECTIONS = ("subjective", "objective", "assessment", "plan")
+
+
+class IncrementalSOAPParser:
+    """
+    Character-level scanner over streamed model output.
+
+    Tracks string/escape state and nesting depth, so a top-level member of the
+    SOAP object is known to be complete as soon as its value closes, without
+    waiting for the rest of the document. Text before the first "{" (such as a
+    ```json fence) is ignored.
+    """
+
+    def __init__(self, sections: Tuple[str, ...] = SOAP_SECTIONS):
+        self.sections = sections
+        self.buffer = ""
+        self.completed: Dict[str, Any] = {}
+        self._pos = 0
+        self._depth = 0
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escape = False
+        # Top-level member state: current key, where its key/value begin
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._value_is_string = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume the next chunk of model output.
+
+        Args:
+            chunk: Newly streamed text
+
+        Returns:
+            List[Tuple[str, Any]]: SOAP sections completed by this chunk, in order
+        """
+        self.buffer += chunk
+        newly_completed: List[Tuple[str, Any]] = []
+
+        while self._pos < len(self.buffer) and not self._finished:
+            index = self._pos
+            char = self.buffer[index]
+            self._pos += 1
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._key_start is not None:
+                            self._key = self._decode(self.buffer[self._key_start:index + 1])
+                            self._key_start = None
+                        elif self._value_is_string:
+                            self._complete(index + 1, newly_completed)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._key is None:
+                        self._key_start = index
+                    elif self._value_start is None:
+                        self._value_start = index
+                        self._value_is_string = True
+            elif char in "{[":
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = index
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._complete(index + 1, newly_completed)
+                elif self._depth == 0:
+                    if self._value_start is not None:
+                        self._complete(index, newly_completed)
+                    self._finished = True
+            elif self._depth == 1:
+                if char == ",":
+                    if self._value_start is not None:
+                        self._complete(index, newly_completed)
+                elif char not in " \t\r\n:" and self._key is not None and self._value_start is None:
+                    self._value_start = index
+
+        return newly_completed
+
+    @property
+    def finished(self) -> bool:
+        """Whether the top-level object has been closed."""
+        return self._finished
+
+    @property
+    def missing_sections(self) -> List[str]:
+        return [section for section in self.sections if section not in self.completed]
+
+    def _complete(self, end: int, newly_completed: List[Tuple[str, Any]]) -> None:
+        key, raw_value = self._key, self.buffer[self._value_start:end].strip()
+        self._key = None
+        self._value_start = None
+        self._value_is_string = False
+
+        if key not in self.sections or key in self.completed:
+            return
+        try:
+            value = json.loads(raw_value)
+        except json.JSONDecodeError:
+            logger.warning("Streamed SOAP section is not valid JSON", section=key)
+            return
+        self.completed[key] = value
+        newly_completed.append((key, value))
+
+    @staticmethod
+    def _decode(raw_string: str) -> Optional[str]:
+        try:
+            return json.loads(raw_string)
+        except json.JSONDecodeError:
+            return None
@@ -1,65 +1,462 @@
 """
 AI Provider Utilities
 Centralized utilities for initializing AI providers with fallback support
+
+Chat, embedding and raw SDK clients come from a process-wide registry that builds
+each (provider, model, temperature, options) client once and shares one keep-alive
+HTTP connection pool per provider, so requests skip client construction and TLS
+handshakes. Chat models are wrapped in a ProviderGateway (see provider_gateway.py)
+that rate limits, retries and fails over between providers at call time.
 """
 import os
-from typing import Tuple, Literal
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Literal, Type
+import httpx
 import structlog
 
+from pydantic import BaseModel
+from langchain_core.exceptions import OutputParserException, ModelInvalidRequestError
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from openai import BadRequestError
+from google.api_core.exceptions import BadRequest as GoogleBadRequest
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 
+from app.services.json_extraction import extract_json
+from app.services.provider_gateway import ProviderGateway, LimitedEmbeddings
+from app.services.embedding_batcher import BatchedEmbeddings, EMBEDDING_MICRO_BATCHING_ENABLED
+
 logger = structlog.get_logger(__name__)
 
 ProviderType = Literal["openai", "google"]
 
+# Native structured output (OpenAI JSON schema / Gemini response schema); disable to use text parsing only
+STRUCTURED_OUTPUT_ENABLED = os.getenv("AI_STRUCTURED_OUTPUT_ENABLED", "true").lower() == "true"
+# Errors a provider returns at call time for a request it cannot serve (e.g. an unsupported response schema)
+STRUCTURED_OUTPUT_REJECTED = (BadRequestError, GoogleBadRequest, ModelInvalidRequestError)
+# Keys of a JSON schema that Gemini's response_schema understands
+_GEMINI_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "properties", "required", "items"}
+
+# Shared HTTP connection pool settings (per provider)
+HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("AI_HTTP_TIMEOUT_SECONDS", "120"))
+
+# Fail over to the other configured provider at call time
+PROVIDER_FAILOVER_ENABLED = os.getenv("AI_PROVIDER_FAILOVER", "true").lower() == "true"
+
+
+class ProviderClientRegistry:
+    """Process-wide cache of long-lived provider clients."""
+    
+    def __init__(self):
+        # Reentrant: client factories take the lock again to get the shared HTTP pools
+        self._lock = threading.RLock()
+        self._clients: Dict[tuple, Any] = {}
+        self._http_clients: Dict[str, Tuple[httpx.Client, httpx.AsyncClient]] = {}
+        self._gemini_configured = False
+    
+    def _get(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = factory()
+                    logger.info("Provider client created", kind=key[0], provider=key[1], model=key[2])
+        return client
+    
+    def http_clients(self, provider: ProviderType) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """
+        Get the provider's shared sync and async HTTP clients.
+        
+        Args:
+            provider: Provider name
+            
+        Returns:
+            Tuple[httpx.Client, httpx.AsyncClient]: Keep-alive pooled clients
+        """
+        clients = self._http_clients.get(provider)
+        if clients is None:
+            with self._lock:
+                clients = self._http_clients.get(provider)
+                if clients is None:
+                    limits = httpx.Limits(
+                        max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+                    )
+                    timeout = httpx.Timeout(HTTP_TIMEOUT_SECONDS)
+                    clients = self._http_clients[provider] = (
+                        httpx.Client(limits=limits, timeout=timeout),
+                        httpx.AsyncClient(limits=limits, timeout=timeout)
+                    )
+        return clients
+    
+    def chat_model(self, provider: ProviderType, model: str, temperature: float, **options: Any) -> Any:
+        """
+        Get the shared LangChain chat model for a provider, model, temperature and options.
+        
+        Args:
+            provider: Provider name
+            model: Model name
+            temperature: Model temperature (0.0 - 1.0)
+            **options: Extra model parameters (max_output_tokens, top_p, ...)
+            
+        Returns:
+            Chat model
+        """
+        def build():
+            if provider == "openai":
+                http_client, http_async_client = self.http_clients("openai")
+                return ChatOpenAI(
+                    model=model,
+                    temperature=temperature,
+                    api_key=os.getenv("OPENAI_API_KEY", ""),
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                    **options
+                )
+            return ChatGoogleGenerativeAI(
+                model=model,
+                temperature=temperature,
+                google_api_key=os.getenv("GOOGLE_API_KEY", ""),
+                **options
+            )
+        
+        return self._get(("chat", provider, model, temperature, tuple(sorted(options.items()))), build)
+    
+    def embedding_model(self, provider: ProviderType, model: str) -> Any:
+        """
+        Get the shared LangChain embedding model for a provider and model.
+        
+        Args:
+            provider: Provider name
+            model: Embedding model name
+            
+        Returns:
+            Embedding model
+        """
+        def build():
+            if provider == "openai":
+                http_client, http_async_client = self.http_clients("openai")
+                return OpenAIEmbeddings(
+                    model=model,
+                    api_key=os.getenv("OPENAI_API_KEY", ""),
+                    http_client=http_client,
+                    http_async_client=http_async_client
+                )
+            return GoogleGenerativeAIEmbeddings(model=model, google_api_key=os.getenv("GOOGLE_API_KEY", ""))
+        
+        return self._get(("embedding", provider, model), build)
+    
+    def limited_embedding_model(self, provider: ProviderType, model: str) -> Any:
+        """
+        Get the shared embedding model running under the provider's limiter.
+        
+        Concurrent aembed_query calls are micro-batched into one provider call
+        unless EMBEDDING_MICRO_BATCHING=false.
+        
+        Args:
+            provider: Provider name
+            model: Embedding model name
+            
+        Returns:
+            Embedding model
+        """
+        def build():
+            limited = LimitedEmbeddings(self.embedding_model(provider, model), provider)
+            if not EMBEDDING_MICRO_BATCHING_ENABLED:
+                return limited
+            return BatchedEmbeddings(limited, name=f"{provider}_embeddings")
+        
+        return self._get(("limited_embedding", provider, model), build)
+    
+    def openai_client(self) -> Any:
+        """Get the shared AsyncOpenAI SDK client."""
+        def build():
+            from openai import AsyncOpenAI
+            _, http_async_client = self.http_clients("openai")
+            return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_async_client)
+        
+        return self._get(("sdk", "openai", None), build)
+    
+    def gemini_model(self, model: str) -> Any:
+        """Get a shared google-generativeai GenerativeModel, configuring the SDK once."""
+        def build():
+            import google.generativeai as genai
+            if not self._gemini_configured:
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                self._gemini_configured = True
+            return genai.GenerativeModel(model)
+        
+        return self._get(("sdk", "google", model), build)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Cached clients and HTTP pools."""
+        with self._lock:
+            return {
+                "clients": [":".join(str(part) for part in key[:4]) for key in self._clients],
+                "http_pools": list(self._http_clients),
+            }
+    
+    async def aclose(self) -> None:
+        """Close the shared HTTP pools and forget every cached client."""
+        with self._lock:
+            http_clients = list(self._http_clients.values())
+            self._http_clients.clear()
+            self._clients.clear()
+        for client, async_client in http_clients:
+            client.close()
+            await async_client.aclose()
+        logger.info("Provider HTTP pools closed", pools=len(http_clients))
+
+
+provider_clients = ProviderClientRegistry()
+
 
-def get_chat_model(temperature: float = 0.1) -> Tuple[any, ProviderType]:
+def _chat_model_name(provider: ProviderType) -> str:
+    if provider == "openai":
+        return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    # Accept both older env var names and the repo's AI_SERVICE_* convention
+    return os.getenv("GOOGLE_MODEL") or os.getenv("AI_SERVICE_GEMINI_MODEL") or "gemini-1.5-flash-latest"
+
+
+def _provider_order(operation: Optional[str] = None, preferred_provider: Optional[ProviderType] = None) -> List[ProviderType]:
     """
-    Initialize chat/LLM model with OpenAI or Google Gemini fallback.
+    Configured providers in call order.
+    
+    The order comes from AI_PROVIDER_ORDER_<OPERATION>, then AI_PROVIDER_ORDER
+    (default "openai,google"); preferred_provider moves to the front. Providers
+    without an API key are skipped.
+    """
+    order = (
+        (os.getenv(f"AI_PROVIDER_ORDER_{operation.upper()}") if operation else None)
+        or os.getenv("AI_PROVIDER_ORDER", "openai,google")
+    )
+    providers = [p.strip() for p in order.split(",") if p.strip() in ("openai", "google")]
+    for provider in ("openai", "google"):
+        if provider not in providers:
+            providers.append(provider)
+    if preferred_provider in providers:
+        providers.remove(preferred_provider)
+        providers.insert(0, preferred_provider)
+    
+    keys = {"openai": os.getenv("OPENAI_API_KEY", ""), "google": os.getenv("GOOGLE_API_KEY", "")}
+    return [provider for provider in providers if keys[provider]]
+
+
+def get_chat_model(
+    temperature: float = 0.1,
+    operation: Optional[str] = None,
+    preferred_provider: Optional[ProviderType] = None
+) -> Tuple[any, ProviderType]:
+    """
+    Get a chat/LLM model that fails over between OpenAI and Google Gemini at call time.
+    
+    Calls run through a ProviderGateway: per-provider rate limits, retries with
+    backoff and circuit breaking, then failover to the next configured provider.
+    With AI_PROVIDER_FAILOVER=false only the first provider is used. Responses are
+    served from the LLM response cache when LLM_CACHE_MODE covers the temperature.
     
     Args:
         temperature: Model temperature (0.0 - 1.0)
+        operation: Operation name (soap, judge, rag, ...), selects AI_PROVIDER_ORDER_<OPERATION>
+        preferred_provider: Provider to try first
         
     Returns:
-        Tuple[ChatModel, ProviderType]: Initialized chat model and provider name
+        Tuple[ChatModel, ProviderType]: Chat model runnable and preferred provider name
         
     Raises:
         RuntimeError: If no API key is available
     """
-    openai_api_key = os.getenv("OPENAI_API_KEY", "")
-    google_api_key = os.getenv("GOOGLE_API_KEY", "")
+    providers = _provider_order(operation, preferred_provider)
+    if not providers:
+        raise RuntimeError(
+            "No API key found. Please set either OPENAI_API_KEY or GOOGLE_API_KEY environment variable."
+        )
+    if not PROVIDER_FAILOVER_ENABLED:
+        providers = providers[:1]
     
-    if openai_api_key:
-        logger.info("Initializing ChatOpenAI")
-        openai_model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        model = ChatOpenAI(
-            model=openai_model,
-            temperature=temperature,
-            api_key=openai_api_key
+    targets = [
+        (provider, provider_clients.chat_model(provider, _chat_model_name(provider), temperature))
+        for provider in providers
+    ]
+    return ProviderGateway(targets, operation or "chat", temperature=temperature), providers[0]
+
+
+def message_text(message: Any) -> str:
+    """Extract plain text from a chat model message."""
+    content = getattr(message, "content", message)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            item.get("text", "") if isinstance(item, dict) else str(item) for item in content
         )
-        return model, "openai"
+    return str(content)
+
+
+def parse_json_text(text: str, schema: Optional[Type[BaseModel]] = None) -> Any:
+    """
+    Parse JSON from model text, tolerating markdown fences and surrounding prose.
+    
+    Args:
+        text: Raw model text
+        schema: Pydantic schema the JSON must validate against
         
-    elif google_api_key:
-        logger.info("OpenAI API key not found, using Google Gemini for chat model")
-        # Accept both older env var names and the repo's AI_SERVICE_* convention
-        google_model = os.getenv("GOOGLE_MODEL") or os.getenv("AI_SERVICE_GEMINI_MODEL") or "gemini-1.5-flash-latest"
-        model = ChatGoogleGenerativeAI(
-            model=google_model,
-            temperature=temperature,
-            google_api_key=google_api_key
-        )
-        return model, "google"
+    Returns:
+        The parsed JSON value
         
-    else:
-        raise RuntimeError(
-            "No API key found. Please set either OPENAI_API_KEY or GOOGLE_API_KEY environment variable."
+    Raises:
+        OutputParserException: If the text contains no (valid) JSON value
+    """
+    value = extract_json(text, schema=schema)
+    if value is None:
+        raise OutputParserException(f"No valid JSON found in model output: {text[:200]}", llm_output=text)
+    return value
+
+
+def json_parser(schema: Optional[Type[BaseModel]] = None) -> Runnable:
+    """Runnable parsing a chat model message into JSON."""
+    return RunnableLambda(lambda message: parse_json_text(message_text(message), schema))
+
+
+def with_structured_output(
+    model: Any,
+    schema: Type[BaseModel],
+    fallback_parser: Optional[Callable[[str], Any]] = None
+) -> Runnable:
+    """
+    Make a chat model return JSON conforming to a Pydantic schema.
+    
+    Uses the provider's native structured output (OpenAI JSON schema, Gemini response
+    schema) so the model cannot emit prose or malformed JSON. Providers or models
+    without support, and responses that still fail to parse, go through
+    fallback_parser on the raw text instead. A model that rejects the schema at call
+    time (HTTP 400) is called without it from then on, so the extra round trip is
+    paid once per chain.
+    
+    Args:
+        model: Chat model
+        schema: Pydantic schema of the expected output
+        fallback_parser: Parses raw model text when structured output is unavailable
+            (defaults to lenient JSON parsing validated against the schema)
+        
+    Returns:
+        Runnable: Model runnable returning a dict
+    """
+    fallback_parser = fallback_parser or (lambda text: parse_json_text(text, schema))
+    text_parsing = model | RunnableLambda(lambda message: fallback_parser(message_text(message)))
+    if not STRUCTURED_OUTPUT_ENABLED:
+        return text_parsing
+    
+    json_schema = schema.model_json_schema()
+    try:
+        structured = model.with_structured_output(json_schema, method="json_schema", include_raw=True)
+    except Exception as e:
+        logger.warning("Structured output unsupported, using text parsing", schema=schema.__name__, error=str(e))
+        return text_parsing
+    
+    # Set once the provider rejects the schema and the plain call succeeds
+    rejected = threading.Event()
+    
+    def pick(result: dict) -> Any:
+        parsed = result.get("parsed")
+        if parsed is not None:
+            return parsed
+        logger.warning(
+            "Structured output parse failed, falling back to text parsing",
+            schema=schema.__name__,
+            error=str(result.get("parsing_error"))
         )
+        return fallback_parser(message_text(result.get("raw")))
+    
+    structured_chain = structured | RunnableLambda(pick)
+    
+    def on_rejected(error: Exception, result: Any) -> Any:
+        if not rejected.is_set():
+            rejected.set()
+            logger.warning("Structured output rejected by the model, using text parsing", schema=schema.__name__, error=str(error))
+        return result
+    
+    def run(value: Any, config: Any) -> Any:
+        if not rejected.is_set():
+            try:
+                return structured_chain.invoke(value, config)
+            except STRUCTURED_OUTPUT_REJECTED as e:
+                return on_rejected(e, text_parsing.invoke(value, config))
+        return text_parsing.invoke(value, config)
+    
+    async def arun(value: Any, config: Any) -> Any:
+        if not rejected.is_set():
+            try:
+                return await structured_chain.ainvoke(value, config)
+            except STRUCTURED_OUTPUT_REJECTED as e:
+                return on_rejected(e, await text_parsing.ainvoke(value, config))
+        return await text_parsing.ainvoke(value, config)
+    
+    return RunnableLambda(run, afunc=arun, name=f"structured_{schema.__name__}")
+
+
+def gemini_response_schema(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Gemini response_schema of a Pydantic schema.
+
+    Gemini takes an OpenAPI subset without $ref, titles, defaults or anyOf, so
+    references are inlined, Optional[X] becomes a nullable X and other keys are dropped.
+    """
+    root = schema.model_json_schema()
+    definitions = root.get("$defs", {})
+    
+    def convert(node: Dict[str, Any]) -> Dict[str, Any]:
+        if "$ref" in node:
+            node = {**definitions[node["$ref"].split("/")[-1]], **{k: v for k, v in node.items() if k != "$ref"}}
+        if "anyOf" in node:
+            options = [option for option in node["anyOf"] if option.get("type") != "null"]
+            merged = {**convert(options[0]), "nullable": True} if len(options) == 1 else {"type": "string"}
+            if node.get("description"):
+                merged["description"] = node["description"]
+            return merged
+        converted = {key: value for key, value in node.items() if key in _GEMINI_SCHEMA_KEYS}
+        if "properties" in converted:
+            converted["properties"] = {name: convert(value) for name, value in converted["properties"].items()}
+        if "items" in converted:
+            converted["items"] = convert(converted["items"])
+        return converted
+    
+    return convert(root)
+
+
+def get_structured_chat_model(
+    schema: Type[BaseModel],
+    temperature: float = 0.1,
+    fallback_parser: Optional[Callable[[str], Any]] = None,
+    operation: Optional[str] = None
+) -> Tuple[Runnable, ProviderType]:
+    """
+    Initialize a chat model that returns JSON conforming to a Pydantic schema.
+    
+    Args:
+        schema: Pydantic schema of the expected output
+        temperature: Model temperature (0.0 - 1.0)
+        fallback_parser: Parses raw model text when structured output is unavailable
+        operation: Operation name passed to get_chat_model
+        
+    Returns:
+        Tuple[Runnable, ProviderType]: Model runnable returning a dict, and provider name
+        
+    Raises:
+        RuntimeError: If no API key is available
+    """
+    model, provider = get_chat_model(temperature=temperature, operation=operation)
+    return with_structured_output(model, schema, fallback_parser), provider
 
 
 def get_embedding_model() -> Tuple[any, ProviderType]:
     """
-    Initialize embedding model with OpenAI or Google Gemini fallback.
+    Get the shared embedding model with OpenAI or Google Gemini fallback.
     
     Returns:
         Tuple[EmbeddingModel, ProviderType]: Initialized embedding model and provider name
@@ -70,24 +467,17 @@ def get_embedding_model() -> Tuple[any, ProviderType]:
     openai_api_key = os.getenv("OPENAI_API_KEY", "")
     google_api_key = os.getenv("GOOGLE_API_KEY", "")
     
+    # Calls are rate limited, retried and micro-batched, but never fail over: another
+    # provider's vectors would not be comparable with the stored embeddings
     if openai_api_key:
-        logger.info("Initializing OpenAIEmbeddings")
         openai_embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
-        model = OpenAIEmbeddings(
-            model=openai_embedding_model,
-            api_key=openai_api_key
-        )
-        return model, "openai"
+        return provider_clients.limited_embedding_model("openai", openai_embedding_model), "openai"
         
     elif google_api_key:
         logger.info("OpenAI API key not found, using Google Gemini for embeddings")
         # Prefer AI_SERVICE_GEMINI_EMBEDDING_MODEL if present
         google_embedding_model = os.getenv("GOOGLE_EMBEDDING_MODEL") or os.getenv("AI_SERVICE_GEMINI_EMBEDDING_MODEL") or "models/embedding-001"
-        model = GoogleGenerativeAIEmbeddings(
-            model=google_embedding_model,
-            google_api_key=google_api_key
-        )
-        return model, "google"
+        return provider_clients.limited_embedding_model("google", google_embedding_model), "google"
         
     else:
         raise RuntimeError(
@@ -15,6 +15,8 @@ from app.services.ai.soap_service import SOAPGenerationService
 from app.services.ai.ner_service import NERService
 from app.services.ai.pii_service import PIIService
 from app.services.ai.rag_service import RAGService
+from app.services.entity_index_service import EntityIndexService
+from app.services.patient_vector_service import PatientVectorService
 from app.models.session_soap_notes import SessionSoapNotes
 from app.models.uploaded_documents import UploadedDocuments
 from app.database.db import async_session_maker
@@ -31,6 +33,8 @@ class AISOAPService:
         self.ner_service = NERService()
         self.pii_service = PIIService()
         self.rag_service = RAGService()
+        self.entity_index = EntityIndexService()
+        self.patient_vectors = PatientVectorService()
     
     def _clean_for_json_serialization(self, data: Any) -> Any:
         """
@@ -159,6 +163,20 @@ class AISOAPService:
                 )
                 
                 session.add(db_soap_note)
+                await session.flush()
+                
+                # Keep the clinical entity index in sync with the stored context data
+                try:
+                    async with session.begin_nested():
+                        await self.entity_index.index_note(
+                            session,
+                            db_soap_note.note_id,
+                            cleaned_context_data,
+                            session_id=session_id
+                        )
+                except Exception as e:
+                    logger.error("❌ Clinical entity indexing failed", note_id=str(db_soap_note.note_id), error=str(e))
+                
                 await session.commit()
                 await session.refresh(db_soap_note)
                 
@@ -176,6 +194,13 @@ class AISOAPService:
                             # Update the note with embedding
                             import numpy as np
                             db_soap_note.embedding = np.array(embedding, dtype=np.float32)
+                            try:
+                                async with session.begin_nested():
+                                    await self.patient_vectors.apply_note_embedding(
+                                        session, note_id, db_soap_note.embedding
+                                    )
+                            except Exception as e:
+                                logger.error("❌ Patient vector update failed", note_id=str(note_id), error=str(e))
                             await session.commit()
                             logger.info("✅ RAG embedding completed successfully for AI-approved note", note_id=str(note_id))
                         else:
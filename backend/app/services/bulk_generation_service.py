@@ -0,0 +1,344 @@
+"""
+Bulk Generation Service
+Runs bulk SOAP generation jobs with bounded concurrency, rate limiting and crash-safe progress
+"""
+import os
+import time
+import uuid
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set, List
+
+import structlog
+
+from app.schemas.soap_schemas import (
+    SOAPGenerationRequest, BulkGenerationJobRequest, BulkGenerationJobResponse, BulkGenerationItemResponse
+)
+from app.models.soap_generation_jobs import SOAPGenerationJobs
+from app.data.soap_generation_jobs_repository import SOAPGenerationJobsRepository
+from app.data.uploaded_documents_repository import UploadedDocumentsRepository
+from app.database.db import async_session_maker
+
+logger = structlog.get_logger(__name__)
+
+# Process-wide cap on bulk items in flight across all jobs; their generations additionally
+# share SOAP_BULK_MAX_CONCURRENT_GENERATIONS, which leaves slots free for interactive requests
+BULK_MAX_WORKERS = int(os.getenv("SOAP_BULK_MAX_WORKERS", "8"))
+# Item starts per minute across all jobs (0 disables), to stay inside provider quotas
+BULK_ITEMS_PER_MINUTE = float(os.getenv("SOAP_BULK_ITEMS_PER_MINUTE", "0"))
+BULK_MAX_ATTEMPTS = int(os.getenv("SOAP_BULK_MAX_ATTEMPTS", "2"))
+
+
+class RateLimiter:
+    """Token bucket limiting how often work may start; a rate of 0 means unlimited."""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, self.rate_per_second)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until one unit of work may start."""
+        if self.rate_per_second <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate_per_second)
+
+
+class BulkGenerationService:
+    """Creates, runs, resumes and reports on bulk SOAP generation jobs."""
+
+    def __init__(self, soap_service):
+        """
+        Args:
+            soap_service: SOAPGenerationService used to generate each item
+        """
+        self.soap_service = soap_service
+        self._worker_slots = asyncio.Semaphore(BULK_MAX_WORKERS)
+        self._rate_limiter = RateLimiter(BULK_ITEMS_PER_MINUTE)
+        self._runners: Dict[uuid.UUID, asyncio.Task] = {}
+        self._cancelled: Set[uuid.UUID] = set()
+
+    async def create_job(self, request: BulkGenerationJobRequest) -> BulkGenerationJobResponse:
+        """
+        Persist a bulk job with its items and start processing it in the background.
+
+        Args:
+            request: Bulk generation request
+
+        Returns:
+            BulkGenerationJobResponse: Initial job progress
+        """
+        options = {
+            "include_context": request.include_context,
+            "enable_pii_masking": request.enable_pii_masking,
+            "preserve_medical_context": request.preserve_medical_context,
+            "pipeline_mode": request.pipeline_mode,
+        }
+        items = [
+            {"session_id": item.session_id, "document_id": item.document_id, "text": item.text}
+            for item in request.items
+        ]
+
+        async with async_session_maker() as session:
+            job_id = await SOAPGenerationJobsRepository(session).create_job(
+                {
+                    "professional_id": request.professional_id,
+                    "concurrency": min(request.concurrency, BULK_MAX_WORKERS),
+                    "options": options,
+                },
+                items,
+            )
+            await session.commit()
+
+        logger.info("✅ Bulk generation job created", job_id=str(job_id), items=len(items))
+        self.start(job_id)
+        return await self.get_progress(job_id)
+
+    def start(self, job_id: uuid.UUID) -> None:
+        """Start the background runner for a job unless it is already running."""
+        runner = self._runners.get(job_id)
+        if runner is not None and not runner.done():
+            return
+        task = asyncio.create_task(self._run_job(job_id))
+        self._runners[job_id] = task
+        task.add_done_callback(lambda _: self._runners.pop(job_id, None))
+
+    async def resume_incomplete_jobs(self) -> int:
+        """
+        Resume jobs interrupted by a restart or crash.
+
+        Items still marked running belonged to the stopped process and are
+        returned to pending before their jobs are restarted. Assumes a single
+        API process runs bulk jobs.
+
+        Returns:
+            int: Number of jobs resumed
+        """
+        async with async_session_maker() as session:
+            repo = SOAPGenerationJobsRepository(session)
+            job_ids = await repo.resumable_job_ids()
+            for job_id in job_ids:
+                requeued = await repo.requeue_running_items(job_id)
+                if requeued:
+                    logger.info("Requeued interrupted bulk items", job_id=str(job_id), items=requeued)
+            await session.commit()
+
+        for job_id in job_ids:
+            self.start(job_id)
+        if job_ids:
+            logger.info("✅ Resumed bulk generation jobs", jobs=len(job_ids))
+        return len(job_ids)
+
+    async def cancel_job(self, job_id: uuid.UUID) -> Optional[BulkGenerationJobResponse]:
+        """
+        Stop claiming new items for a job; items already running finish normally.
+
+        Returns:
+            Optional[BulkGenerationJobResponse]: Job progress, or None if the job does not exist
+        """
+        async with async_session_maker() as session:
+            repo = SOAPGenerationJobsRepository(session)
+            job = await repo.get_job(job_id)
+            if job is None:
+                return None
+            if job.status in ("pending", "running"):
+                self._cancelled.add(job_id)
+                await repo.set_job_status(job_id, "cancelled", finished_at=datetime.now(timezone.utc))
+                await session.commit()
+                logger.info("Bulk generation job cancelled", job_id=str(job_id))
+        return await self.get_progress(job_id)
+
+    async def _run_job(self, job_id: uuid.UUID) -> None:
+        try:
+            async with async_session_maker() as session:
+                repo = SOAPGenerationJobsRepository(session)
+                job = await repo.get_job(job_id)
+                if job is None or job.status not in ("pending", "running"):
+                    return
+                await repo.set_job_status(job_id, "running", started_at=job.started_at or datetime.now(timezone.utc))
+                await session.commit()
+                concurrency, options, professional_id = job.concurrency, job.options or {}, job.professional_id
+
+            logger.info("🚀 Bulk generation job started", job_id=str(job_id), concurrency=concurrency)
+            await asyncio.gather(*(
+                self._worker(job_id, options, professional_id) for _ in range(max(1, concurrency))
+            ))
+
+            if job_id not in self._cancelled:
+                async with async_session_maker() as session:
+                    await SOAPGenerationJobsRepository(session).set_job_status(
+                        job_id, "completed", finished_at=datetime.now(timezone.utc)
+                    )
+                    await session.commit()
+                logger.info("✅ Bulk generation job completed", job_id=str(job_id))
+
+        except Exception as e:
+            logger.error("❌ Bulk generation job failed", job_id=str(job_id), error=str(e))
+            try:
+                async with async_session_maker() as session:
+                    await SOAPGenerationJobsRepository(session).set_job_status(
+                        job_id, "failed", error=str(e), finished_at=datetime.now(timezone.utc)
+                    )
+                    await session.commit()
+            except Exception as status_error:
+                logger.error("❌ Failed to record bulk job failure", job_id=str(job_id), error=str(status_error))
+        finally:
+            self._cancelled.discard(job_id)
+
+    async def _worker(self, job_id: uuid.UUID, options: Dict[str, Any], professional_id: Optional[uuid.UUID]) -> None:
+        """Claim and process items one at a time until the job has none left."""
+        while job_id not in self._cancelled:
+            async with self._worker_slots:
+                await self._rate_limiter.acquire()
+                async with async_session_maker() as session:
+                    item = await SOAPGenerationJobsRepository(session).claim_next_item(job_id)
+                    await session.commit()
+                if item is None:
+                    return
+                await self._process_item(item, options, professional_id)
+
+    async def _process_item(self, item, options: Dict[str, Any], professional_id: Optional[uuid.UUID]) -> None:
+        start_time = time.time()
+        note_id = None
+        error = None
+
+        try:
+            document_id, text = item.document_id, item.text
+            if not text:
+                async with async_session_maker() as session:
+                    document = await UploadedDocumentsRepository(session).get_document_by_id(document_id)
+                text = document.extracted_text if document else None
+                if not text:
+                    raise ValueError("Document has no extracted text")
+
+            if document_id is None:
+                document_id = await self.soap_service._create_document_record(
+                    session_id=item.session_id,
+                    professional_id=professional_id,
+                    text_content=text
+                )
+                # Keep the document on the item so a retry does not create another one
+                async with async_session_maker() as session:
+                    await SOAPGenerationJobsRepository(session).update_item(item.item_id, document_id=document_id)
+                    await session.commit()
+
+            response = await self.soap_service.generate_soap_note(SOAPGenerationRequest(
+                text=text,
+                session_id=item.session_id,
+                document_id=document_id,
+                professional_id=professional_id,
+                **options
+            ), batch_judge=True, background=True)
+            if response.success and response.note_id:
+                note_id = response.note_id
+            else:
+                error = response.validation_feedback or response.message or "SOAP generation failed"
+
+        except Exception as e:
+            error = str(e)
+
+        processing_time = time.time() - start_time
+        succeeded = note_id is not None
+        retry = not succeeded and item.attempts < BULK_MAX_ATTEMPTS
+
+        async with async_session_maker() as session:
+            repo = SOAPGenerationJobsRepository(session)
+            await repo.update_item(
+                item.item_id,
+                status="succeeded" if succeeded else ("pending" if retry else "failed"),
+                note_id=note_id,
+                error=error,
+                processing_time=processing_time,
+                finished_at=None if retry else datetime.now(timezone.utc),
+            )
+            await session.commit()
+
+        if succeeded:
+            logger.info("✅ Bulk item generated", job_id=str(item.job_id), position=item.position, processing_time=processing_time)
+        else:
+            logger.warning(
+                "❌ Bulk item failed",
+                job_id=str(item.job_id),
+                position=item.position,
+                attempt=item.attempts,
+                will_retry=retry,
+                error=error
+            )
+
+    async def get_progress(self, job_id: uuid.UUID) -> Optional[BulkGenerationJobResponse]:
+        """
+        Report a job's progress, throughput and estimated time remaining.
+
+        Returns:
+            Optional[BulkGenerationJobResponse]: Job progress, or None if the job does not exist
+        """
+        async with async_session_maker() as session:
+            repo = SOAPGenerationJobsRepository(session)
+            job = await repo.get_job(job_id)
+            if job is None:
+                return None
+            counts = await repo.item_status_counts(job_id)
+
+        return self._to_response(job, counts)
+
+    async def list_items(
+        self, job_id: uuid.UUID, status: Optional[str] = None, offset: int = 0, limit: int = 100
+    ) -> List[BulkGenerationItemResponse]:
+        """List a job's items, optionally filtered by status."""
+        async with async_session_maker() as session:
+            items = await SOAPGenerationJobsRepository(session).list_items(job_id, status, offset, limit)
+        return [
+            BulkGenerationItemResponse(
+                item_id=item.item_id,
+                position=item.position,
+                session_id=item.session_id,
+                document_id=item.document_id,
+                status=item.status,
+                attempts=item.attempts,
+                note_id=item.note_id,
+                error=item.error,
+                processing_time=item.processing_time
+            )
+            for item in items
+        ]
+
+    @staticmethod
+    def _to_response(job: SOAPGenerationJobs, counts: Dict[str, int]) -> BulkGenerationJobResponse:
+        finished = counts.get("succeeded", 0) + counts.get("failed", 0)
+        throughput = 0.0
+        eta_seconds = None
+        if job.started_at and finished:
+            end = job.finished_at or datetime.now(timezone.utc)
+            elapsed = max((end - job.started_at).total_seconds(), 1e-6)
+            throughput = finished / elapsed * 60
+            remaining = job.total_items - finished
+            if job.status == "running" and remaining > 0:
+                eta_seconds = remaining / (finished / elapsed)
+
+        return BulkGenerationJobResponse(
+            job_id=job.job_id,
+            status=job.status,
+            concurrency=job.concurrency,
+            total_items=job.total_items,
+            pending_items=counts.get("pending", 0),
+            running_items=counts.get("running", 0),
+            succeeded_items=counts.get("succeeded", 0),
+            failed_items=counts.get("failed", 0),
+            progress=finished / job.total_items if job.total_items else 0.0,
+            throughput_per_minute=throughput,
+            eta_seconds=eta_seconds,
+            error=job.error,
+            created_at=job.created_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at
+        )
@@ -0,0 +1,91 @@
+"""
+Embedding Batcher
+Coalesces concurrent single-text embedding calls into one batched provider call
+
+Under load, every RAG query and embedding request would make its own aembed_query
+round trip. BatchedEmbeddings collects the texts submitted within a few milliseconds
+(see MicroBatcher), embeds them with a single embed_documents call and hands each
+caller its own vector. Query embeddings keep their query task type, so the vectors
+are the same as with individual aembed_query calls.
+"""
+import os
+from typing import Any, Dict, List
+
+import structlog
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from app.services.micro_batcher import MicroBatcher
+
+logger = structlog.get_logger(__name__)
+
+EMBEDDING_MICRO_BATCHING_ENABLED = os.getenv("EMBEDDING_MICRO_BATCHING", "true").lower() == "true"
+EMBEDDING_MICRO_BATCH_SIZE = int(os.getenv("EMBEDDING_MICRO_BATCH_SIZE", "64"))
+EMBEDDING_MICRO_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_MICRO_BATCH_WAIT_MS", "5"))
+
+
+def _query_options(model: Embeddings) -> Dict[str, Any]:
+    """embed_documents options that make a batch embed like aembed_query."""
+    inner = getattr(model, "model", model)
+    if isinstance(inner, GoogleGenerativeAIEmbeddings):
+        # Gemini embeds documents as RETRIEVAL_DOCUMENT unless told otherwise
+        return {"task_type": inner.task_type or "RETRIEVAL_QUERY"}
+    return {}
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embedding model whose concurrent aembed_query calls are sent as one batch.
+
+    Identical texts within a batch are embedded once. Other calls go straight to
+    the wrapped model.
+    """
+
+    def __init__(
+        self,
+        model: Embeddings,
+        max_batch_size: int = EMBEDDING_MICRO_BATCH_SIZE,
+        max_wait_ms: float = EMBEDDING_MICRO_BATCH_WAIT_MS,
+        name: str = "embeddings",
+    ):
+        """
+        Args:
+            model: Embedding model making the provider calls
+            max_batch_size: Maximum texts per provider call
+            max_wait_ms: Longest time a text waits for its batch to fill
+            name: Name used in log messages
+        """
+        self.model = model
+        self.query_options = _query_options(model)
+        self.batcher = MicroBatcher(
+            self._embed_queries, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name=name
+        )
+
+    async def _embed_queries(self, texts: List[str]) -> List[List[float]]:
+        unique = list(dict.fromkeys(texts))
+        vectors = dict(zip(unique, await self.model.aembed_documents(unique, **self.query_options)))
+        if len(texts) > 1:
+            logger.debug("Embedding batch sent", batcher=self.batcher.name, texts=len(texts), unique=len(unique))
+        return [list(vectors[text]) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.batcher.submit(text)
+
+    async def aembed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        return await self.model.aembed_documents(texts, **kwargs)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+    def embed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        return self.model.embed_documents(texts, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Texts embedded through the batcher and the provider calls they took."""
+        batches = self.batcher.batches_processed
+        items = self.batcher.items_processed
+        return {
+            "queries": items,
+            "provider_calls": batches,
+            "avg_batch_size": items / batches if batches else 0.0,
+        }
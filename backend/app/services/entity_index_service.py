@@ -0,0 +1,306 @@
+"""
+Clinical Entity Index Service
+Maintains the normalized entity table derived from SOAP note NER context data
+"""
+import re
+import time
+import unicodedata
+import uuid
+from typing import Dict, Any, List, Optional, Iterable
+
+import structlog
+from sqlalchemy import select, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.rag_schemas import (
+    EntityFilter, IndexedEntity, EntitySearchResponse, EntityBackfillResponse
+)
+from app.models.session_soap_notes import SessionSoapNotes
+from app.models.patient_visit_sessions import PatientVisitSessions
+from app.models.clinical_entities import ClinicalEntities
+from app.data.clinical_entities_repository import ClinicalEntitiesRepository
+from app.database.db import async_session_maker
+
+logger = structlog.get_logger(__name__)
+
+# Longest normalized value stored (matches the column size)
+MAX_NORMALIZED_LENGTH = 255
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_SEPARATOR_RE = re.compile(r"[-_/]+")
+_EDGE_PUNCT = " \t\n\r.,;:!?\"'`()[]{}<>"
+
+
+def normalize_entity_value(value: Any) -> str:
+    """Normalize an entity value for indexing and lookup ("Cochlear-Implant " -> "cochlear implant")."""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value)).casefold()
+    text = _SEPARATOR_RE.sub(" ", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip(_EDGE_PUNCT)
+    return text[:MAX_NORMALIZED_LENGTH]
+
+
+def normalize_entity_type(entity_type: Any) -> str:
+    """Normalize an entity type label ("Disease" -> "disease")."""
+    normalized = normalize_entity_value(entity_type).replace(" ", "_")
+    return normalized[:50] or "unknown"
+
+
+class EntityIndexService:
+    """Service for maintaining and querying the normalized clinical entity index."""
+
+    @staticmethod
+    def build_index_rows(
+        note_id: uuid.UUID,
+        patient_id: uuid.UUID,
+        context_data: Optional[Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Convert stored NER context data into deduplicated index rows.
+
+        Args:
+            note_id: SOAP note the entities belong to
+            patient_id: Patient the note belongs to
+            context_data: NER context data as stored on the note
+
+        Returns:
+            List[Dict]: Rows for the clinical_entities table (highest confidence wins per value)
+        """
+        if not isinstance(context_data, dict):
+            return []
+
+        rows: Dict[tuple, Dict[str, Any]] = {}
+        for entity in context_data.get("entities") or []:
+            if not isinstance(entity, dict):
+                continue
+
+            raw_value = entity.get("value") or entity.get("word") or entity.get("text")
+            normalized_value = normalize_entity_value(raw_value)
+            if not normalized_value:
+                continue
+
+            entity_type = normalize_entity_type(entity.get("type") or entity.get("entity_group") or entity.get("entity"))
+            try:
+                confidence = float(entity.get("confidence", entity.get("score", 1.0)))
+            except (TypeError, ValueError):
+                confidence = 1.0
+            confidence = min(max(confidence, 0.0), 1.0)
+
+            key = (entity_type, normalized_value)
+            existing = rows.get(key)
+            if existing is None or confidence > existing["confidence"]:
+                rows[key] = {
+                    "note_id": note_id,
+                    "patient_id": patient_id,
+                    "entity_type": entity_type,
+                    "value": str(raw_value).strip(),
+                    "normalized_value": normalized_value,
+                    "confidence": confidence,
+                }
+
+        return list(rows.values())
+
+    async def index_note(
+        self,
+        session: AsyncSession,
+        note_id: uuid.UUID,
+        context_data: Optional[Dict[str, Any]],
+        patient_id: Optional[uuid.UUID] = None,
+        session_id: Optional[uuid.UUID] = None,
+    ) -> int:
+        """
+        Rebuild the entity index rows for one note inside the caller's transaction.
+
+        Args:
+            session: Open database session (caller commits)
+            note_id: SOAP note ID
+            context_data: NER context data stored on the note
+            patient_id: Patient ID if already known
+            session_id: Visit session ID used to resolve the patient when patient_id is unknown
+
+        Returns:
+            int: Number of entity rows written
+        """
+        if patient_id is None:
+            if session_id is None:
+                stmt = select(SessionSoapNotes.session_id).where(SessionSoapNotes.note_id == note_id)
+                session_id = (await session.execute(stmt)).scalar_one_or_none()
+            if session_id is not None:
+                stmt = select(PatientVisitSessions.patient_id).where(PatientVisitSessions.session_id == session_id)
+                patient_id = (await session.execute(stmt)).scalar_one_or_none()
+
+        if patient_id is None:
+            logger.warning("Cannot index entities for note without patient", note_id=str(note_id))
+            return 0
+
+        rows = self.build_index_rows(note_id, patient_id, context_data)
+        repo = ClinicalEntitiesRepository(session)
+        written = await repo.replace_note_entities(note_id, rows)
+        logger.info("Clinical entities indexed", note_id=str(note_id), entity_count=written)
+        return written
+
+    async def backfill(self, only_missing: bool = True, batch_size: int = 500) -> EntityBackfillResponse:
+        """
+        Build index rows for existing notes, one transaction per batch.
+
+        Notes are walked in note_id order (keyset pagination) so the job can be
+        re-run safely and never holds more than one batch in memory.
+
+        Args:
+            only_missing: Skip notes that already have indexed entities
+            batch_size: Notes per transaction
+
+        Returns:
+            EntityBackfillResponse: Backfill statistics
+        """
+        start_time = time.time()
+        notes_scanned = 0
+        notes_indexed = 0
+        entities_indexed = 0
+        last_note_id = None
+
+        try:
+            while True:
+                async with async_session_maker() as session:
+                    stmt = select(
+                        SessionSoapNotes.note_id,
+                        SessionSoapNotes.context_data,
+                        PatientVisitSessions.patient_id,
+                    ).join(
+                        PatientVisitSessions,
+                        SessionSoapNotes.session_id == PatientVisitSessions.session_id
+                    ).where(
+                        SessionSoapNotes.context_data.is_not(None)
+                    )
+
+                    if only_missing:
+                        stmt = stmt.where(
+                            ~exists().where(ClinicalEntities.note_id == SessionSoapNotes.note_id)
+                        )
+                    if last_note_id is not None:
+                        stmt = stmt.where(SessionSoapNotes.note_id > last_note_id)
+
+                    stmt = stmt.order_by(SessionSoapNotes.note_id).limit(batch_size)
+                    rows = (await session.execute(stmt)).fetchall()
+                    if not rows:
+                        break
+
+                    for note_id, context_data, patient_id in rows:
+                        written = await self.index_note(session, note_id, context_data, patient_id=patient_id)
+                        notes_scanned += 1
+                        if written:
+                            notes_indexed += 1
+                            entities_indexed += written
+
+                    await session.commit()
+                    last_note_id = rows[-1][0]
+
+                logger.info("Entity index backfill batch committed", notes_scanned=notes_scanned, entities_indexed=entities_indexed)
+
+            processing_time = time.time() - start_time
+            logger.info("✅ Entity index backfill completed", notes_indexed=notes_indexed, entities_indexed=entities_indexed)
+
+            return EntityBackfillResponse(
+                success=True,
+                notes_scanned=notes_scanned,
+                notes_indexed=notes_indexed,
+                entities_indexed=entities_indexed,
+                processing_time=processing_time,
+                message=f"Indexed {entities_indexed} entities from {notes_indexed} notes"
+            )
+
+        except Exception as e:
+            processing_time = time.time() - start_time
+            logger.error("❌ Entity index backfill failed", error=str(e))
+            return EntityBackfillResponse(
+                success=False,
+                notes_scanned=notes_scanned,
+                notes_indexed=notes_indexed,
+                entities_indexed=entities_indexed,
+                processing_time=processing_time,
+                message=f"Backfill failed: {str(e)}"
+            )
+
+    async def search(
+        self,
+        value: Optional[str] = None,
+        entity_type: Optional[str] = None,
+        match: str = "exact",
+        patient_id: Optional[uuid.UUID] = None,
+        min_confidence: float = 0.0,
+        limit: int = 100,
+    ) -> EntitySearchResponse:
+        """
+        Search the entity index, e.g. all patients with tinnitus.
+
+        Args:
+            value: Entity value to look up (normalized before matching)
+            entity_type: Optional entity type filter
+            match: exact, prefix or contains
+            patient_id: Optional patient filter
+            min_confidence: Minimum entity confidence
+            limit: Maximum entity rows returned
+
+        Returns:
+            EntitySearchResponse: Matching entities with distinct patients and notes
+        """
+        start_time = time.time()
+        normalized_value = normalize_entity_value(value) if value else ""
+        normalized_type = normalize_entity_type(entity_type) if entity_type else None
+
+        async with async_session_maker() as session:
+            repo = ClinicalEntitiesRepository(session)
+            entities = await repo.search_entities(
+                value=normalized_value or None,
+                entity_type=normalized_type,
+                match=match,
+                patient_id=patient_id,
+                min_confidence=min_confidence,
+                limit=limit,
+            )
+            total_patients = await repo.count_distinct_patients(
+                value=normalized_value or None,
+                entity_type=normalized_type,
+                match=match,
+            ) if patient_id is None else len({e.patient_id for e in entities})
+
+        return EntitySearchResponse(
+            success=True,
+            query=normalized_value,
+            entity_type=normalized_type,
+            entities=[
+                IndexedEntity(
+                    note_id=e.note_id,
+                    patient_id=e.patient_id,
+                    entity_type=e.entity_type,
+                    value=e.value,
+                    normalized_value=e.normalized_value,
+                    confidence=e.confidence,
+                )
+                for e in entities
+            ],
+            patient_ids=list(dict.fromkeys(e.patient_id for e in entities)),
+            note_ids=list(dict.fromkeys(e.note_id for e in entities)),
+            total_patients=total_patients,
+            processing_time=time.time() - start_time,
+            message=f"Found {len(entities)} matching entities",
+        )
+
+    @staticmethod
+    def filter_conditions(filters: Iterable[EntityFilter]) -> list:
+        """Build note_id IN (...) conditions for entity filters (all filters must match)."""
+        conditions = []
+        for entity_filter in filters:
+            value = normalize_entity_value(entity_filter.value)
+            if not value:
+                continue
+            entity_type = normalize_entity_type(entity_filter.entity_type) if entity_filter.entity_type else None
+            conditions.append(
+                SessionSoapNotes.note_id.in_(
+                    ClinicalEntitiesRepository.note_ids_matching(
+                        value, entity_type, entity_filter.match, entity_filter.min_confidence
+                    )
+                )
+            )
+        return conditions
@@ -0,0 +1,169 @@
+"""
+JSON Extraction
+Linear-time extraction of JSON values from LLM output that may contain prose or code fences
+
+The text is scanned once, tracking bracket nesting and string/escape state, to find
+the outermost balanced {...} / [...] spans. Stray brackets in surrounding prose
+cannot swallow the JSON that follows them, and brackets inside JSON strings are
+ignored. Each span is handed to json.loads at most once. When an outer span does
+not parse, only the nested spans after the point where parsing failed are tried
+(json.loads has not read them yet), so each character is parsed at most about
+twice and extraction stays linear even for malformed, deeply nested output. Candidates can be filtered by required keys or
+validated against a Pydantic schema.
+"""
+import json
+import re
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+
+import structlog
+from pydantic import BaseModel
+
+logger = structlog.get_logger(__name__)
+
+_CLOSERS = {"}": "{", "]": "["}
+# Characters that change scanner state; an escape and the character it escapes form one token
+_TOKENS = re.compile(r'\\.|["{}\[\]]', re.DOTALL)
+# Cheap check that a span can be JSON before handing it to json.loads
+_VALUE_START = re.compile(r'[{\[]\s*(?:["}\]\[{\-\d]|true|false|null)')
+
+# A balanced span as (start, end, spans nested directly inside it)
+_Span = Tuple[int, int, list]
+
+
+def _scan_spans(text: str, openers: str) -> List[_Span]:
+    """Outermost balanced bracket spans of text, in order, each with its nested spans."""
+    # Open brackets as (character, offset)
+    stack: List[Tuple[str, int]] = []
+    open_counts = {"{": 0, "[": 0}
+    # Balanced spans, in closing order; a closing span adopts those it contains
+    spans: List[_Span] = []
+    in_string = False
+
+    for match in _TOKENS.finditer(text):
+        char = match.group()
+        i = match.start()
+        if in_string:
+            if char == '"':
+                in_string = False
+        elif char == '"':
+            # Quotes only matter inside brackets; prose quotes are ignored
+            in_string = bool(stack)
+        elif char == "{" or char == "[":
+            stack.append((char, i))
+            open_counts[char] += 1
+        elif char in _CLOSERS:
+            opener = _CLOSERS[char]
+            # Unmatched closers are ignored; otherwise pop down to the matching opener
+            if not open_counts[opener]:
+                continue
+            while True:
+                popped, start = stack.pop()
+                open_counts[popped] -= 1
+                if popped == opener:
+                    break
+            if opener in openers:
+                children = []
+                while spans and spans[-1][0] > start:
+                    children.append(spans.pop())
+                spans.append((start, i + 1, children[::-1]))
+
+    return spans
+
+
+def iter_json_spans(text: str, openers: str = "{[") -> Iterator[Tuple[int, int]]:
+    """
+    Yield the (start, end) offsets of the outermost balanced bracket spans in text.
+
+    Spans open with one of the given opener characters and are yielded in order.
+    A span still open at the end of the text is not yielded, but balanced spans
+    nested inside it are.
+
+    Args:
+        text: Text to scan
+        openers: Opening brackets a span may start with ("{", "[" or both)
+
+    Yields:
+        Tuple[int, int]: Start and end offsets, usable as text[start:end]
+    """
+    for start, end, _ in _scan_spans(text, openers):
+        yield start, end
+
+
+def extract_json(
+    text: str,
+    schema: Optional[Type[BaseModel]] = None,
+    required_keys: Sequence[str] = (),
+    openers: str = "{[",
+) -> Optional[Any]:
+    """
+    Extract the first JSON value from model output that satisfies the constraints.
+
+    The whole text is tried first (the common case of clean output), then each
+    outermost bracket span in order. When a span is not valid JSON (e.g.
+    '[1 {"a": 1} ]'), the spans nested inside it after the parse error are
+    tried in its place.
+
+    Args:
+        text: Raw model output
+        schema: Pydantic schema the value must validate against
+        required_keys: Keys the value must contain (implies a JSON object)
+        openers: "{" to accept objects only, "[" for arrays only, "{[" for both
+
+    Returns:
+        The parsed value (not the schema instance), or None if no candidate qualifies
+    """
+    if not text:
+        return None
+
+    stripped = text.strip()
+    if stripped[:1] in ("{", "[") and stripped[:1] in openers:
+        try:
+            value = json.loads(stripped)
+        except (ValueError, RecursionError):
+            pass
+        else:
+            if _accepts(value, schema, required_keys):
+                return value
+
+    found, value = _first_accepted(text, _scan_spans(text, openers), schema, required_keys)
+    if found:
+        return value
+
+    logger.debug("No JSON value found in model output", text_preview=text[:100])
+    return None
+
+
+def _first_accepted(
+    text: str, spans: Iterable[_Span], schema: Optional[Type[BaseModel]], required_keys: Sequence[str]
+) -> Tuple[bool, Any]:
+    # Depth-first over the span tree, descending only into spans that do not parse
+    pending = list(spans)[::-1]
+    while pending:
+        start, end, children = pending.pop()
+        if _VALUE_START.match(text, start):
+            try:
+                value = json.loads(text[start:end])
+            except json.JSONDecodeError as e:
+                # Spans before the error were already read; the error's own span fails too
+                failed_at = start + e.pos
+                children = [child for child in children if child[0] >= failed_at]
+            except (ValueError, RecursionError):
+                # No position to resume from (e.g. nesting too deep for json.loads)
+                continue
+            else:
+                if _accepts(value, schema, required_keys):
+                    return True, value
+                continue
+        pending.extend(children[::-1])
+    return False, None
+
+
+def _accepts(value: Any, schema: Optional[Type[BaseModel]], required_keys: Sequence[str]) -> bool:
+    if required_keys and not (isinstance(value, dict) and all(key in value for key in required_keys)):
+        return False
+    if schema is not None:
+        try:
+            schema.model_validate(value)
+        except Exception:
+            return False
+    return True
@@ -0,0 +1,337 @@
+"""
+LLM Response Cache
+Content-addressed cache of chat model responses, stored in Postgres or a local SQLite file
+
+Responses are keyed by a SHA-256 of provider, model, temperature, operation,
+prompt-template version, output schema and the full prompt, so reprocessing a
+document (retries, re-runs after a fix, duplicate uploads) replays identical calls
+from the cache instead of paying the provider again. Cache hits skip the rate
+limiter and token usage callbacks.
+
+LLM_CACHE_MODE selects what is cached: "deterministic" (default) only caches calls
+at temperature <= LLM_CACHE_MAX_TEMPERATURE, "all" also caches sampled calls, and
+"off" disables the cache. Entries expire after LLM_CACHE_TTL_SECONDS, and the least
+recently hit entries are evicted once responses exceed LLM_CACHE_MAX_BYTES. Bump
+LLM_CACHE_PROMPT_VERSION (or LLM_CACHE_PROMPT_VERSION_<OPERATION>) to invalidate
+entries whose prompts are unchanged but whose handling changed.
+
+Cached responses contain patient data, so the disk backend writes to APP_DATA_DIR
+(outside the source tree) unless LLM_CACHE_PATH says otherwise.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import warnings
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import structlog
+from langchain_core.load import dumps, loads
+
+logger = structlog.get_logger(__name__)
+
+# langchain_core flags loads() as beta on every call
+warnings.filterwarnings("ignore", message="The function `loads` is in beta")
+
+# off | deterministic | all
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "deterministic").lower()
+# postgres | disk
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "postgres").lower()
+# Local state directory; holds PHI, so keep it out of the source tree and backups of it
+APP_DATA_DIR = os.getenv("APP_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".medinote")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or os.path.join(APP_DATA_DIR, "llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Highest temperature treated as deterministic
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0"))
+# Operations cached (comma-separated, empty for all)
+LLM_CACHE_OPERATIONS = {op.strip() for op in os.getenv("LLM_CACHE_OPERATIONS", "").split(",") if op.strip()}
+# Writes between eviction passes
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "200"))
+LLM_CACHE_PROMPT_VERSION = os.getenv("LLM_CACHE_PROMPT_VERSION", "1")
+
+
+def prompt_version(operation: str) -> str:
+    """Prompt-template version of an operation."""
+    return os.getenv(f"LLM_CACHE_PROMPT_VERSION_{operation.upper()}", LLM_CACHE_PROMPT_VERSION)
+
+
+def prompt_fingerprint(value: Any) -> Any:
+    """JSON-serializable form of a model input: the role and content of each message."""
+    if hasattr(value, "to_messages"):
+        value = value.to_messages()
+    if isinstance(value, list):
+        return [
+            [message.type, message.content] if hasattr(message, "content") and hasattr(message, "type") else message
+            for message in value
+        ]
+    return getattr(value, "content", value)
+
+
+class SQLiteCacheStore:
+    """Cache entries in a local SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache_entries ("
+                "cache_key TEXT PRIMARY KEY, provider TEXT, model TEXT, operation TEXT, response TEXT NOT NULL, "
+                "size_bytes INTEGER NOT NULL, hit_count INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, last_hit_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_entries_last_hit_at ON llm_cache_entries (last_hit_at)")
+            self._conn = conn
+        return self._conn
+
+    def _get(self, cache_keys: List[str]) -> Dict[str, str]:
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            placeholders = ",".join("?" for _ in cache_keys)
+            rows = conn.execute(
+                f"SELECT cache_key, response FROM llm_cache_entries WHERE cache_key IN ({placeholders}) AND expires_at > ?",
+                (*cache_keys, now)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE llm_cache_entries SET hit_count = hit_count + 1, last_hit_at = ? WHERE cache_key = ?",
+                    [(now, row[0]) for row in rows]
+                )
+                conn.commit()
+            return dict(rows)
+
+    def _set(self, row: Dict[str, Any]) -> None:
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache_entries "
+                "(cache_key, provider, model, operation, response, size_bytes, hit_count, created_at, last_hit_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                (row["cache_key"], row["provider"], row["model"], row["operation"], row["response"],
+                 row["size_bytes"], now, now, now + row["ttl_seconds"])
+            )
+            conn.commit()
+
+    def _evict(self, max_bytes: int) -> int:
+        with self._lock:
+            conn = self._connection()
+            deleted = conn.execute("DELETE FROM llm_cache_entries WHERE expires_at <= ?", (time.time(),)).rowcount
+            deleted += conn.execute(
+                "DELETE FROM llm_cache_entries WHERE cache_key IN ("
+                "SELECT cache_key FROM (SELECT cache_key, SUM(size_bytes) OVER "
+                "(ORDER BY last_hit_at DESC, cache_key) AS running_bytes FROM llm_cache_entries) "
+                "WHERE running_bytes > ?)",
+                (max_bytes,)
+            ).rowcount
+            conn.commit()
+            return deleted
+
+    def _stats(self) -> Dict[str, Any]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_cache_entries"
+            ).fetchone()
+            return {"entries": row[0], "size_bytes": row[1]}
+
+    async def get(self, cache_keys: List[str]) -> Dict[str, str]:
+        return await asyncio.to_thread(self._get, cache_keys)
+
+    async def set(self, row: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._set, row)
+
+    async def evict(self, max_bytes: int) -> int:
+        return await asyncio.to_thread(self._evict, max_bytes)
+
+    async def stats(self) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._stats)
+
+
+class PostgresCacheStore:
+    """Cache entries in the llm_cache_entries table."""
+
+    async def get(self, cache_keys: List[str]) -> Dict[str, str]:
+        from app.database.db import async_session_maker
+        from app.data.llm_cache_repository import LLMCacheRepository
+        async with async_session_maker() as session:
+            repo = LLMCacheRepository(session)
+            found = await repo.get_live(cache_keys)
+            for cache_key in found:
+                await repo.mark_hit(cache_key)
+            if found:
+                await session.commit()
+            return found
+
+    async def set(self, row: Dict[str, Any]) -> None:
+        from app.database.db import async_session_maker
+        from app.data.llm_cache_repository import LLMCacheRepository
+        entry = {key: value for key, value in row.items() if key != "ttl_seconds"}
+        entry["expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=row["ttl_seconds"])
+        async with async_session_maker() as session:
+            await LLMCacheRepository(session).upsert(entry)
+            await session.commit()
+
+    async def evict(self, max_bytes: int) -> int:
+        from app.database.db import async_session_maker
+        from app.data.llm_cache_repository import LLMCacheRepository
+        async with async_session_maker() as session:
+            repo = LLMCacheRepository(session)
+            deleted = await repo.delete_expired()
+            deleted += await repo.delete_over_budget(max_bytes)
+            await session.commit()
+            return deleted
+
+    async def stats(self) -> Dict[str, Any]:
+        from app.database.db import async_session_maker
+        from app.data.llm_cache_repository import LLMCacheRepository
+        async with async_session_maker() as session:
+            return await LLMCacheRepository(session).stats()
+
+
+class LLMResponseCache:
+    """Looks up and stores chat model responses; cache errors never fail a model call."""
+
+    def __init__(
+        self,
+        mode: str = LLM_CACHE_MODE,
+        backend: str = LLM_CACHE_BACKEND,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+    ):
+        if mode not in ("off", "deterministic", "all"):
+            logger.warning("Unknown LLM_CACHE_MODE, disabling the LLM response cache", mode=mode)
+            mode = "off"
+        self.mode = mode
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._store: Optional[Any] = None
+        self._writes_since_eviction = 0
+        self.counters = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0, "errors": 0}
+
+    @property
+    def store(self) -> Any:
+        if self._store is None:
+            self._store = SQLiteCacheStore(LLM_CACHE_PATH) if self.backend == "disk" else PostgresCacheStore()
+            logger.info("LLM response cache enabled", backend=self.backend, mode=self.mode)
+        return self._store
+
+    def enabled_for(self, operation: str, temperature: Optional[float]) -> bool:
+        """Whether calls of an operation at a temperature are cached."""
+        if self.mode == "off" or (LLM_CACHE_OPERATIONS and operation not in LLM_CACHE_OPERATIONS):
+            return False
+        if self.mode == "all":
+            return True
+        return temperature is not None and temperature <= LLM_CACHE_MAX_TEMPERATURE
+
+    @staticmethod
+    def key(
+        provider: str,
+        model: str,
+        temperature: Optional[float],
+        operation: str,
+        prompt: Any,
+        variant: str = "",
+        options: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Content address of a call.
+
+        Args:
+            provider: Provider name
+            model: Model name
+            temperature: Sampling temperature
+            operation: Operation name (soap, judge, ner, ...)
+            prompt: Model input (prompt value, messages or text)
+            variant: Identity of the output handling (e.g. structured output schema)
+            options: Extra call options that change the response
+
+        Returns:
+            str: Hex SHA-256 cache key
+        """
+        material = json.dumps({
+            "provider": provider,
+            "model": model,
+            "temperature": temperature,
+            "operation": operation,
+            "prompt_version": prompt_version(operation),
+            "variant": variant,
+            "options": options or {},
+            "prompt": prompt_fingerprint(prompt),
+        }, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def lookup(self, cache_keys: List[str]) -> Optional[Any]:
+        """Return the cached response of the first key that has one, or None."""
+        try:
+            found = await self.store.get(cache_keys)
+            for cache_key in cache_keys:
+                if cache_key in found:
+                    self.counters["hits"] += 1
+                    return loads(found[cache_key], allowed_objects="messages")
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("LLM cache lookup failed", error=str(e))
+            return None
+        self.counters["misses"] += 1
+        return None
+
+    async def save(self, cache_key: str, response: Any, provider: str, model: str, operation: str) -> None:
+        """Store a response unless it is empty or carries a parsing error."""
+        if response is None or (isinstance(response, dict) and response.get("parsing_error") is not None):
+            return
+        try:
+            serialized = dumps(response)
+            if '"not_implemented"' in serialized:
+                return
+            await self.store.set({
+                "cache_key": cache_key,
+                "provider": provider,
+                "model": model,
+                "operation": operation,
+                "response": serialized,
+                "size_bytes": len(serialized.encode("utf-8")),
+                "ttl_seconds": self.ttl_seconds,
+            })
+            self.counters["writes"] += 1
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction >= LLM_CACHE_EVICT_EVERY:
+                self._writes_since_eviction = 0
+                self.counters["evicted"] += await self.store.evict(self.max_bytes)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning("LLM cache write failed", error=str(e))
+
+    async def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this process and the store's size."""
+        lookups = self.counters["hits"] + self.counters["misses"]
+        stats: Dict[str, Any] = {
+            "mode": self.mode,
+            "backend": self.backend,
+            **self.counters,
+            "hit_ratio": self.counters["hits"] / lookups if lookups else 0.0,
+        }
+        if self.mode != "off":
+            try:
+                stats.update(await self.store.stats())
+            except Exception as e:
+                logger.warning("LLM cache stats unavailable", error=str(e))
+        return stats
+
+
+# Shared by every chat model within the process
+llm_cache = LLMResponseCache()
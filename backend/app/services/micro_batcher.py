@@ -0,0 +1,110 @@
+"""
+Micro-Batcher
+Coalesces concurrent single-item async calls into batched calls
+"""
+import asyncio
+from typing import Awaitable, Callable, Generic, List, Optional, Set, Tuple, TypeVar
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collect items submitted concurrently and process them in batches.
+
+    A batch is flushed when it reaches max_batch_size or max_wait_ms after its first
+    item arrived, whichever comes first. process_batch receives the items in
+    submission order and must return one result per item in the same order; if it
+    raises, every caller in that batch receives the exception; if the batch task is
+    cancelled, every caller's wait is cancelled.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[T]], Awaitable[List[R]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 50.0,
+        name: str = "micro_batcher",
+    ):
+        """
+        Args:
+            process_batch: Coroutine function processing a list of items
+            max_batch_size: Maximum items per batch
+            max_wait_ms: Longest time an item waits for a batch to fill
+            name: Name used in log messages
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches_processed = 0
+        self.items_processed = 0
+
+    async def submit(self, item: T) -> R:
+        """
+        Submit one item and wait for its result.
+
+        Args:
+            item: Item to process
+
+        Returns:
+            The item's result from process_batch
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            # Drop callers that gave up while waiting
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if batch:
+                task = asyncio.create_task(self._run(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future]]) -> None:
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"{self.name} returned {len(results)} results for {len(batch)} items")
+        except asyncio.CancelledError:
+            # Cancelled (e.g. at shutdown): cancel the callers too instead of leaving them waiting
+            for _, future in batch:
+                future.cancel()
+            raise
+        except BaseException as e:
+            logger.error("❌ Batch processing failed", batcher=self.name, batch_size=len(batch), error=str(e))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        self.batches_processed += 1
+        self.items_processed += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
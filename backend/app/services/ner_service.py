@@ -6,13 +6,19 @@ import os
 import time
 from typing import Dict, Any, List
 import structlog
-import json
-import re
 from typing import Optional
 
 from langchain_core.runnables import RunnableLambda
 
-from app.schemas.ner_schemas import NEROutput, Entity, NERRequest
+from app.schemas.ner_schemas import NEROutput, Entity, NERRequest, NERLLMOutput
+from app.services.prompt_budget import token_usage
+from app.services.ai_provider_utils import STRUCTURED_OUTPUT_ENABLED, provider_clients, gemini_response_schema
+from app.services.json_extraction import extract_json
+from app.services.provider_gateway import get_provider_limiter, estimate_call_tokens
+from app.services.llm_response_cache import llm_cache
+
+# OpenAI models that rejected a json_schema response format; they get plain requests from then on
+_JSON_SCHEMA_UNSUPPORTED_MODELS = set()
 
 logger = structlog.get_logger(__name__)
 
@@ -44,15 +50,21 @@ class NERService:
         try:
             # Create a RunnableLambda wrapper depending on backend (LLM only)
             if self.backend == "openai":
-                self.ner_chain = RunnableLambda(lambda x: self._extract_entities_via_openai(x["text"]))
+                self.ner_chain = RunnableLambda(self._run_openai_chain)
             elif self.backend == "gemini":
-                self.ner_chain = RunnableLambda(lambda x: self._extract_entities_via_gemini(x["text"]))
+                self.ner_chain = RunnableLambda(self._run_gemini_chain)
             else:
                 raise RuntimeError(f"Unsupported NER backend: {self.backend}")
             logger.info("✅ NER chain constructed successfully", backend=self.backend)
         except Exception as e:
             logger.error("❌ Failed to setup NER chain", error=str(e))
     
+    async def _run_openai_chain(self, inputs: Dict[str, Any]) -> list:
+        return await self._extract_entities_via_openai(inputs["text"])
+    
+    async def _run_gemini_chain(self, inputs: Dict[str, Any]) -> list:
+        return await self._extract_entities_via_gemini(inputs["text"])
+    
     async def extract_entities(self, request: NERRequest) -> NEROutput:
         """
         Extract biomedical entities from clinical text.
@@ -71,9 +83,9 @@ class NERService:
 
             # Dispatch to LLM backend
             if self.backend == "openai":
-                raw_entities = self._extract_entities_via_openai(request.text)
+                raw_entities = await self._extract_entities_via_openai(request.text)
             elif self.backend == "gemini":
-                raw_entities = self._extract_entities_via_gemini(request.text)
+                raw_entities = await self._extract_entities_via_gemini(request.text)
             else:
                 raise RuntimeError(f"Unsupported NER backend: {self.backend}")
             
@@ -151,22 +163,46 @@ class NERService:
             "processing_time": ner_output.processing_time
         }
 
+    def build_context_data(self, text: str, raw_entities: list, processing_time: float = 0.0) -> Dict[str, Any]:
+        """
+        Build SOAP context data from entities extracted by another LLM call.
+        
+        Used by single-pass SOAP generation, where the entities come back in the
+        same response as the SOAP sections.
+        
+        Args:
+            text: Clinical text the entities were extracted from
+            raw_entities: Entity dicts as returned by the model
+            processing_time: Time spent producing the entities
+            
+        Returns:
+            Dict in the same shape as extract_context_data
+        """
+        entities = []
+        for ent in self._normalize_and_validate_entities(text, [e for e in raw_entities if isinstance(e, dict)]):
+            try:
+                entities.append(Entity(
+                    type=ent["type"],
+                    value=ent["value"],
+                    confidence=min(max(ent["confidence"], 0.0), 1.0),
+                    start_pos=ent["start"],
+                    end_pos=ent["end"]
+                ))
+            except Exception as e:
+                logger.warning("Invalid entity format", entity=ent, error=str(e))
+        
+        return {
+            "entities": [entity.dict() for entity in entities],
+            "total_entities": len(entities),
+            "processing_time": processing_time
+        }
+
     # -------------------------------
     # LLM backends (OpenAI / Gemini)
     # -------------------------------
     def _safe_parse_json(self, text: str) -> Optional[dict]:
-        """Try to robustly parse JSON from model output."""
-        try:
-            return json.loads(text)
-        except Exception:
-            # Try to extract the first {...} block
-            m = re.search(r"\{.*\}", text, re.DOTALL)
-            if m:
-                try:
-                    return json.loads(m.group(0))
-                except Exception:
-                    return None
-            return None
+        """Try to robustly parse the `entities` JSON object from model output."""
+        return extract_json(text or "", required_keys=("entities",), openers="{")
 
     def _normalize_and_validate_entities(self, text: str, entities_raw: list) -> list:
         """Normalize LLM output entities into a uniform dict shape and validate indices.
@@ -178,8 +214,8 @@ class NERService:
             try:
                 etype = ent.get("type") or ent.get("entity") or ent.get("entity_group") or "unknown"
                 value = ent.get("value") or ent.get("word") or ent.get("entity") or ""
-                start = ent.get("start")
-                end = ent.get("end")
+                start = ent.get("start", ent.get("start_pos"))
+                end = ent.get("end", ent.get("end_pos"))
                 conf = ent.get("confidence") or ent.get("score") or 1.0
 
                 # If model didn't provide start/end, try to find the substring in the text
@@ -214,7 +250,7 @@ class NERService:
                 continue
         return normalized
 
-    def _extract_entities_via_openai(self, text: str) -> list:
+    async def _extract_entities_via_openai(self, text: str) -> list:
         """Call OpenAI-style LLM to extract entities using new openai>=1.0.0 API.
 
         This function expects OPENAI_API_KEY in env and an installed OpenAI client.
@@ -223,28 +259,71 @@ class NERService:
         # Build prompt with instructions and a minimal example
         system = (
             "You are a biomedical entity extractor. Return JSON only with a top-level `entities` list. "
-            "Each entity must contain: type, value, start, end, confidence. "
+            "Each entity must contain: type, value, start_pos, end_pos, confidence. "
             "Use exact substring values and 0-based character indices."
         )
         user_prompt = f"Text: '''{text}'''\n\nReturn JSON with field `entities`."
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user_prompt},
+        ]
 
         try:
-            # Use the new openai>=1.0.0 API
-            from openai import OpenAI
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            # Use the shared async openai>=1.0.0 client so the event loop is not blocked
+            from openai import BadRequestError
+            client = provider_clients.openai_client()
+            model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+            # Rate limits, retries and circuit breaker shared with every other OpenAI call
+            limiter = get_provider_limiter("openai")
+            tokens = estimate_call_tokens(system + user_prompt)
+            use_schema = STRUCTURED_OUTPUT_ENABLED and model not in _JSON_SCHEMA_UNSUPPORTED_MODELS
             
-            # Use the correct method: chat.completions.create
-            resp = client.chat.completions.create(
-                model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                messages=[
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.0,
-            )
+            # Reprocessed documents are answered from the LLM response cache
+            content = None
+            cache_key = None
+            if llm_cache.enabled_for("ner", 0.0):
+                cache_key = llm_cache.key(
+                    "openai", model, 0.0, "ner", messages, variant="json_schema" if use_schema else ""
+                )
+                content = await llm_cache.lookup([cache_key])
             
-            # Extract content from the new API response format
-            content = resp.choices[0].message.content
+            if content is None:
+                # Use the correct method: chat.completions.create
+                call_start = time.time()
+                if use_schema:
+                    try:
+                        resp = await limiter.run(lambda: client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=0.0,
+                            response_format={
+                                "type": "json_schema",
+                                "json_schema": {"name": "ner_output", "schema": NERLLMOutput.model_json_schema()},
+                            },
+                        ), tokens)
+                    except BadRequestError as e:
+                        # Model without JSON schema support: parse free text, now and for later calls
+                        logger.warning("OpenAI structured output unsupported, using text parsing", model=model, error=str(e))
+                        resp = await limiter.run(
+                            lambda: client.chat.completions.create(model=model, messages=messages, temperature=0.0), tokens
+                        )
+                        _JSON_SCHEMA_UNSUPPORTED_MODELS.add(model)
+                        if cache_key:
+                            cache_key = llm_cache.key("openai", model, 0.0, "ner", messages)
+                else:
+                    resp = await limiter.run(
+                        lambda: client.chat.completions.create(model=model, messages=messages, temperature=0.0), tokens
+                    )
+            
+                # Extract content from the new API response format
+                content = resp.choices[0].message.content
+                if resp.usage:
+                    token_usage.record(
+                        "ner", resp.usage.prompt_tokens, resp.usage.completion_tokens,
+                        latency_seconds=time.time() - call_start
+                    )
+                if cache_key:
+                    await llm_cache.save(cache_key, content, "openai", model, "ner")
 
         except Exception as e:
             logger.error("OpenAI LLM call failed", error=str(e))
@@ -256,37 +335,63 @@ class NERService:
         normalized = self._normalize_and_validate_entities(text, parsed["entities"])
         return normalized
 
-    def _extract_entities_via_gemini(self, text: str) -> list:
+    async def _extract_entities_via_gemini(self, text: str) -> list:
         """Call Google Gemini to extract entities using google-generativeai library.
 
         You must configure Google credentials (GOOGLE_API_KEY environment variable).
         """
         try:
-            import google.generativeai as genai
-            
-            # Configure the API key
-            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-            
             # Get the model name from environment or use default
             model_name = os.getenv("GOOGLE_MODEL") or os.getenv("AI_SERVICE_GEMINI_MODEL") or os.getenv("GEMINI_MODEL") or "gemini-1.5-flash-latest"
             
-            # Create the model
-            model = genai.GenerativeModel(model_name)
+            # Shared model; the SDK is configured with the API key once per process
+            model = provider_clients.gemini_model(model_name)
             
             # Build the prompt
             system_instruction = (
                 "You are a biomedical entity extractor. Return JSON only with a top-level `entities` list. "
-                "Each entity must contain: type, value, start, end, confidence. "
+                "Each entity must contain: type, value, start_pos, end_pos, confidence. "
                 "Use exact substring values and 0-based character indices."
             )
             user_prompt = f"{system_instruction}\n\nText: '''{text}'''\n\nReturn JSON with field `entities`."
             
-            # Generate content
-            response = model.generate_content(user_prompt)
+            content = None
+            cache_key = None
+            if llm_cache.enabled_for("ner", 0.0):
+                cache_key = llm_cache.key(
+                    "google", model_name, 0.0, "ner", user_prompt, variant="response_schema" if STRUCTURED_OUTPUT_ENABLED else ""
+                )
+                content = await llm_cache.lookup([cache_key])
+            
+            if content is None:
+                # Generate content; the response schema keeps it free of prose and fences
+                call_start = time.time()
+                limiter = get_provider_limiter("google")
+                if STRUCTURED_OUTPUT_ENABLED:
+                    response = await limiter.run(lambda: model.generate_content_async(
+                        user_prompt,
+                        generation_config={
+                            "response_mime_type": "application/json",
+                            "response_schema": gemini_response_schema(NERLLMOutput),
+                        }
+                    ), estimate_call_tokens(user_prompt))
+                else:
+                    response = await limiter.run(
+                        lambda: model.generate_content_async(user_prompt), estimate_call_tokens(user_prompt)
+                    )
             
-            # Extract the text content
-            content = response.text
+                # Extract the text content
+                content = response.text
+                usage = getattr(response, "usage_metadata", None)
+                if usage:
+                    token_usage.record(
+                        "ner", usage.prompt_token_count, usage.candidates_token_count,
+                        latency_seconds=time.time() - call_start
+                    )
+                if cache_key:
+                    await llm_cache.save(cache_key, content, "google", model_name, "ner")
             
+
         except Exception as e:
             logger.error("Gemini LLM call failed", error=str(e))
             return []
@@ -0,0 +1,319 @@
+"""
+Patient Vector Service
+Maintains recency-weighted patient-level vectors and serves "patients like this one" search
+"""
+import os
+import math
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.rag_schemas import (
+    SimilarPatient, SimilarPatientNote, SimilarPatientsResponse, PatientVectorRebuildResponse
+)
+from app.models.patients import Patients
+from app.models.session_soap_notes import SessionSoapNotes
+from app.models.patient_visit_sessions import PatientVisitSessions
+from app.data.patient_vectors_repository import PatientVectorsRepository
+from app.database.db import async_session_maker
+
+logger = structlog.get_logger(__name__)
+
+# Weights are exp(days since this epoch / tau), so newer visits dominate the centroid.
+# They are handled as logs: the weights themselves overflow a float for short half-lives.
+WEIGHT_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def _unit(vector: Any) -> np.ndarray:
+    """Return the embedding as a float64 unit vector."""
+    array = np.asarray(vector, dtype=np.float64)
+    norm = np.linalg.norm(array)
+    return array / norm if norm > 0 else array
+
+
+class PatientVectorService:
+    """Service for patient-level vectors built from note embeddings."""
+
+    def __init__(self):
+        half_life_days = float(os.getenv("PATIENT_VECTOR_HALF_LIFE_DAYS", "365"))
+        self.tau_days = half_life_days / math.log(2)
+
+    def note_log_weight(self, visit_date: Optional[datetime]) -> float:
+        """
+        Natural log of a note's recency weight.
+
+        Weights grow with visit date instead of decaying with age, so existing
+        contributions never need to be rescaled when time passes.
+        """
+        if visit_date is None:
+            visit_date = datetime.now(timezone.utc)
+        if visit_date.tzinfo is None:
+            visit_date = visit_date.replace(tzinfo=timezone.utc)
+        days = (visit_date - WEIGHT_EPOCH).total_seconds() / 86400.0
+        return days / self.tau_days
+
+    async def apply_note_embedding(
+        self,
+        session: AsyncSession,
+        note_id: uuid.UUID,
+        new_embedding: Any,
+        old_embedding: Any = None,
+        patient_id: Optional[uuid.UUID] = None,
+        visit_date: Optional[datetime] = None,
+    ) -> None:
+        """
+        Fold a newly stored note embedding into its patient's vector in O(1).
+
+        The previous embedding of a re-embedded note is subtracted first, with the
+        weight it was added with, but only if the note is marked as folded (notes
+        embedded before patient vectors existed were never added). Only the note's
+        row and the patient's vector row are touched. Runs in the caller's
+        transaction and locks the patient row; caller commits.
+
+        Args:
+            session: Open database session
+            note_id: SOAP note ID
+            new_embedding: Embedding just written to the note
+            old_embedding: Embedding the note had before, if any
+            patient_id: Patient ID if already known
+            visit_date: Visit date if already known
+        """
+        note = await session.get(SessionSoapNotes, note_id)
+        if note is None:
+            logger.warning("Cannot update patient vector for unknown note", note_id=str(note_id))
+            return
+        if patient_id is None or visit_date is None:
+            stmt = select(PatientVisitSessions.patient_id, PatientVisitSessions.visit_date).where(
+                PatientVisitSessions.session_id == note.session_id
+            )
+            patient_id, visit_date = (await session.execute(stmt)).one()
+
+        folded_log_weight = note.vector_log_weight
+        if folded_log_weight is not None and old_embedding is None:
+            # Its current contribution is unknown, so it cannot be replaced; rebuild() repairs this
+            logger.warning("Patient vector already contains note, skipping update", note_id=str(note_id))
+            return
+
+        log_weight = self.note_log_weight(visit_date)
+        repo = PatientVectorsRepository(session)
+        patient_vector = await repo.get_for_update(patient_id)
+
+        # The mean and the log of the total weight are kept, so no weight is ever materialized
+        mean = np.asarray(patient_vector.embedding, dtype=np.float64) if patient_vector.embedding is not None else None
+        log_total = float(patient_vector.log_total_weight or 0.0)
+        note_count = patient_vector.note_count
+        # An empty mean with notes counted, or (below) a note outweighing the rest, is rounding drift
+        drifted = mean is None and note_count > 0
+
+        if folded_log_weight is not None and not drifted:
+            if note_count <= 1:
+                mean, note_count = None, 0
+            elif folded_log_weight >= log_total:
+                drifted = True
+            else:
+                remaining = log_total + math.log1p(-math.exp(folded_log_weight - log_total))
+                mean = (
+                    mean * math.exp(log_total - remaining)
+                    - _unit(old_embedding) * math.exp(folded_log_weight - remaining)
+                )
+                log_total = remaining
+                note_count -= 1
+
+        if drifted:
+            # Recompute from the notes instead, so the vector and the folded marks stay in step
+            logger.warning("Patient vector drifted, rebuilding", patient_id=str(patient_id), note_id=str(note_id))
+            await self._rebuild_patients(repo, [patient_id])
+            return
+        note.vector_log_weight = None
+
+        if new_embedding is not None:
+            if mean is None:
+                mean = _unit(new_embedding)
+                log_total = log_weight
+            else:
+                combined = float(np.logaddexp(log_total, log_weight))
+                mean = mean * math.exp(log_total - combined) + _unit(new_embedding) * math.exp(log_weight - combined)
+                log_total = combined
+            note_count += 1
+            note.vector_log_weight = log_weight
+
+        if mean is None:
+            patient_vector.embedding = None
+            patient_vector.log_total_weight = 0.0
+            patient_vector.note_count = 0
+        else:
+            patient_vector.embedding = mean.astype(np.float32)
+            patient_vector.log_total_weight = log_total
+            patient_vector.note_count = note_count
+
+        logger.info("Patient vector updated", patient_id=str(patient_id), note_id=str(note_id), note_count=note_count)
+
+    async def _rebuild_patients(self, repo: PatientVectorsRepository, patient_ids: List[uuid.UUID]) -> Tuple[int, int]:
+        """
+        Recompute the patients' vectors from their embedded notes and mark those notes as folded.
+
+        Returns:
+            Tuple[int, int]: Patients with notes and notes included
+        """
+        notes_by_patient: Dict[uuid.UUID, list] = {pid: [] for pid in patient_ids}
+        for pid, note_id, _, visit_date, embedding in await repo.embedded_notes(patient_ids):
+            notes_by_patient[pid].append((note_id, visit_date, embedding))
+
+        folded: Dict[uuid.UUID, float] = {}
+        for pid, notes in notes_by_patient.items():
+            patient_vector = await repo.get_for_update(pid)
+            if not notes:
+                patient_vector.embedding = None
+                patient_vector.log_total_weight = 0.0
+                patient_vector.note_count = 0
+                continue
+            log_weights = np.array([self.note_log_weight(visit_date) for _, visit_date, _ in notes])
+            # Scale by the largest weight so exp() stays in range
+            weights = np.exp(log_weights - log_weights.max())
+            vectors = np.vstack([_unit(embedding) for _, _, embedding in notes])
+            patient_vector.embedding = (weights @ vectors / weights.sum()).astype(np.float32)
+            patient_vector.log_total_weight = float(log_weights.max() + math.log(weights.sum()))
+            patient_vector.note_count = len(notes)
+            folded.update((note_id, float(log_weight)) for (note_id, _, _), log_weight in zip(notes, log_weights))
+
+        await repo.set_folded_log_weights(patient_ids, folded)
+        return sum(1 for notes in notes_by_patient.values() if notes), len(folded)
+
+    async def rebuild(self, patient_id: Optional[uuid.UUID] = None, batch_size: int = 100) -> PatientVectorRebuildResponse:
+        """
+        Recompute patient vectors from all embedded notes (backfill and drift repair).
+
+        Args:
+            patient_id: Rebuild only this patient
+            batch_size: Patients per transaction
+
+        Returns:
+            PatientVectorRebuildResponse: Rebuild statistics
+        """
+        start_time = time.time()
+        patients_rebuilt = 0
+        notes_included = 0
+        last_patient_id = None
+
+        try:
+            while True:
+                async with async_session_maker() as session:
+                    repo = PatientVectorsRepository(session)
+                    if patient_id is not None:
+                        patient_ids = [patient_id] if last_patient_id is None else []
+                    else:
+                        patient_ids = await repo.patients_with_embedded_notes(last_patient_id, batch_size)
+                    if not patient_ids:
+                        break
+
+                    rebuilt, included = await self._rebuild_patients(repo, patient_ids)
+                    patients_rebuilt += rebuilt
+                    notes_included += included
+
+                    await session.commit()
+                    last_patient_id = patient_ids[-1]
+
+            processing_time = time.time() - start_time
+            logger.info("✅ Patient vectors rebuilt", patients_rebuilt=patients_rebuilt, notes_included=notes_included)
+            return PatientVectorRebuildResponse(
+                success=True,
+                patients_rebuilt=patients_rebuilt,
+                notes_included=notes_included,
+                processing_time=processing_time,
+                message=f"Rebuilt {patients_rebuilt} patient vectors from {notes_included} notes"
+            )
+
+        except Exception as e:
+            logger.error("❌ Patient vector rebuild failed", error=str(e))
+            return PatientVectorRebuildResponse(
+                success=False,
+                patients_rebuilt=patients_rebuilt,
+                notes_included=notes_included,
+                processing_time=time.time() - start_time,
+                message=f"Rebuild failed: {str(e)}"
+            )
+
+    async def find_similar_patients(
+        self,
+        patient_id: uuid.UUID,
+        top_k: int = 10,
+        notes_per_patient: int = 3,
+    ) -> SimilarPatientsResponse:
+        """
+        Find the patients whose vectors are nearest to the given patient's.
+
+        Args:
+            patient_id: Reference patient ID
+            top_k: Number of patients to return
+            notes_per_patient: Contributing notes reported per patient
+
+        Returns:
+            SimilarPatientsResponse: Nearest patients with their top contributing notes
+        """
+        start_time = time.time()
+
+        async with async_session_maker() as session:
+            repo = PatientVectorsRepository(session)
+            reference = await repo.get_by_patient(patient_id)
+            if reference is None or reference.embedding is None:
+                return SimilarPatientsResponse(
+                    success=False,
+                    patient_id=patient_id,
+                    processing_time=time.time() - start_time,
+                    message="Patient has no embedded notes"
+                )
+
+            neighbors = await repo.nearest(reference.embedding, patient_id, top_k)
+            neighbor_ids = [vector.patient_id for vector, _ in neighbors]
+
+            notes_by_patient: Dict[uuid.UUID, list] = {pid: [] for pid in neighbor_ids}
+            for pid, note_id, session_id, visit_date, embedding in await repo.embedded_notes(neighbor_ids):
+                notes_by_patient[pid].append((note_id, session_id, visit_date, embedding))
+
+            names_result = await session.execute(select(Patients.id, Patients.name).where(Patients.id.in_(neighbor_ids)))
+            names = {row[0]: row[1] for row in names_result.fetchall()}
+
+        query = _unit(reference.embedding)
+        similar_patients = []
+        for vector, distance in neighbors:
+            notes = notes_by_patient.get(vector.patient_id, [])
+            contributing_notes = []
+            if notes:
+                log_weights = np.array([self.note_log_weight(visit_date) for _, _, visit_date, _ in notes])
+                weights = np.exp(log_weights - log_weights.max())
+                similarities = np.vstack([_unit(embedding) for _, _, _, embedding in notes]) @ query
+                contributions = weights / weights.sum() * similarities
+                for index in np.argsort(-contributions)[:notes_per_patient]:
+                    note_id, session_id, visit_date, _ = notes[index]
+                    contributing_notes.append(SimilarPatientNote(
+                        note_id=note_id,
+                        session_id=session_id,
+                        visit_date=visit_date,
+                        similarity=float(similarities[index]),
+                        contribution=float(contributions[index])
+                    ))
+
+            similar_patients.append(SimilarPatient(
+                patient_id=vector.patient_id,
+                patient_name=names.get(vector.patient_id),
+                similarity=1 - distance,
+                note_count=vector.note_count,
+                contributing_notes=contributing_notes
+            ))
+
+        processing_time = time.time() - start_time
+        logger.info("Patient similarity search completed", patient_id=str(patient_id), results=len(similar_patients))
+
+        return SimilarPatientsResponse(
+            success=True,
+            patient_id=patient_id,
+            similar_patients=similar_patients,
+            processing_time=processing_time,
+            message=f"Found {len(similar_patients)} similar patients"
+        )
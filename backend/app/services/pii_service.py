@@ -3,6 +3,7 @@ PII (Personally Identifiable Information) Detection and Anonymization Service
 Uses Microsoft Presidio for PII detection and anonymization
 """
 
+import asyncio
 import structlog
 from typing import List, Optional, Tuple
 from presidio_analyzer import AnalyzerEngine
@@ -114,7 +115,9 @@ class PIIService:
             
             # Run Presidio analyzer
             logger.info("🔊 jaidev: PII QUICK ANALYZER RUN")
-            analyzer_results = self.analyzer.analyze(text=text, entities=target_entities, language='en')
+            analyzer_results = await asyncio.to_thread(
+                self.analyzer.analyze, text=text, entities=target_entities, language='en'
+            )
             logger.info("🔊 jaidev: PII QUICK ANALYZER DONE", results_count=len(analyzer_results))
             
             # Check if any PII was detected
@@ -125,7 +128,8 @@ class PIIService:
             logger.info("🔊 jaidev: PII QUICK ANONYMIZER RUN")
             
             # Run Presidio anonymizer
-            anonymized_result = self.anonymizer.anonymize(
+            anonymized_result = await asyncio.to_thread(
+                self.anonymizer.anonymize,
                 text=text,
                 analyzer_results=analyzer_results
             )
@@ -170,7 +174,8 @@ class PIIService:
             
             # Run Presidio analyzer
             logger.info("🔊 jaidev: PII ANALYZE ANALYZER RUN")
-            analyzer_results = self.analyzer.analyze(
+            analyzer_results = await asyncio.to_thread(
+                self.analyzer.analyze,
                 text=text,
                 language="en",
                 entities=target_entities,
@@ -0,0 +1,189 @@
+"""
+Pipeline Estimator
+Predicts token usage and latency of SOAP generation before any model is called
+
+Token counts come from the actual prompts and the input text; output sizes and latencies
+come from the recent per-stage window of the token usage tracker (persisted across
+restarts by StageHistoryService), with built-in defaults for stages that have never run.
+"""
+import math
+from typing import Optional, Tuple
+
+import structlog
+
+from app.schemas.soap_schemas import PipelineEstimateRequest, PipelineEstimateResponse, StageEstimate
+from app.services.prompt_budget import token_usage, INPUT_TOKEN_BUDGET, CONTEXT_TOKEN_BUDGET
+from app.services.text_chunking import count_tokens, split_into_chunks
+from app.services.soap_generation_service import (
+    MAX_REGENERATIONS, MAP_CHUNK_TOKENS, MAP_CHUNK_OVERLAP_TOKENS, MAP_MAX_CONCURRENCY
+)
+
+logger = structlog.get_logger(__name__)
+
+# NER instructions are built inline by NERService rather than from a prompt template
+NER_PROMPT_TOKENS = 80
+
+# Output sizes used until a stage has history
+DEFAULT_SOAP_OUTPUT_TOKENS = 500
+DEFAULT_JUDGE_OUTPUT_TOKENS = 300
+DEFAULT_NER_OUTPUT_RATIO = 0.5
+DEFAULT_MAP_OUTPUT_RATIO = 0.35
+# Share of NER output left after compact_context drops positions and confidences
+COMPACT_CONTEXT_RATIO = 0.4
+
+# Latency model used until a stage has history
+DEFAULT_CALL_OVERHEAD_SECONDS = 0.8
+DEFAULT_INPUT_TOKENS_PER_SECOND = 4000.0
+DEFAULT_OUTPUT_TOKENS_PER_SECOND = 60.0
+DEFAULT_PII_TOKENS_PER_SECOND = 20000.0
+DEFAULT_EMBEDDING_SECONDS = 0.3
+
+
+class PipelineEstimator:
+    """Estimates per-stage tokens and latency for a SOAP generation request."""
+
+    def __init__(self, soap_service):
+        """
+        Args:
+            soap_service: SOAPGenerationService whose prompts and pipeline choice are estimated
+        """
+        self.soap_service = soap_service
+
+    @staticmethod
+    def _prompt_tokens(prompt) -> int:
+        """Tokens in a chat prompt's fixed template text."""
+        if prompt is None:
+            return 0
+        return sum(
+            count_tokens(message.prompt.template)
+            for message in prompt.messages
+            if hasattr(message, "prompt") and hasattr(message.prompt, "template")
+        )
+
+    @staticmethod
+    def _output_tokens(stage: str, default: float) -> Tuple[int, bool]:
+        """Recent average output tokens of a stage, or the default."""
+        history = token_usage.recent_stats(stage)
+        if history and history["output_tokens"]:
+            return int(history["avg_output_tokens"]), True
+        return int(default), False
+
+    @staticmethod
+    def _call_latency(stage: str, input_tokens: int, output_tokens: int) -> Tuple[float, bool]:
+        """
+        Latency of one call: the stage's recent average scaled by output size,
+        or the default overhead + prefill + decode model.
+        """
+        history = token_usage.recent_stats(stage)
+        if history and history["avg_latency_seconds"] is not None:
+            latency = history["avg_latency_seconds"]
+            if history["avg_output_tokens"] and output_tokens:
+                latency *= max(0.25, output_tokens / history["avg_output_tokens"])
+            return latency, True
+        return (
+            DEFAULT_CALL_OVERHEAD_SECONDS
+            + input_tokens / DEFAULT_INPUT_TOKENS_PER_SECOND
+            + output_tokens / DEFAULT_OUTPUT_TOKENS_PER_SECOND
+        ), False
+
+    def _llm_stage(self, stage: str, calls: float, input_tokens: int, output_tokens: int, waves: Optional[int] = None) -> StageEstimate:
+        """Build the estimate of an LLM stage; waves is the number of sequential rounds of calls."""
+        latency, from_history = self._call_latency(stage, input_tokens, output_tokens)
+        return StageEstimate(
+            stage=stage,
+            calls=calls,
+            input_tokens=int(input_tokens * calls),
+            output_tokens=int(output_tokens * calls),
+            latency_seconds=latency * (waves if waves is not None else calls),
+            source="history" if from_history else "default"
+        )
+
+    def estimate(self, request: PipelineEstimateRequest, text: str) -> PipelineEstimateResponse:
+        """
+        Estimate tokens and latency for generating a SOAP note from the text.
+
+        Args:
+            request: Estimate options (pipeline mode, context, PII masking)
+            text: Clinical text
+
+        Returns:
+            PipelineEstimateResponse: Per-stage and end-to-end estimates
+        """
+        svc = self.soap_service
+        input_tokens = count_tokens(text)
+        mode = svc._resolve_pipeline_mode(request, text)
+        stages = []
+
+        if request.enable_pii_masking:
+            history = token_usage.recent_stats("pii")
+            if history and history["avg_latency_seconds"] is not None and history["avg_input_tokens"]:
+                latency = history["avg_latency_seconds"] * input_tokens / history["avg_input_tokens"]
+                source = "history"
+            else:
+                latency = input_tokens / DEFAULT_PII_TOKENS_PER_SECOND
+                source = "default"
+            stages.append(StageEstimate(stage="pii", calls=1, latency_seconds=latency, source=source))
+
+        chunk_count = 1
+        context_tokens = 0
+        soap_text_tokens = min(input_tokens, INPUT_TOKEN_BUDGET)
+        if mode == "map_reduce":
+            chunks = split_into_chunks(text, MAP_CHUNK_TOKENS, MAP_CHUNK_OVERLAP_TOKENS)
+            chunk_count = max(1, len(chunks))
+            chunk_tokens = sum(count_tokens(chunk) for chunk in chunks) / chunk_count
+            map_output, _ = self._output_tokens("map", chunk_tokens * DEFAULT_MAP_OUTPUT_RATIO)
+            stages.append(self._llm_stage(
+                "map", chunk_count, self._prompt_tokens(svc.map_prompt) + int(chunk_tokens), map_output,
+                waves=math.ceil(chunk_count / MAP_MAX_CONCURRENCY)
+            ))
+            # The SOAP call reads the merged facts instead of the text
+            soap_text_tokens = min(map_output * chunk_count, INPUT_TOKEN_BUDGET)
+            if request.include_context:
+                context_tokens = min(CONTEXT_TOKEN_BUDGET, int(map_output * chunk_count * COMPACT_CONTEXT_RATIO))
+        elif mode == "standard" and request.include_context:
+            ner_output, _ = self._output_tokens("ner", max(50, input_tokens * DEFAULT_NER_OUTPUT_RATIO))
+            stages.append(self._llm_stage("ner", 1, NER_PROMPT_TOKENS + input_tokens, ner_output))
+            context_tokens = min(CONTEXT_TOKEN_BUDGET, int(ner_output * COMPACT_CONTEXT_RATIO))
+
+        if mode == "single_pass":
+            soap_stage = "single_pass"
+            soap_output, _ = self._output_tokens(
+                "single_pass", DEFAULT_SOAP_OUTPUT_TOKENS + soap_text_tokens * DEFAULT_NER_OUTPUT_RATIO
+            )
+            soap_input = self._prompt_tokens(svc.single_pass_prompt) + soap_text_tokens
+        else:
+            soap_stage = "soap"
+            soap_output, _ = self._output_tokens("soap", DEFAULT_SOAP_OUTPUT_TOKENS)
+            soap_input = self._prompt_tokens(svc.soap_prompt) + soap_text_tokens + context_tokens
+        stages.append(self._llm_stage(soap_stage, 1, soap_input, soap_output))
+
+        # Notes the pre-judge decides locally never reach the Judge LLM
+        judge_share = 1.0 - svc.prejudge.stats()["llm_calls_avoided_ratio"]
+        judge_output, _ = self._output_tokens("judge", DEFAULT_JUDGE_OUTPUT_TOKENS)
+        judge_input = self._prompt_tokens(svc.judge_prompt) + soap_output
+        stages.append(self._llm_stage("judge", judge_share, judge_input, judge_output))
+
+        history = token_usage.recent_stats("embedding")
+        if history and history["avg_latency_seconds"] is not None:
+            embedding_latency, source = history["avg_latency_seconds"], "history"
+        else:
+            embedding_latency, source = DEFAULT_EMBEDDING_SECONDS, "default"
+        stages.append(StageEstimate(
+            stage="embedding", calls=1, input_tokens=soap_output, latency_seconds=embedding_latency, source=source
+        ))
+
+        latency = sum(stage.latency_seconds for stage in stages)
+        attempt_latency = sum(stage.latency_seconds for stage in stages if stage.stage in (soap_stage, "judge"))
+        llm_stages = [stage for stage in stages if stage.stage not in ("pii", "embedding")]
+
+        logger.info("Pipeline estimate computed", pipeline_mode=mode, input_tokens=input_tokens, latency_seconds=latency)
+        return PipelineEstimateResponse(
+            pipeline_mode=mode,
+            input_tokens=input_tokens,
+            chunk_count=chunk_count,
+            stages=stages,
+            total_input_tokens=sum(stage.input_tokens for stage in llm_stages),
+            total_output_tokens=sum(stage.output_tokens for stage in llm_stages),
+            latency_seconds=latency,
+            latency_seconds_worst_case=latency + attempt_latency * MAX_REGENERATIONS
+        )
@@ -0,0 +1,220 @@
+"""
+Precomputed Answer Service
+Generates answers to standard per-patient questions when notes are approved and serves them to RAG queries
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+
+import structlog
+
+from app.schemas.rag_schemas import RAGQueryRequest
+from app.models.precomputed_answers import PrecomputedAnswers
+from app.data.precomputed_answers_repository import PrecomputedAnswersRepository
+from app.database.db import async_session_maker
+from app.services.entity_index_service import normalize_entity_value
+
+logger = structlog.get_logger(__name__)
+
+
+DEFAULT_STANDARD_QUESTIONS = [
+    {
+        "key": "hearing_status",
+        "question": "What is the patient's current hearing status?",
+        "aliases": ["current hearing status", "how is the patient's hearing"],
+    },
+    {
+        "key": "treatment_plan",
+        "question": "What is the patient's current treatment plan?",
+        "aliases": ["what is the plan", "current plan", "treatment plan"],
+    },
+    {
+        "key": "hearing_devices",
+        "question": "What hearing devices does the patient use?",
+        "aliases": ["hearing aids", "what hearing aids does the patient use"],
+    },
+    {
+        "key": "last_visit_summary",
+        "question": "Summarize the patient's most recent visit.",
+        "aliases": ["last visit summary", "summarize the last visit"],
+    },
+]
+
+
+def normalize_question(text: str) -> str:
+    """Normalize a question for matching ("What's the plan?" -> "what's the plan")."""
+    return normalize_entity_value(text)
+
+
+@dataclass
+class StandardQuestion:
+    """A configured standard question and the phrasings that map to it."""
+    key: str
+    question: str
+    aliases: List[str] = field(default_factory=list)
+
+    @property
+    def match_keys(self) -> Set[str]:
+        return {normalize_question(q) for q in [self.question, *self.aliases] if q}
+
+
+def load_standard_questions() -> List[StandardQuestion]:
+    """
+    Load standard questions from RAG_STANDARD_QUESTIONS (JSON) or fall back to the defaults.
+
+    Accepts a list of strings or of {"key", "question", "aliases"} objects.
+    """
+    raw = os.getenv("RAG_STANDARD_QUESTIONS")
+    entries = DEFAULT_STANDARD_QUESTIONS
+    if raw:
+        try:
+            entries = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.error("Invalid RAG_STANDARD_QUESTIONS, using defaults", error=str(e))
+
+    questions = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"question": entry}
+        question = (entry.get("question") or "").strip()
+        if not question:
+            continue
+        key = entry.get("key") or re.sub(r"[^a-z0-9]+", "_", normalize_question(question)).strip("_")
+        questions.append(StandardQuestion(key=key[:100], question=question, aliases=list(entry.get("aliases") or [])))
+    return questions
+
+
+class PrecomputedAnswerService:
+    """Maintains and serves precomputed answers to standard questions."""
+
+    def __init__(self, rag_service):
+        """
+        Args:
+            rag_service: RAGService used to generate answers
+        """
+        self.rag_service = rag_service
+        self.questions = load_standard_questions()
+        self._by_match_key = {
+            match_key: question for question in self.questions for match_key in question.match_keys
+        }
+        self._semaphore = asyncio.Semaphore(int(os.getenv("RAG_PRECOMPUTE_MAX_CONCURRENT", "2")))
+        self._running: Set[uuid.UUID] = set()
+        self._pending: Set[uuid.UUID] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def match_question(self, query: str) -> Optional[StandardQuestion]:
+        """Return the standard question a query corresponds to, if any."""
+        return self._by_match_key.get(normalize_question(query))
+
+    async def get_fresh_answer(self, patient_id: uuid.UUID, question: StandardQuestion) -> Optional[PrecomputedAnswers]:
+        """
+        Return the stored answer if it was derived from the patient's latest approved note.
+
+        Args:
+            patient_id: Patient ID
+            question: Matched standard question
+
+        Returns:
+            Optional[PrecomputedAnswers]: Fresh answer, or None if missing or stale
+        """
+        async with async_session_maker() as session:
+            repo = PrecomputedAnswersRepository(session)
+            answer = await repo.get_answer(patient_id, question.key)
+            if answer is None:
+                return None
+
+            latest = await repo.latest_approved_note_version(patient_id)
+            if latest is None or latest != (answer.source_note_id, answer.source_note_updated_at):
+                logger.info("Precomputed answer is stale", patient_id=str(patient_id), question_key=question.key)
+                return None
+            return answer
+
+    def schedule_for_notes(self, note_ids: List[uuid.UUID]) -> None:
+        """Refresh answers in the background for the patients owning the given approved notes."""
+        if not self.questions or not note_ids:
+            return
+        task = asyncio.create_task(self._refresh_for_notes(list(note_ids)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh_for_notes(self, note_ids: List[uuid.UUID]) -> None:
+        try:
+            async with async_session_maker() as session:
+                patient_ids = await PrecomputedAnswersRepository(session).patient_ids_for_notes(note_ids)
+            await asyncio.gather(*(self.refresh_patient(patient_id) for patient_id in patient_ids))
+        except Exception as e:
+            logger.error("❌ Precomputed answer refresh failed", error=str(e))
+
+    async def refresh_patient(self, patient_id: uuid.UUID) -> int:
+        """
+        Regenerate every standard answer for a patient.
+
+        Approvals arriving while a refresh is running queue one more pass so the
+        final answers always reflect the newest approved note.
+
+        Args:
+            patient_id: Patient ID
+
+        Returns:
+            int: Number of answers stored
+        """
+        if patient_id in self._running:
+            self._pending.add(patient_id)
+            return 0
+
+        self._running.add(patient_id)
+        stored = 0
+        try:
+            while True:
+                self._pending.discard(patient_id)
+                async with self._semaphore:
+                    stored += await self._generate_answers(patient_id)
+                if patient_id not in self._pending:
+                    break
+        finally:
+            self._running.discard(patient_id)
+        return stored
+
+    async def _generate_answers(self, patient_id: uuid.UUID) -> int:
+        async with async_session_maker() as session:
+            latest = await PrecomputedAnswersRepository(session).latest_approved_note_version(patient_id)
+        if latest is None:
+            return 0
+        source_note_id, source_note_updated_at = latest
+
+        stored = 0
+        for question in self.questions:
+            start_time = time.time()
+            response = await self.rag_service.query_rag(RAGQueryRequest(
+                query=question.question,
+                patient_id=patient_id,
+                use_precomputed=False,
+                include_sources=True
+            ))
+            if response.conversation_id:
+                self.rag_service.end_conversation(response.conversation_id)
+            if not response.success:
+                logger.warning("Precomputed answer generation failed", patient_id=str(patient_id), question_key=question.key)
+                continue
+
+            async with async_session_maker() as session:
+                await PrecomputedAnswersRepository(session).upsert_answer({
+                    "patient_id": patient_id,
+                    "question_key": question.key,
+                    "question": question.question,
+                    "answer": response.answer,
+                    "sources": response.sources,
+                    "source_note_id": source_note_id,
+                    "source_note_updated_at": source_note_updated_at,
+                    "generation_time": time.time() - start_time,
+                })
+                await session.commit()
+            stored += 1
+
+        logger.info("✅ Precomputed answers refreshed", patient_id=str(patient_id), answers=stored)
+        return stored
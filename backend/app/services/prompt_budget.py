@@ -0,0 +1,345 @@
+"""
+Prompt Budget
+Compact prompt serialization, token budgets and per-stage token accounting for the LLM pipeline
+
+Context data and SOAP notes are serialized without indentation or bookkeeping fields,
+entities are deduplicated and trimmed to a token budget, and over-long clinical text is
+cut to the input budget. TokenUsageCallbackHandler records input/output tokens per
+pipeline stage (ner, soap, judge, ...) from provider usage metadata, estimating when the
+provider reports none, together with each call's latency. The last calls of each stage
+are also kept as a recent window, which StageHistoryService persists across restarts.
+"""
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+import structlog
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.services.text_chunking import count_tokens, _get_encoding, CHARS_PER_TOKEN
+
+logger = structlog.get_logger(__name__)
+
+# Token budget for clinical text placed in a prompt
+INPUT_TOKEN_BUDGET = int(os.getenv("SOAP_INPUT_TOKEN_BUDGET", "12000"))
+# Token budget for the serialized NER context placed in a prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("SOAP_CONTEXT_TOKEN_BUDGET", "2000"))
+# Share of a trimmed text kept from its start; the rest comes from its end
+TRIM_HEAD_RATIO = 0.7
+TRIM_MARKER = "\n[...]\n"
+
+# Calls per stage in the recent window used for estimates
+STAGE_HISTORY_WINDOW = int(os.getenv("PIPELINE_STAGE_HISTORY_WINDOW", "200"))
+
+# Context keys passed through to prompts besides the entities
+FEEDBACK_KEYS = ("validation_feedback", "suggestions")
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def fit_text(text: str, max_tokens: int = INPUT_TOKEN_BUDGET) -> str:
+    """
+    Trim text to a token budget, keeping its start and end.
+
+    Args:
+        text: Text to fit
+        max_tokens: Token budget
+
+    Returns:
+        str: The text itself when within budget, otherwise its head and tail joined by a marker
+    """
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+
+    head_tokens = int(max_tokens * TRIM_HEAD_RATIO)
+    tail_tokens = max_tokens - head_tokens
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        head = encoding.decode(tokens[:head_tokens])
+        tail = encoding.decode(tokens[-tail_tokens:]) if tail_tokens else ""
+    else:
+        head = text[:head_tokens * CHARS_PER_TOKEN]
+        tail = text[-tail_tokens * CHARS_PER_TOKEN:] if tail_tokens else ""
+
+    logger.warning("Prompt text trimmed to token budget", original_tokens=total, budget=max_tokens)
+    return head + TRIM_MARKER + tail
+
+
+def compact_entities(entities: List[Dict[str, Any]], max_tokens: int = CONTEXT_TOKEN_BUDGET) -> Dict[str, List[str]]:
+    """
+    Deduplicate entities and group their values by type within a token budget.
+
+    Entities are case-insensitively deduplicated per type; when the budget is exceeded
+    the lowest-confidence entities are dropped first.
+
+    Args:
+        entities: Entity dicts with type, value and confidence
+        max_tokens: Token budget for the grouped entities
+
+    Returns:
+        Dict mapping entity type to its distinct values
+    """
+    best: Dict[tuple, Dict[str, Any]] = {}
+    for entity in entities or []:
+        if not isinstance(entity, dict):
+            continue
+        value = str(entity.get("value") or "").strip()
+        if not value:
+            continue
+        entity_type = str(entity.get("type") or "unknown").lower()
+        key = (entity_type, value.casefold())
+        confidence = float(entity.get("confidence") or 0.0)
+        if key not in best or confidence > best[key]["confidence"]:
+            best[key] = {"type": entity_type, "value": value, "confidence": confidence}
+
+    grouped: Dict[str, List[str]] = defaultdict(list)
+    used = 2  # braces
+    for entity in sorted(best.values(), key=lambda e: e["confidence"], reverse=True):
+        cost = count_tokens(_dumps(entity["value"])) + (0 if entity["type"] in grouped else count_tokens(_dumps(entity["type"])) + 2)
+        if used + cost > max_tokens:
+            logger.info("Context entities trimmed to token budget", kept=sum(map(len, grouped.values())), total=len(best))
+            break
+        grouped[entity["type"]].append(entity["value"])
+        used += cost
+    return dict(grouped)
+
+
+def compact_context(context_data: Optional[Dict[str, Any]], max_tokens: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Serialize NER context data compactly for a prompt.
+
+    Keeps deduplicated entities (grouped by type) and judge feedback; drops positions,
+    confidences, counts and timings the model does not need.
+
+    Args:
+        context_data: Context data as built by NERService
+        max_tokens: Token budget for the entities
+
+    Returns:
+        str: Compact JSON
+    """
+    if not context_data:
+        return "{}"
+    compact: Dict[str, Any] = {}
+    entities = compact_entities(context_data.get("entities") or [], max_tokens)
+    if entities:
+        compact["entities"] = entities
+    for key in FEEDBACK_KEYS:
+        if context_data.get(key):
+            compact[key] = context_data[key]
+    return _dumps(compact)
+
+
+def compact_note(soap_note: Any) -> str:
+    """
+    Serialize a SOAP note compactly, keeping only each section's content.
+
+    Args:
+        soap_note: SOAP note dictionary
+
+    Returns:
+        str: Compact JSON
+    """
+    if not isinstance(soap_note, dict):
+        return _dumps(soap_note)
+    compact = {}
+    for section, value in soap_note.items():
+        if isinstance(value, dict) and "content" in value:
+            compact[section] = {"content": value["content"]}
+        else:
+            compact[section] = value
+    return _dumps(compact)
+
+
+class TokenUsageTracker:
+    """Process-wide input/output token and latency counters per pipeline stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {
+                "calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated_calls": 0,
+                "timed_calls": 0, "latency_seconds": 0.0,
+            }
+        )
+        # Latest calls per stage as (input tokens, output tokens, latency or None)
+        self._recent: Dict[str, deque] = defaultdict(lambda: deque(maxlen=STAGE_HISTORY_WINDOW))
+        # Calls not yet persisted, bounded in case persistence is not running
+        self._unsaved: deque = deque(maxlen=STAGE_HISTORY_WINDOW * 20)
+
+    def record(
+        self,
+        stage: str,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        estimated: bool = False,
+        latency_seconds: Optional[float] = None
+    ) -> None:
+        """Add one call (model or local step such as PII masking) to a stage's counters."""
+        with self._lock:
+            counters = self._stages[stage]
+            counters["calls"] += 1
+            counters["input_tokens"] += int(input_tokens or 0)
+            counters["output_tokens"] += int(output_tokens or 0)
+            if estimated:
+                counters["estimated_calls"] += 1
+            if latency_seconds is not None:
+                counters["timed_calls"] += 1
+                counters["latency_seconds"] += latency_seconds
+            sample = (int(input_tokens or 0), int(output_tokens or 0), latency_seconds)
+            self._recent[stage].append(sample)
+            self._unsaved.append((stage, *sample, estimated))
+        logger.debug(
+            "Token usage recorded",
+            stage=stage,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            estimated=estimated,
+            latency_seconds=latency_seconds
+        )
+
+    def stage_stats(self, stage: str) -> Optional[Dict[str, float]]:
+        """Counters and per-call averages for one stage, or None if it has no calls yet."""
+        with self._lock:
+            counters = dict(self._stages[stage]) if stage in self._stages else None
+        return self._with_averages(counters) if counters else None
+
+    def recent_stats(self, stage: str) -> Optional[Dict[str, float]]:
+        """
+        Per-call averages over the stage's last STAGE_HISTORY_WINDOW calls.
+
+        Unlike stage_stats, this includes calls loaded from earlier runs and follows
+        changes in provider speed or prompt size.
+
+        Returns:
+            Optional[Dict[str, float]]: Same averages as stage_stats, or None if the stage has no calls
+        """
+        with self._lock:
+            samples = list(self._recent.get(stage) or ())
+        if not samples:
+            return None
+        latencies = [latency for _, _, latency in samples if latency is not None]
+        return self._with_averages({
+            "calls": len(samples),
+            "input_tokens": sum(sample[0] for sample in samples),
+            "output_tokens": sum(sample[1] for sample in samples),
+            "timed_calls": len(latencies),
+            "latency_seconds": sum(latencies),
+        })
+
+    def load_history(self, samples: List[tuple]) -> None:
+        """Seed the recent windows with (stage, input tokens, output tokens, latency) from earlier runs, oldest first."""
+        loaded: Dict[str, list] = defaultdict(list)
+        for stage, input_tokens, output_tokens, latency_seconds in samples:
+            loaded[stage].append((input_tokens, output_tokens, latency_seconds))
+        with self._lock:
+            for stage, stage_samples in loaded.items():
+                # Calls recorded since startup stay the most recent
+                self._recent[stage] = deque(stage_samples + list(self._recent.get(stage) or ()), maxlen=STAGE_HISTORY_WINDOW)
+
+    def take_unsaved(self) -> List[tuple]:
+        """Remove and return the calls recorded since the last call, as (stage, input, output, latency, estimated)."""
+        with self._lock:
+            samples = list(self._unsaved)
+            self._unsaved.clear()
+        return samples
+
+    @staticmethod
+    def _with_averages(counters: Dict[str, float]) -> Dict[str, float]:
+        calls = counters["calls"] or 1
+        counters["avg_input_tokens"] = counters["input_tokens"] / calls
+        counters["avg_output_tokens"] = counters["output_tokens"] / calls
+        counters["avg_latency_seconds"] = (
+            counters["latency_seconds"] / counters["timed_calls"] if counters["timed_calls"] else None
+        )
+        return counters
+
+    def stats(self) -> Dict[str, Any]:
+        """Totals and per-call averages for every stage."""
+        with self._lock:
+            stages = {stage: self._with_averages(dict(counters)) for stage, counters in self._stages.items()}
+        return {
+            "stages": stages,
+            "total_input_tokens": sum(c["input_tokens"] for c in stages.values()),
+            "total_output_tokens": sum(c["output_tokens"] for c in stages.values()),
+            "input_token_budget": INPUT_TOKEN_BUDGET,
+            "context_token_budget": CONTEXT_TOKEN_BUDGET,
+        }
+
+
+token_usage = TokenUsageTracker()
+
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """LangChain callback recording the token usage of every model call under one stage."""
+
+    run_inline = True
+
+    def __init__(self, stage: str, tracker: TokenUsageTracker = token_usage):
+        self.stage = stage
+        self.tracker = tracker
+        # run_id -> (estimated input tokens, start time)
+        self._runs: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = (sum(
+            count_tokens(message.content if isinstance(message.content, str) else str(message.content))
+            for batch in messages for message in batch
+        ), time.monotonic())
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = (sum(count_tokens(prompt) for prompt in prompts), time.monotonic())
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        estimated_input, started_at = self._runs.pop(run_id, (0, None))
+        input_tokens = output_tokens = 0
+        reported = False
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+                    reported = True
+
+        if not reported:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            if usage:
+                input_tokens = usage.get("prompt_tokens", 0)
+                output_tokens = usage.get("completion_tokens", 0)
+                reported = True
+
+        if not reported:
+            input_tokens = estimated_input
+            output_tokens = sum(count_tokens(g.text) for generations in response.generations for g in generations)
+
+        self.tracker.record(
+            self.stage,
+            input_tokens,
+            output_tokens,
+            estimated=not reported,
+            latency_seconds=time.monotonic() - started_at if started_at is not None else None
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs.pop(run_id, None)
+
+
+_handlers: Dict[str, TokenUsageCallbackHandler] = {}
+
+
+def usage_config(stage: str) -> Dict[str, Any]:
+    """Runnable config that records token usage under the given stage."""
+    handler = _handlers.get(stage)
+    if handler is None:
+        handler = _handlers[stage] = TokenUsageCallbackHandler(stage)
+    return {"callbacks": [handler]}
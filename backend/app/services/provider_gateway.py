@@ -0,0 +1,585 @@
+"""
+Provider Gateway
+Rate limiting, retries, circuit breaking and failover for AI provider calls
+
+Every model call runs under its provider's limiter: token buckets for requests and
+tokens per minute, a concurrency cap, retries of transient errors (429, 5xx,
+timeouts) with jittered exponential backoff, and a circuit breaker that stops
+sending traffic to a provider after repeated failures. ProviderGateway wraps one
+chat model per configured provider and fails over to the next provider at call
+time when the current one stays throttled, keeps failing or has its circuit open.
+
+Optional hedging cuts tail latency: when a call has not returned by a percentile of
+the recent latency of its (provider, model, operation), an identical second request
+is sent and the first response wins; the other is cancelled. A hedge is only sent
+when the limiter can admit it immediately, so hedging never queues behind or adds
+to an overloaded provider.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+import structlog
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from app.services.text_chunking import count_tokens
+from app.services.llm_response_cache import llm_cache
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+# Retries of transient errors within one provider
+RETRY_MAX_ATTEMPTS = int(os.getenv("AI_RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("AI_RETRY_BASE_DELAY_SECONDS", "0.5"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("AI_RETRY_MAX_DELAY_SECONDS", "20"))
+# Consecutive failures that open a provider's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("AI_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("AI_CIRCUIT_RESET_SECONDS", "30"))
+# Output tokens reserved per call when debiting the tokens-per-minute bucket
+OUTPUT_TOKEN_RESERVE = int(os.getenv("AI_OUTPUT_TOKEN_RESERVE", "512"))
+
+# Request hedging
+HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "false").lower() == "true"
+# Operations hedged (comma-separated, empty for all)
+HEDGE_OPERATIONS = {op.strip() for op in os.getenv("AI_HEDGE_OPERATIONS", "").split(",") if op.strip()}
+# Latency percentile of recent calls after which the hedge is sent
+HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("AI_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+# Recent latencies kept per key, and how many are needed before hedging starts
+HEDGE_WINDOW = int(os.getenv("AI_HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+# Upper bound on hedges as a share of a provider's calls
+HEDGE_MAX_RATIO = float(os.getenv("AI_HEDGE_MAX_RATIO", "0.1"))
+
+# Per-provider limits; AI_<PROVIDER>_REQUESTS_PER_MINUTE etc. override, 0 disables
+DEFAULT_LIMITS = {
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 200000, "max_concurrency": 32},
+    "google": {"requests_per_minute": 1000, "tokens_per_minute": 1000000, "max_concurrency": 32},
+}
+
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Credentials rejected: the provider is unusable, so try the next one
+FAILOVER_STATUS_CODES = {401, 403}
+TRANSIENT_ERROR_MARKERS = (
+    "RateLimit", "Timeout", "Connection", "ResourceExhausted", "ServiceUnavailable",
+    "InternalServer", "DeadlineExceeded", "ServerError",
+)
+
+
+class ProviderUnavailableError(RuntimeError):
+    """Raised when no provider could serve a call."""
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """Raised when a provider's circuit is open."""
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code", "http_status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(error, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether an error is worth retrying (throttling, server errors, timeouts, dropped connections)."""
+    if _status_code(error) in TRANSIENT_STATUS_CODES:
+        return True
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    name = type(error).__name__
+    return any(marker in name for marker in TRANSIENT_ERROR_MARKERS)
+
+
+def should_failover(error: BaseException) -> bool:
+    """Whether a failed call should be retried on another provider."""
+    return (
+        isinstance(error, ProviderUnavailableError)
+        or is_transient(error)
+        or _status_code(error) in FAILOVER_STATUS_CODES
+    )
+
+
+def _retry_delay(attempt: int, error: BaseException) -> float:
+    """Full-jitter exponential backoff, honouring a Retry-After header when present."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)))
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None:
+        try:
+            delay = max(delay, float(headers.get("retry-after")))
+        except (TypeError, ValueError):
+            pass
+    return min(delay, RETRY_MAX_DELAY_SECONDS)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate; a burst of one minute's budget is allowed."""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take amount from the bucket, going into debt if needed.
+
+        Returns:
+            float: Seconds the caller must wait before proceeding (0 when disabled or available)
+        """
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_take(self, amount: float) -> bool:
+        """Take amount only if it is available now."""
+        if self.rate <= 0:
+            return True
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < amount:
+                return False
+            self.tokens -= amount
+            return True
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies per (provider, model, operation)."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self._latencies: Dict[tuple, deque] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, key: tuple, seconds: float) -> None:
+        self._latencies[key].append(seconds)
+
+    def percentile(self, key: tuple, percentile: float = HEDGE_PERCENTILE) -> Optional[float]:
+        """Latency percentile of the key, or None with fewer than HEDGE_MIN_SAMPLES calls."""
+        samples = self._latencies.get(key)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100.0))]
+
+
+latency_tracker = LatencyTracker()
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures; after the reset period lets one probe call through.
+
+    A probe that never reports back (e.g. a cancelled hedge or speculative candidate) is
+    released by release_probe(), and in any case expires after another reset period.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # monotonic start of the running half-open probe, None when there is none
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open":
+                now = time.monotonic()
+                if self._probe_started is None or now - self._probe_started >= self.reset_seconds:
+                    self._probe_started = now
+                    return True
+            return False
+
+    def release_probe(self) -> None:
+        """Let another probe through after a call ended without an outcome."""
+        with self._lock:
+            self._probe_started = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("✅ Provider circuit closed", provider=self.name)
+            self.failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probe_started is not None or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                logger.warning("⚠️ Provider circuit opened", provider=self.name, failures=self.failures)
+            self._probe_started = None
+
+
+class ProviderLimiter:
+    """Limits, retries and circuit breaker shared by every call to one provider."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        defaults = DEFAULT_LIMITS.get(provider, DEFAULT_LIMITS["openai"])
+        prefix = f"AI_{provider.upper()}_"
+        self.requests = TokenBucket(float(os.getenv(prefix + "REQUESTS_PER_MINUTE", defaults["requests_per_minute"])))
+        self.tokens = TokenBucket(float(os.getenv(prefix + "TOKENS_PER_MINUTE", defaults["tokens_per_minute"])))
+        max_concurrency = int(os.getenv(prefix + "MAX_CONCURRENCY", defaults["max_concurrency"]))
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.breaker = CircuitBreaker(provider)
+        self.counters = {
+            "calls": 0, "retries": 0, "throttled": 0, "failures": 0, "rejected": 0, "wait_seconds": 0.0,
+            "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0,
+        }
+
+    def _admit(self, tokens: int) -> float:
+        """Check the circuit and reserve rate budget; returns the seconds to wait."""
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            raise CircuitOpenError(f"{self.provider} circuit is open")
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        self.counters["calls"] += 1
+        self.counters["wait_seconds"] += wait
+        return wait
+
+    def _on_error(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Record a failed attempt; returns the delay before retrying, or None to give up."""
+        if not is_transient(error):
+            if _status_code(error) in FAILOVER_STATUS_CODES:
+                self.breaker.record_failure()
+            else:
+                # The provider answered (e.g. a bad request), so it is healthy
+                self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        self.counters["failures"] += 1
+        if _status_code(error) == 429 or "RateLimit" in type(error).__name__ or "ResourceExhausted" in type(error).__name__:
+            self.counters["throttled"] += 1
+        if attempt >= RETRY_MAX_ATTEMPTS or self.breaker.state != "closed":
+            return None
+        self.counters["retries"] += 1
+        delay = _retry_delay(attempt, error)
+        logger.warning(
+            "Transient provider error, retrying",
+            provider=self.provider,
+            attempt=attempt,
+            delay_seconds=round(delay, 2),
+            error=str(error)[:200]
+        )
+        return delay
+
+    def _admit_hedge(self, tokens: int) -> bool:
+        """Admit a hedge only if it needs no waiting and stays within the hedge budget."""
+        if self.counters["hedges"] + 1 > max(1.0, self.counters["calls"] * HEDGE_MAX_RATIO):
+            return False
+        if self._semaphore is not None and self._semaphore.locked():
+            return False
+        if self.breaker.state != "closed" or not self.requests.try_take(1):
+            return False
+        if not self.tokens.try_take(tokens):
+            return False
+        self.counters["hedges"] += 1
+        return True
+
+    async def _call(self, call: Callable[[], Awaitable[T]]) -> T:
+        if self._semaphore is None:
+            return await call()
+        async with self._semaphore:
+            return await call()
+
+    async def _call_hedged(self, call: Callable[[], Awaitable[T]], tokens: int, hedge_after: float) -> T:
+        """Send the call; if it is still running after hedge_after, race an identical second one."""
+        primary = asyncio.ensure_future(self._call(call))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if done:
+                return primary.result()
+            if not self._admit_hedge(tokens):
+                self.counters["hedges_skipped"] += 1
+                return await primary
+            logger.info("Hedging slow provider call", provider=self.provider, hedge_after_seconds=round(hedge_after, 2))
+            hedge = asyncio.ensure_future(self._call(call))
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+            # Both failed: surface the original request's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int = 0, latency_key: Optional[tuple] = None) -> T:
+        """
+        Run one provider call under the limits, retrying transient errors.
+
+        Args:
+            call: Zero-argument coroutine function making the call
+            tokens: Estimated tokens of the call
+            latency_key: (provider, model, operation) whose latency is tracked; enables hedging
+
+        Returns:
+            The call's result
+
+        Raises:
+            CircuitOpenError: If the provider's circuit is open
+            Exception: The call's last error when it is not transient or retries are exhausted
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = self._admit(tokens)
+            hedge_after = None
+            if latency_key is not None and HEDGE_ENABLED and (not HEDGE_OPERATIONS or latency_key[2] in HEDGE_OPERATIONS):
+                hedge_after = latency_tracker.percentile(latency_key)
+            try:
+                if wait:
+                    await asyncio.sleep(wait)
+                started = time.monotonic()
+                if hedge_after is not None:
+                    result = await self._call_hedged(call, tokens, max(hedge_after, HEDGE_MIN_DELAY_SECONDS))
+                else:
+                    result = await self._call(call)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled before an outcome; a half-open probe must not stay claimed
+                self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            if latency_key is not None:
+                latency_tracker.record(latency_key, time.monotonic() - started)
+            return result
+
+    def run_sync(self, call: Callable[[], T], tokens: int = 0) -> T:
+        """Blocking variant of run (without the concurrency cap)."""
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = self._admit(tokens)
+            if wait:
+                time.sleep(wait)
+            try:
+                result = call()
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "circuit": self.breaker.state}
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_provider_limiter(provider: str) -> ProviderLimiter:
+    """Process-wide limiter of a provider."""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                limiter = _limiters[provider] = ProviderLimiter(provider)
+    return limiter
+
+
+def gateway_stats() -> Dict[str, Any]:
+    """Counters and circuit state of every provider used so far."""
+    return {provider: limiter.stats() for provider, limiter in list(_limiters.items())}
+
+
+def estimate_call_tokens(value: Any) -> int:
+    """Rough token count of a model input plus the output reserve."""
+    if hasattr(value, "to_messages"):
+        value = value.to_messages()
+    if isinstance(value, list):
+        text = " ".join(str(getattr(message, "content", message)) for message in value)
+    else:
+        text = str(getattr(value, "content", value))
+    return count_tokens(text) + OUTPUT_TOKEN_RESERVE
+
+
+class ProviderGateway(Runnable):
+    """
+    Chat model runnable that tries each configured provider in order.
+
+    A call goes to the first provider whose circuit is not open; when it still
+    fails after its retries with a transient or credential error, the same input
+    is sent to the next provider. Other errors (bad requests) are raised at once.
+    Async calls are served from the LLM response cache when it covers the
+    operation and temperature (see llm_response_cache.py).
+    """
+
+    def __init__(
+        self,
+        targets: List[Tuple[str, Runnable]],
+        operation: str = "chat",
+        model_names: Optional[List[str]] = None,
+        temperature: Optional[float] = None,
+        variant: str = ""
+    ):
+        """
+        Args:
+            targets: (provider, model runnable) pairs in preference order
+            operation: Operation name used in log messages, latency tracking and cache keys
+            model_names: Model name per target (read from the models when omitted)
+            temperature: Sampling temperature of the models (None disables deterministic caching)
+            variant: Identity of the output handling, part of cache keys
+        """
+        if not targets:
+            raise ValueError("ProviderGateway needs at least one provider")
+        self.targets = targets
+        self.operation = operation
+        self.model_names = model_names or [
+            getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__
+            for _, model in targets
+        ]
+        self.temperature = temperature
+        self.variant = variant
+
+    @property
+    def provider(self) -> str:
+        """Preferred provider."""
+        return self.targets[0][0]
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> "ProviderGateway":
+        """Gateway over each provider's structured output runnable."""
+        variant = json.dumps({"schema": schema, **kwargs}, sort_keys=True, default=str)
+        return ProviderGateway(
+            [(provider, model.with_structured_output(schema, **kwargs)) for provider, model in self.targets],
+            self.operation,
+            self.model_names,
+            self.temperature,
+            variant
+        )
+
+    def _failed_over(self, provider: str, error: BaseException) -> None:
+        logger.warning(
+            "⚠️ Provider call failed, failing over",
+            operation=self.operation,
+            provider=provider,
+            error=str(error)[:200]
+        )
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        cache_keys: List[str] = []
+        if llm_cache.enabled_for(self.operation, self.temperature):
+            cache_keys = [
+                llm_cache.key(provider, model_name, self.temperature, self.operation, input, self.variant, kwargs)
+                for (provider, _), model_name in zip(self.targets, self.model_names)
+            ]
+            cached = await llm_cache.lookup(cache_keys)
+            if cached is not None:
+                return cached
+        tokens = estimate_call_tokens(input)
+        last_error: Optional[BaseException] = None
+        for index, ((provider, model), model_name) in enumerate(zip(self.targets, self.model_names)):
+            try:
+                result = await get_provider_limiter(provider).run(
+                    lambda: model.ainvoke(input, config, **kwargs), tokens, (provider, model_name, self.operation)
+                )
+            except Exception as e:
+                if not should_failover(e):
+                    raise
+                last_error = e
+                self._failed_over(provider, e)
+                continue
+            if cache_keys:
+                await llm_cache.save(cache_keys[index], result, provider, model_name, self.operation)
+            return result
+        raise ProviderUnavailableError(f"No provider available for {self.operation}: {last_error}") from last_error
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        tokens = estimate_call_tokens(input)
+        last_error: Optional[BaseException] = None
+        for provider, model in self.targets:
+            try:
+                return get_provider_limiter(provider).run_sync(
+                    lambda: model.invoke(input, config, **kwargs), tokens
+                )
+            except Exception as e:
+                if not should_failover(e):
+                    raise
+                last_error = e
+                self._failed_over(provider, e)
+        raise ProviderUnavailableError(f"No provider available for {self.operation}: {last_error}") from last_error
+
+
+class LimitedEmbeddings(Embeddings):
+    """
+    Embedding model whose calls run under its provider's limiter.
+
+    There is no cross-provider failover: vectors from another provider's model
+    live in a different space and cannot be mixed with stored embeddings.
+    """
+
+    def __init__(self, model: Embeddings, provider: str):
+        self.model = model
+        self.provider = provider
+
+    @property
+    def limiter(self) -> ProviderLimiter:
+        return get_provider_limiter(self.provider)
+
+    def embed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        return self.limiter.run_sync(lambda: self.model.embed_documents(texts, **kwargs), sum(count_tokens(t) for t in texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.limiter.run_sync(lambda: self.model.embed_query(text), count_tokens(text))
+
+    async def aembed_documents(self, texts: List[str], **kwargs: Any) -> List[List[float]]:
+        return await self.limiter.run(
+            lambda: self.model.aembed_documents(texts, **kwargs), sum(count_tokens(t) for t in texts)
+        )
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.limiter.run(lambda: self.model.aembed_query(text), count_tokens(text))
@@ -0,0 +1,190 @@
+"""
+RAG Conversation Cache
+Bounded in-process store of multi-turn RAG state (turns, retrieved chunks and their embeddings)
+"""
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+import structlog
+
+from app.schemas.rag_schemas import RAGChunk, RAGQueryRequest
+
+logger = structlog.get_logger(__name__)
+
+
+class ConversationAccessError(LookupError):
+    """Raised when a conversation is requested by someone other than its owner."""
+
+
+@dataclass
+class ConversationTurn:
+    """A single question/answer exchange."""
+    query: str
+    answer: str
+    note_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ConversationState:
+    """Retrieval state carried between turns of one conversation."""
+    conversation_id: str
+    scope: Tuple[Any, ...]
+    owner_id: Optional[uuid.UUID] = None
+    patient_id: Optional[uuid.UUID] = None
+    patient_info: str = ""
+    turns: List[ConversationTurn] = field(default_factory=list)
+    chunks: "OrderedDict[str, RAGChunk]" = field(default_factory=OrderedDict)
+    embeddings: Dict[str, np.ndarray] = field(default_factory=dict)
+    last_access: float = field(default_factory=time.monotonic)
+
+    def add_chunk(self, chunk: RAGChunk, embedding: Optional[np.ndarray], max_chunks: int) -> None:
+        """Remember a retrieved chunk, evicting the oldest once the per-conversation limit is hit."""
+        if embedding is None:
+            return
+        self.chunks[chunk.chunk_id] = chunk
+        self.chunks.move_to_end(chunk.chunk_id)
+        self.embeddings[chunk.chunk_id] = embedding
+        while len(self.chunks) > max_chunks:
+            evicted_id, _ = self.chunks.popitem(last=False)
+            self.embeddings.pop(evicted_id, None)
+
+    def rescore(self, query_embedding: np.ndarray, similarity_threshold: float) -> List[RAGChunk]:
+        """
+        Score cached chunks against a new query embedding locally.
+
+        Uses the same similarity definition and cutoff as the pgvector search, which
+        admits cosine distance < 2 * (1 - threshold), i.e. cosine similarity above
+        2 * threshold - 1, so a chunk dropped here would not be found there either.
+        """
+        if not self.chunks:
+            return []
+
+        chunk_ids = list(self.chunks.keys())
+        matrix = np.vstack([self.embeddings[chunk_id] for chunk_id in chunk_ids])
+        query_norm = np.linalg.norm(query_embedding) or 1.0
+        row_norms = np.linalg.norm(matrix, axis=1)
+        row_norms[row_norms == 0] = 1.0
+        similarities = matrix @ query_embedding / (row_norms * query_norm)
+
+        min_similarity = 2 * similarity_threshold - 1
+        rescored = []
+        for chunk_id, similarity in zip(chunk_ids, similarities):
+            if similarity <= min_similarity:
+                continue
+            similarity = float(min(max(similarity, 0.0), 1.0))
+            rescored.append(self.chunks[chunk_id].copy(update={"similarity_score": similarity, "rerank_score": None}))
+        return rescored
+
+    def history_text(self, max_turns: int) -> str:
+        """Render the most recent turns for the answer prompt."""
+        lines = []
+        for turn in self.turns[-max_turns:]:
+            lines.append(f"User: {turn.query}")
+            lines.append(f"Assistant: {turn.answer}")
+        return "\n".join(lines)
+
+
+class RAGConversationCache:
+    """LRU + TTL cache of conversation states, bounded by count and per-conversation size."""
+
+    def __init__(
+        self,
+        max_conversations: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        max_chunks: Optional[int] = None,
+        max_turns: Optional[int] = None,
+    ):
+        self.max_conversations = max_conversations or int(os.getenv("RAG_CONVERSATION_MAX", "500"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("RAG_CONVERSATION_TTL_SECONDS", "1800"))
+        self.max_chunks = max_chunks or int(os.getenv("RAG_CONVERSATION_MAX_CHUNKS", "50"))
+        self.max_turns = max_turns or int(os.getenv("RAG_CONVERSATION_MAX_TURNS", "6"))
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+
+    @staticmethod
+    def scope_key(request: RAGQueryRequest) -> Tuple[Any, ...]:
+        """Filters that must stay the same for cached chunks to remain valid."""
+        return (
+            request.patient_id,
+            request.session_id,
+            request.professional_id,
+            request.start_date,
+            request.end_date,
+            tuple(
+                (f.value, f.entity_type, f.match, f.min_confidence)
+                for f in request.entity_filters
+            ),
+        )
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        expired = [cid for cid, state in self._states.items() if now - state.last_access > self.ttl_seconds]
+        for cid in expired:
+            del self._states[cid]
+        if expired:
+            logger.info("Expired RAG conversations", count=len(expired))
+
+    def get(self, conversation_id: Optional[str], owner_id: Optional[uuid.UUID] = None) -> Optional[ConversationState]:
+        """
+        Return a live conversation state and mark it as recently used.
+
+        Raises:
+            ConversationAccessError: If the conversation belongs to another owner
+        """
+        self._expire()
+        if not conversation_id:
+            return None
+        state = self._states.get(conversation_id)
+        if state is not None:
+            if state.owner_id != owner_id:
+                raise ConversationAccessError(f"Conversation {conversation_id} not found")
+            state.last_access = time.monotonic()
+            self._states.move_to_end(conversation_id)
+        return state
+
+    def start(self, request: RAGQueryRequest, owner_id: Optional[uuid.UUID] = None) -> ConversationState:
+        """Create a conversation for the request's filter scope under a new server-issued ID."""
+        conversation_id = str(uuid.uuid4())
+        state = ConversationState(
+            conversation_id=conversation_id,
+            scope=self.scope_key(request),
+            owner_id=owner_id,
+            patient_id=request.patient_id,
+        )
+        self._states[conversation_id] = state
+        self._states.move_to_end(conversation_id)
+        while len(self._states) > self.max_conversations:
+            self._states.popitem(last=False)
+        return state
+
+    def reset_scope(self, state: ConversationState, request: RAGQueryRequest) -> None:
+        """Move a conversation to new filters: cached retrieval context is dropped, turns are kept."""
+        state.scope = self.scope_key(request)
+        state.patient_id = request.patient_id
+        state.patient_info = ""
+        state.chunks.clear()
+        state.embeddings.clear()
+        state.last_access = time.monotonic()
+
+    def record_turn(self, state: ConversationState, query: str, answer: str, chunks: List[RAGChunk]) -> None:
+        """Append a turn, keeping at most max_turns of history."""
+        state.turns.append(ConversationTurn(query=query, answer=answer, note_ids=[c.chunk_id for c in chunks]))
+        if len(state.turns) > self.max_turns:
+            del state.turns[:-self.max_turns]
+        state.last_access = time.monotonic()
+
+    def discard(self, conversation_id: str, owner_id: Optional[uuid.UUID] = None) -> bool:
+        """Drop a conversation of the owner. Returns whether it existed."""
+        state = self._states.get(conversation_id)
+        if state is None or state.owner_id != owner_id:
+            return False
+        del self._states[conversation_id]
+        return True
+
+
+# Shared across RAGService instances within the process
+conversation_cache = RAGConversationCache()
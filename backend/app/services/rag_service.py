@@ -7,7 +7,7 @@ import time
 import json
 import uuid
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import structlog
 from dotenv import load_dotenv
 
@@ -30,6 +30,12 @@ from app.models.session_soap_notes import SessionSoapNotes
 from app.models.patient_visit_sessions import PatientVisitSessions
 from app.models.patients import Patients
 from app.database.db import async_session_maker
+from app.services.entity_index_service import EntityIndexService
+from app.services.rag_conversation_cache import conversation_cache
+from app.services.precomputed_answer_service import PrecomputedAnswerService
+from app.services.patient_vector_service import PatientVectorService
+from app.services.prompt_budget import token_usage
+from app.services.text_chunking import count_tokens
 
 logger = structlog.get_logger(__name__)
 
@@ -43,6 +49,10 @@ class RAGService:
         self.llm = None
         self.rag_prompt = None
         self.provider = None  # Track which provider is being used
+        self.entity_index = EntityIndexService()
+        self.conversations = conversation_cache
+        self.precomputed_answers = PrecomputedAnswerService(self)
+        self.patient_vectors = PatientVectorService()
         self._initialize_models()
         self._setup_prompts()
     
@@ -57,7 +67,7 @@ class RAGService:
             self.embeddings, embedding_provider = get_embedding_model()
             
             # Initialize LLM with automatic provider fallback
-            self.llm, llm_provider = get_chat_model(temperature=temperature)
+            self.llm, llm_provider = get_chat_model(temperature=temperature, operation="rag")
             
             # Track the provider
             self.provider = embedding_provider  # Both should be the same provider
@@ -78,6 +88,9 @@ Retrieved Context:
 Patient Information:
 {patient_info}
 
+Previous Conversation:
+{history}
+
 Question: {query}
 
 Instructions:
@@ -87,11 +100,12 @@ Instructions:
 - Maintain professional medical language
 - If the context doesn't contain enough information, clearly state what is missing
 - Always cite your sources using the provided source information
+- Use the previous conversation to resolve follow-up questions (e.g. "and what was the plan?")
 
 Answer:"""
         
         self.rag_prompt = PromptTemplate(
-            input_variables=["context", "patient_info", "query"],
+            input_variables=["context", "patient_info", "history", "query"],
             template=rag_prompt_template
         )
         
@@ -124,18 +138,22 @@ Answer:"""
                     logger.info("SOAP note already embedded, skipping", note_id=str(note_id))
                     return True
                 
-                # Prepare content for embedding
-                content_text = self._prepare_content_for_embedding(soap_note.content)
-                
                 # Generate embedding
-                embedding_vector = await self.embeddings.aembed_query(content_text)
-                
-                # Convert to numpy array for proper pgvector storage
-                import numpy as np
-                embedding_array = np.array(embedding_vector, dtype=np.float32)
+                embedding_array = await self.compute_note_embedding(soap_note.content)
                 
                 # Update database with embedding
+                old_embedding = soap_note.embedding
                 soap_note.embedding = embedding_array
+                
+                # Fold the new embedding into the patient-level vector in the same transaction
+                try:
+                    async with session.begin_nested():
+                        await self.patient_vectors.apply_note_embedding(
+                            session, soap_note.note_id, embedding_array, old_embedding
+                        )
+                except Exception as e:
+                    logger.error("❌ Patient vector update failed", note_id=str(note_id), error=str(e))
+                
                 await session.commit()
                 
                 logger.info("✅ SOAP note embedded successfully", note_id=str(note_id))
@@ -146,6 +164,25 @@ Answer:"""
                 logger.error("❌ Failed to embed SOAP note", note_id=str(note_id), error=str(e))
                 return False
     
+    async def compute_note_embedding(self, content: Dict[str, Any]) -> np.ndarray:
+        """
+        Embed SOAP note content without touching the database.
+        
+        Lets callers compute the embedding before opening a transaction and
+        store it together with the note.
+        
+        Args:
+            content: SOAP note content dictionary
+            
+        Returns:
+            np.ndarray: float32 embedding ready for pgvector storage
+        """
+        content_text = self._prepare_content_for_embedding(content)
+        start_time = time.time()
+        embedding_vector = await self.embeddings.aembed_query(content_text)
+        token_usage.record("embedding", count_tokens(content_text), latency_seconds=time.time() - start_time)
+        return np.array(embedding_vector, dtype=np.float32)
+    
     def _prepare_content_for_embedding(self, content: Dict[str, Any]) -> str:
         """
         Prepare SOAP note content for embedding.
@@ -270,24 +307,36 @@ Answer:"""
                 message=f"Batch embedding failed: {str(e)}"
             )
     
-    async def query_rag(self, request: RAGQueryRequest) -> RAGQueryResponse:
+    async def query_rag(self, request: RAGQueryRequest, owner_id: Optional[uuid.UUID] = None) -> RAGQueryResponse:
         """
         Query patient data using RAG pipeline.
         
         Args:
             request: RAG query request
+            owner_id: User asking; conversations can only be continued by the user who started them
             
         Returns:
             RAGQueryResponse: Query results with generated answer
+            
+        Raises:
+            ConversationAccessError: If request.conversation_id belongs to another user
         """
         start_time = time.time()
         
+        # Step 0: Resume conversation state for follow-up questions
+        state = self.conversations.get(request.conversation_id, owner_id)
+        if request.conversation_id and state is None:
+            logger.info("Unknown or expired RAG conversation, starting a new one", conversation_id=request.conversation_id)
+        
         try:
             logger.info("Starting RAG query", query=request.query, patient_id=str(request.patient_id) if request.patient_id else None)
             
-            # Step 1: Extract patient from query if not provided
+            if state is not None and not request.patient_id and state.patient_id:
+                request = request.copy(update={"patient_id": state.patient_id})
+            
+            # Step 1: Extract patient from query if not provided (first turn only)
             extracted_patient_id = request.patient_id
-            if not extracted_patient_id:
+            if not extracted_patient_id and state is None:
                 extracted_patient_id = await self._extract_patient_from_query(request.query)
                 if extracted_patient_id:
                     logger.info(f"Extracted patient ID from query: {extracted_patient_id}")
@@ -302,9 +351,55 @@ Answer:"""
                         top_k=request.top_k,
                         similarity_threshold=request.similarity_threshold,
                         rerank_top_n=request.rerank_top_n,
+                        entity_filters=request.entity_filters,
+                        conversation_id=request.conversation_id,
+                        use_precomputed=request.use_precomputed,
                         include_sources=request.include_sources
                     )
             
+            if state is None:
+                state = self.conversations.start(request, owner_id)
+            elif state.scope != self.conversations.scope_key(request):
+                self.conversations.reset_scope(state, request)
+            is_follow_up = bool(state.turns)
+            
+            # Step 1a: Serve standard questions from answers precomputed at approval time
+            precomputed = await self._get_precomputed_answer(request)
+            if precomputed is not None:
+                self.conversations.record_turn(state, request.query, precomputed.answer, [])
+                processing_time = time.time() - start_time
+                logger.info("✅ RAG query served from precomputed answer", question_key=precomputed.question_key, processing_time=processing_time)
+                return RAGQueryResponse(
+                    success=True,
+                    answer=precomputed.answer,
+                    retrieved_chunks=[],
+                    sources=(precomputed.sources or []) if request.include_sources else [],
+                    confidence=0.85,
+                    total_chunks_found=0,
+                    processing_time=processing_time,
+                    conversation_id=state.conversation_id,
+                    turn_number=len(state.turns),
+                    precomputed=True,
+                    message="Query answered from precomputed answer"
+                )
+            
+            # Step 1b: Entity filters narrow the vector search through the entity index
+            # (applied as subqueries in _search_notes); filters with no usable value match nothing
+            if request.entity_filters and not self.entity_index.filter_conditions(request.entity_filters):
+                processing_time = time.time() - start_time
+                return RAGQueryResponse(
+                    success=True,
+                    answer="No clinical notes match the requested entity filters.",
+                    retrieved_chunks=[],
+                    sources=[],
+                    confidence=0.0,
+                    total_chunks_found=0,
+                    processing_time=processing_time,
+                    conversation_id=state.conversation_id,
+                    turn_number=len(state.turns) + 1,
+                    message="No notes matched entity filters"
+                )
+            
             # Step 2: Preprocess query using context_data (if available)
             processed_query = await self._preprocess_query(request.query)
             print("jaidev was at processed_query",processed_query)
@@ -316,24 +411,41 @@ Answer:"""
             query_embedding = np.array(query_embedding_list, dtype=np.float32)
             embedding_time = time.time() - embedding_start
             
-            # Step 4: Filter by metadata and perform top-K vector search
+            # Step 4: Rescore chunks from earlier turns locally, then only search for the shortfall
             retrieval_start = time.time()
-            retrieved_chunks = await self._vector_search(request, query_embedding)
+            cached_chunks = state.rescore(query_embedding, request.similarity_threshold)
+            remaining = request.top_k - len(cached_chunks)
+            new_results = []
+            if remaining > 0:
+                # Only chunks still relevant are excluded; the rest may be found again
+                exclude_note_ids = [uuid.UUID(chunk.chunk_id) for chunk in cached_chunks]
+                new_results = await self._search_notes(
+                    request, query_embedding, exclude_note_ids=exclude_note_ids, limit=remaining
+                )
+                for chunk, chunk_embedding in new_results:
+                    state.add_chunk(chunk, chunk_embedding, self.conversations.max_chunks)
+            retrieved_chunks = cached_chunks + [chunk for chunk, _ in new_results]
             retrieval_time = time.time() - retrieval_start
             
             # Step 5: Rerank results with cross-encoder (simplified for now)
             rerank_start = time.time()
             reranked_chunks = await self._rerank_chunks(retrieved_chunks, request.query, request.rerank_top_n)
             rerank_time = time.time() - rerank_start
+            cached_ids = {chunk.chunk_id for chunk in cached_chunks}
+            reused_chunks = sum(1 for chunk in reranked_chunks if chunk.chunk_id in cached_ids)
             
-            # Step 6: Assemble prompt with retrieved context
+            # Step 6: Assemble prompt with retrieved context and earlier turns
             context = self._assemble_context(reranked_chunks)
-            patient_info = await self._get_patient_info(request.patient_id) if request.patient_id else ""
+            if request.patient_id and not state.patient_info:
+                state.patient_info = await self._get_patient_info(request.patient_id)
+            patient_info = state.patient_info
+            history = state.history_text(self.conversations.max_turns)
             
             # Step 6: Generate answer with LLM and source attribution
             generation_start = time.time()
-            answer = await self._generate_answer(context, patient_info, request.query)
+            answer = await self._generate_answer(context, patient_info, request.query, history)
             generation_time = time.time() - generation_start
+            self.conversations.record_turn(state, request.query, answer, reranked_chunks)
             
             # Prepare response
             sources = self._extract_sources(reranked_chunks) if request.include_sources else []
@@ -343,6 +455,8 @@ Answer:"""
                 "✅ RAG query completed",
                 chunks_retrieved=len(retrieved_chunks),
                 chunks_reranked=len(reranked_chunks),
+                follow_up=is_follow_up,
+                reused_chunks=reused_chunks,
                 processing_time=processing_time
             )
             
@@ -358,6 +472,9 @@ Answer:"""
                 retrieval_time=retrieval_time,
                 rerank_time=rerank_time,
                 generation_time=generation_time,
+                conversation_id=state.conversation_id,
+                turn_number=len(state.turns),
+                reused_chunks=reused_chunks,
                 message="Query processed successfully"
             )
             
@@ -373,9 +490,28 @@ Answer:"""
                 confidence=0.0,
                 total_chunks_found=0,
                 processing_time=processing_time,
+                conversation_id=request.conversation_id,
                 message=f"Query failed: {str(e)}"
             )
     
+    async def _get_precomputed_answer(self, request: RAGQueryRequest):
+        """Return a fresh precomputed answer for unfiltered standard questions about one patient."""
+        if not request.use_precomputed or not request.patient_id:
+            return None
+        if (request.session_id or request.professional_id or request.start_date
+                or request.end_date or request.entity_filters):
+            return None
+        
+        question = self.precomputed_answers.match_question(request.query)
+        if question is None:
+            return None
+        
+        try:
+            return await self.precomputed_answers.get_fresh_answer(request.patient_id, question)
+        except Exception as e:
+            logger.error("Precomputed answer lookup failed", error=str(e))
+            return None
+    
     async def _preprocess_query(self, query: str) -> str:
         """Preprocess query using context_data (simplified for now)."""
         # TODO: Implement query expansion using medical terminology
@@ -407,7 +543,11 @@ Answer:"""
         
         return None
     
-    async def _vector_search(self, request: RAGQueryRequest, query_embedding: np.ndarray) -> List[RAGChunk]:
+    async def _vector_search(
+        self,
+        request: RAGQueryRequest,
+        query_embedding: np.ndarray
+    ) -> List[RAGChunk]:
         """
         Perform vector search with metadata filtering.
         
@@ -418,6 +558,28 @@ Answer:"""
         Returns:
             List[RAGChunk]: Retrieved chunks
         """
+        results = await self._search_notes(request, query_embedding)
+        return [chunk for chunk, _ in results]
+    
+    async def _search_notes(
+        self,
+        request: RAGQueryRequest,
+        query_embedding: np.ndarray,
+        exclude_note_ids: Optional[List[uuid.UUID]] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[RAGChunk, np.ndarray]]:
+        """
+        Vector search returning each chunk together with its stored embedding.
+        
+        Args:
+            request: Query request with filters
+            query_embedding: Query embedding vector
+            exclude_note_ids: Note IDs already retrieved in earlier conversation turns
+            limit: Maximum results (defaults to request.top_k)
+            
+        Returns:
+            List[Tuple[RAGChunk, np.ndarray]]: Retrieved chunks with their embeddings
+        """
         async with async_session_maker() as session:
             try:
                 # Build base query
@@ -455,6 +617,14 @@ Answer:"""
                 if request.end_date:
                     conditions.append(PatientVisitSessions.visit_date <= request.end_date)
                 
+                # Restrict to notes matching the entity filters via entity-index subqueries
+                if request.entity_filters:
+                    conditions.extend(self.entity_index.filter_conditions(request.entity_filters))
+                
+                # Skip notes already held in the conversation cache
+                if exclude_note_ids:
+                    conditions.append(SessionSoapNotes.note_id.not_in(exclude_note_ids))
+                
                 # Apply all conditions
                 if conditions:
                     stmt = stmt.where(and_(*conditions))
@@ -468,7 +638,7 @@ Answer:"""
                     SessionSoapNotes.embedding.cosine_distance(query_embedding) < distance_threshold
                 ).order_by(
                     SessionSoapNotes.embedding.cosine_distance(query_embedding)
-                ).limit(request.top_k)
+                ).limit(limit or request.top_k)
                 
                 result = await session.execute(stmt)
                 rows = result.fetchall()
@@ -496,7 +666,7 @@ Answer:"""
                         note_id=soap_note.note_id,
                         visit_date=visit_date
                     )
-                    chunks.append(chunk)
+                    chunks.append((chunk, np.asarray(soap_note.embedding, dtype=np.float32)))
                 
                 logger.info("Vector search completed", chunks_found=len(chunks))
                 return chunks
@@ -589,12 +759,13 @@ Answer:"""
                 logger.error("Failed to find patient by name", error=str(e))
                 return None
     
-    async def _generate_answer(self, context: str, patient_info: str, query: str) -> str:
-        """Generate answer using LLM with retrieved context."""
+    async def _generate_answer(self, context: str, patient_info: str, query: str, history: str = "") -> str:
+        """Generate answer using LLM with retrieved context and earlier conversation turns."""
         try:
             prompt_input = {
                 "context": context,
                 "patient_info": patient_info,
+                "history": history or "None",
                 "query": query
             }
             
@@ -619,6 +790,10 @@ Answer:"""
         
         return sources
 
+    def end_conversation(self, conversation_id: str, owner_id: Optional[uuid.UUID] = None) -> bool:
+        """Drop cached turns and retrieved context for a conversation of the owner."""
+        return self.conversations.discard(conversation_id, owner_id)
+
     async def get_notes_needing_embedding(
         self,
         note_ids: Optional[List[uuid.UUID]] = None,
@@ -0,0 +1,325 @@
+"""
+SOAP Draft Service
+Incremental SOAP drafting from a transcript that arrives in chunks during a visit
+
+Each draft update sends the model only the transcript text received since the previous
+update plus the current draft, and runs PII masking and NER on the new text only. At the
+end of the visit the remaining text is folded in with one more delta call, the draft is
+judged, and only rejected sections are rewritten before the note is saved.
+"""
+import os
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+from app.schemas.soap_schemas import SOAPNote, SOAPGenerationResponse
+from app.schemas.ner_schemas import NEROutput
+from app.services.prompt_budget import fit_text, compact_context, compact_note, usage_config
+from app.services.text_chunking import count_tokens
+from app.services.soap_generation_service import SOAP_SECTIONS
+
+logger = structlog.get_logger(__name__)
+
+# Update the draft once this many new transcript tokens have arrived...
+DRAFT_UPDATE_MIN_TOKENS = int(os.getenv("SOAP_DRAFT_UPDATE_MIN_TOKENS", "300"))
+# ...or this long after the last update, if any new text has arrived
+DRAFT_UPDATE_INTERVAL_SECONDS = float(os.getenv("SOAP_DRAFT_UPDATE_INTERVAL_SECONDS", "30"))
+# Drafts untouched for this long are discarded
+DRAFT_IDLE_TTL_SECONDS = float(os.getenv("SOAP_DRAFT_IDLE_TTL_SECONDS", "3600"))
+# Section rewrites allowed when the judge rejects the final draft
+DRAFT_FINAL_MAX_REGENERATIONS = int(os.getenv("SOAP_DRAFT_FINAL_MAX_REGENERATIONS", "2"))
+
+
+class DraftAccessError(LookupError):
+    """Raised when a draft is opened by someone other than the user who started it."""
+
+
+@dataclass
+class DraftState:
+    """Running state of one visit's draft."""
+    session_id: uuid.UUID
+    owner_id: Optional[uuid.UUID] = None
+    professional_id: Optional[uuid.UUID] = None
+    enable_pii_masking: bool = True
+    preserve_medical_context: bool = True
+    transcript: List[str] = field(default_factory=list)
+    masked_transcript: str = ""
+    pending: List[str] = field(default_factory=list)
+    draft: Optional[Dict[str, Any]] = None
+    entities: List[Dict[str, Any]] = field(default_factory=list)
+    pii_masked: bool = False
+    pii_entities_found: int = 0
+    version: int = 0
+    last_update_at: float = field(default_factory=time.monotonic)
+    touched_at: float = field(default_factory=time.monotonic)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def pending_text(self) -> str:
+        return " ".join(self.pending)
+
+    @property
+    def context_data(self) -> Dict[str, Any]:
+        return {"entities": self.entities, "total_entities": len(self.entities), "processing_time": 0.0}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Client-facing view of the draft."""
+        return {
+            "session_id": str(self.session_id),
+            "version": self.version,
+            "soap_note": self.draft,
+            "transcript_chunks": len(self.transcript),
+            "pending_tokens": count_tokens(self.pending_text),
+            "entity_count": len(self.entities),
+        }
+
+
+class SOAPDraftService:
+    """Keeps per-session drafts and updates them from new transcript text."""
+
+    def __init__(self, soap_service):
+        """
+        Args:
+            soap_service: SOAPGenerationService providing the models, judge and persistence
+        """
+        self.soap_service = soap_service
+        self._drafts: Dict[uuid.UUID, DraftState] = {}
+
+    def open(
+        self,
+        session_id: uuid.UUID,
+        professional_id: Optional[uuid.UUID] = None,
+        enable_pii_masking: bool = True,
+        preserve_medical_context: bool = True,
+        owner_id: Optional[uuid.UUID] = None
+    ) -> DraftState:
+        """
+        Return the session's draft, creating it if needed; a reconnect resumes the same draft.
+
+        Args:
+            session_id: Patient visit session ID
+            professional_id: Healthcare professional ID
+            enable_pii_masking: Whether to anonymize PII before drafting
+            preserve_medical_context: Whether to preserve medical terminology during PII masking
+            owner_id: User opening the draft; only they can resume it
+
+        Returns:
+            DraftState: The session's draft
+
+        Raises:
+            DraftAccessError: If the session's draft was opened by another user
+        """
+        self._evict_idle()
+        state = self._drafts.get(session_id)
+        if state is None:
+            state = DraftState(
+                session_id=session_id,
+                owner_id=owner_id,
+                professional_id=professional_id,
+                enable_pii_masking=enable_pii_masking,
+                preserve_medical_context=preserve_medical_context
+            )
+            self._drafts[session_id] = state
+            logger.info("📝 SOAP draft opened", session_id=str(session_id))
+        elif state.owner_id != owner_id:
+            raise DraftAccessError(f"Draft for session {session_id} not found")
+        state.touched_at = time.monotonic()
+        return state
+
+    def discard(self, session_id: uuid.UUID) -> None:
+        """Drop a session's draft."""
+        self._drafts.pop(session_id, None)
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        for session_id in [s for s, state in self._drafts.items() if now - state.touched_at > DRAFT_IDLE_TTL_SECONDS]:
+            logger.info("Discarding idle SOAP draft", session_id=str(session_id))
+            del self._drafts[session_id]
+
+    def append(self, state: DraftState, chunk: str) -> bool:
+        """
+        Add a transcript chunk.
+
+        Returns:
+            bool: Whether enough new text has accumulated to update the draft
+        """
+        chunk = chunk.strip()
+        if chunk:
+            state.transcript.append(chunk)
+            state.pending.append(chunk)
+        state.touched_at = time.monotonic()
+        if not state.pending:
+            return False
+        return (
+            count_tokens(state.pending_text) >= DRAFT_UPDATE_MIN_TOKENS
+            or time.monotonic() - state.last_update_at >= DRAFT_UPDATE_INTERVAL_SECONDS
+        )
+
+    async def update(self, state: DraftState) -> bool:
+        """
+        Fold the text received since the last update into the draft.
+
+        On failure the text stays pending and is retried with the next update.
+
+        Returns:
+            bool: Whether the draft changed
+        """
+        async with state.lock:
+            if not state.pending:
+                return False
+            pending = state.pending
+            state.pending = []
+            new_text = " ".join(pending)
+
+            try:
+                masked_text, masked, found = new_text, False, 0
+                if state.enable_pii_masking:
+                    masked_text, masked, found = await self.soap_service._apply_pii_masking(
+                        new_text, state.preserve_medical_context
+                    )
+
+                new_context = await self.soap_service.ner_service.extract_context_data(masked_text)
+
+                result = await self.soap_service.draft_chain.ainvoke({
+                    "draft": compact_note(state.draft) if state.draft else "{}",
+                    "new_text": fit_text(masked_text),
+                    "context_data": compact_context(new_context)
+                }, config=usage_config("draft"))
+                if not isinstance(result, dict) or not all(isinstance(result.get(s), dict) for s in SOAP_SECTIONS):
+                    raise ValueError("Draft update did not return all SOAP sections")
+
+            except Exception as e:
+                state.pending = pending + state.pending
+                logger.error("❌ SOAP draft update failed", session_id=str(state.session_id), error=str(e))
+                return False
+
+            state.pii_masked = state.pii_masked or masked
+            state.pii_entities_found += found
+            offset = len(state.masked_transcript) + (1 if state.masked_transcript else 0)
+            state.masked_transcript = f"{state.masked_transcript} {masked_text}" if state.masked_transcript else masked_text
+            self._merge_entities(state, new_context.get("entities", []), offset)
+            state.draft = result
+            state.version += 1
+            state.last_update_at = time.monotonic()
+            logger.info(
+                "✅ SOAP draft updated",
+                session_id=str(state.session_id),
+                version=state.version,
+                new_tokens=count_tokens(new_text)
+            )
+            return True
+
+    @staticmethod
+    def _merge_entities(state: DraftState, entities: List[Dict[str, Any]], offset: int) -> None:
+        """Add new entities, shifting their positions into the whole transcript and skipping repeats."""
+        seen = {(e.get("type"), str(e.get("value", "")).casefold()) for e in state.entities}
+        for entity in entities:
+            key = (entity.get("type"), str(entity.get("value", "")).casefold())
+            if key in seen:
+                continue
+            seen.add(key)
+            entity = dict(entity)
+            if entity.get("end_pos"):
+                entity["start_pos"] = entity.get("start_pos", 0) + offset
+                entity["end_pos"] += offset
+            state.entities.append(entity)
+
+    async def finalize(self, state: DraftState) -> SOAPGenerationResponse:
+        """
+        Finish the visit: fold in the remaining text, judge the draft and save it.
+
+        Rejected sections are rewritten against the whole masked transcript; only if
+        the judge rejects every section is the note regenerated in full.
+
+        Returns:
+            SOAPGenerationResponse: Final note, saved when approved
+        """
+        start_time = time.time()
+        svc = self.soap_service
+        regeneration_count = 0
+
+        try:
+            while state.pending:
+                if not await self.update(state):
+                    raise RuntimeError("Failed to fold the remaining transcript into the draft")
+            if state.draft is None:
+                raise ValueError("No transcript received")
+
+            async with state.lock:
+                note = state.draft
+                context_data = state.context_data
+                text = fit_text(state.masked_transcript)
+
+                judge_result = await svc._validate_with_judge(note)
+                while not judge_result.approved and regeneration_count < DRAFT_FINAL_MAX_REGENERATIONS:
+                    regeneration_count += 1
+                    failing = judge_result.failing_sections()
+                    logger.warning(
+                        "❌ Final draft rejected by Judge LLM",
+                        session_id=str(state.session_id),
+                        attempt=regeneration_count,
+                        sections=failing or "all"
+                    )
+                    if failing and len(failing) < len(SOAP_SECTIONS):
+                        note = await svc._regenerate_sections(text, context_data, note, judge_result)
+                    else:
+                        note = await svc.soap_chain.ainvoke({
+                            "text": text,
+                            "context_data": compact_context({
+                                **context_data,
+                                "validation_feedback": judge_result.reason,
+                                "suggestions": judge_result.suggestions
+                            })
+                        }, config=usage_config("soap"))
+                    judge_result = await svc._validate_with_judge(note)
+
+                soap_note = None
+                note_id = None
+                if judge_result.approved:
+                    soap_note = SOAPNote(**note)
+                    document_id = await svc._create_document_record(
+                        session_id=state.session_id,
+                        professional_id=state.professional_id,
+                        text_content=" ".join(state.transcript)
+                    )
+                    note_id = await svc._save_soap_note(
+                        soap_note=soap_note,
+                        context_data=context_data,
+                        session_id=state.session_id,
+                        document_id=document_id,
+                        professional_id=state.professional_id,
+                        ai_approved=True
+                    )
+                    self.discard(state.session_id)
+                    logger.info("✅ SOAP draft finalized", session_id=str(state.session_id), note_id=str(note_id))
+
+                return SOAPGenerationResponse(
+                    success=judge_result.approved,
+                    soap_note=soap_note,
+                    context_data=NEROutput(**context_data),
+                    ai_approved=judge_result.approved,
+                    note_id=note_id,
+                    processing_time=time.time() - start_time,
+                    regeneration_count=regeneration_count,
+                    validation_feedback=judge_result.reason,
+                    message="SOAP note finalized and approved" if judge_result.approved else "Final draft failed validation",
+                    pii_masked=state.pii_masked,
+                    pii_entities_found=state.pii_entities_found,
+                    original_text_preserved=True
+                )
+
+        except Exception as e:
+            logger.error("❌ SOAP draft finalization failed", session_id=str(state.session_id), error=str(e))
+            return SOAPGenerationResponse(
+                success=False,
+                processing_time=time.time() - start_time,
+                regeneration_count=regeneration_count,
+                validation_feedback=f"Finalization failed: {str(e)}",
+                message=f"SOAP draft finalization error: {str(e)}",
+                pii_masked=state.pii_masked,
+                pii_entities_found=state.pii_entities_found
+            )
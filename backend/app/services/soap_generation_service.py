@@ -5,33 +5,132 @@ Implements AI-powered SOAP note generation with Judge LLM validation
 import os
 import time
 import uuid
-import json
-import re
-from typing import Dict, Any, Optional
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 import structlog
 
 from langchain_core.prompts import PromptTemplate, ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.runnables import RunnableLambda
+from sqlalchemy import select, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services.ai_provider_utils import get_chat_model
+from app.services.ai_provider_utils import get_chat_model, with_structured_output, json_parser, parse_json_text
+from app.services.json_extraction import extract_json
 
 from app.schemas.soap_schemas import (
     SOAPNote, SOAPSection, SOAPGenerationRequest, 
-    SOAPGenerationResponse, JudgeLLMResponse
+    SOAPGenerationResponse, JudgeLLMResponse, SOAPSectionVerdict,
+    SOAPNoteOutput, SinglePassOutput, ChunkFactsOutput, SOAPSectionsRewriteOutput, BatchJudgeOutput
 )
 from app.schemas.ner_schemas import NEROutput
 from app.services.ner_service import NERService
 from app.services.rag_service import RAGService
 from app.services.pii_service import PIIService
+from app.services.entity_index_service import EntityIndexService
+from app.services.soap_prejudge import soap_prejudge
+from app.services.text_chunking import count_tokens, split_into_chunks
+from app.services.prompt_budget import fit_text, compact_context, compact_note, usage_config, token_usage
+from app.services.micro_batcher import MicroBatcher
+from app.services.bulk_generation_service import BULK_MAX_WORKERS
 from app.models.session_soap_notes import SessionSoapNotes
 from app.models.uploaded_documents import UploadedDocuments
+from app.models.patient_visit_sessions import PatientVisitSessions
 from app.database.db import async_session_maker
 
 logger = structlog.get_logger(__name__)
 
+# Judge rejections retried before a generation gives up
+MAX_REGENERATIONS = 3
+
+# Per-process cap on SOAP generations in flight (each one holds several LLM calls)
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("SOAP_MAX_CONCURRENT_GENERATIONS", "4"))
+_generation_slots = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+# Background (bulk) generations may hold only this many of those slots, so interactive
+# requests always find one free (given at least two slots)
+BULK_MAX_CONCURRENT_GENERATIONS = max(1, min(
+    int(os.getenv("SOAP_BULK_MAX_CONCURRENT_GENERATIONS", str(MAX_CONCURRENT_GENERATIONS - 1))),
+    MAX_CONCURRENT_GENERATIONS - 1
+))
+_bulk_generation_slots = asyncio.Semaphore(BULK_MAX_CONCURRENT_GENERATIONS)
+if MAX_CONCURRENT_GENERATIONS < 2:
+    # Bulk work still needs a slot to make progress, so none can be kept free
+    logger.warning(
+        "⚠️ SOAP_MAX_CONCURRENT_GENERATIONS below 2, interactive generations can queue behind bulk ones",
+        max_concurrent=MAX_CONCURRENT_GENERATIONS
+    )
+
+# Temperatures used for speculative candidates, in order
+SPECULATIVE_TEMPERATURES = [
+    float(t) for t in os.getenv("SOAP_SPECULATIVE_TEMPERATURES", "0.3,0.6,0.9,0.45,0.75").split(",") if t.strip()
+]
+
+# Map-reduce generation for long inputs
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("SOAP_MAP_REDUCE_THRESHOLD_TOKENS", "6000"))
+MAP_CHUNK_TOKENS = int(os.getenv("SOAP_MAP_CHUNK_TOKENS", "2000"))
+MAP_CHUNK_OVERLAP_TOKENS = int(os.getenv("SOAP_MAP_CHUNK_OVERLAP_TOKENS", "200"))
+MAP_MAX_CONCURRENCY = int(os.getenv("SOAP_MAP_MAX_CONCURRENCY", "4"))
+SOAP_SECTIONS = ("subjective", "objective", "assessment", "plan")
+
+# Batched judging for bulk/background generation: notes judged together in one call.
+# At most BULK_MAX_WORKERS bulk notes are in flight, so a larger batch could never fill.
+JUDGE_BATCH_SIZE = min(int(os.getenv("SOAP_JUDGE_BATCH_SIZE", "8")), BULK_MAX_WORKERS)
+JUDGE_BATCH_WAIT_MS = float(os.getenv("SOAP_JUDGE_BATCH_WAIT_MS", "200"))
+
+
+class GenerationSlot:
+    """
+    The generation slot(s) one request holds.
+
+    A batched judge call waits for other notes to join its batch; the slot is given
+    up meanwhile (see suspended) so those notes can be generated.
+    """
+
+    def __init__(self, background: bool = False):
+        """
+        Args:
+            background: Also take one of the bulk slots
+        """
+        self.semaphores = [_bulk_generation_slots, _generation_slots] if background else [_generation_slots]
+        self.held = 0
+
+    async def acquire(self) -> None:
+        try:
+            while self.held < len(self.semaphores):
+                await self.semaphores[self.held].acquire()
+                self.held += 1
+        except BaseException:
+            # Cancelled while waiting for the general slot: give back the bulk slot already taken
+            self.release()
+            raise
+
+    def release(self) -> None:
+        while self.held:
+            self.held -= 1
+            self.semaphores[self.held].release()
+
+    async def __aenter__(self) -> "GenerationSlot":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+    @asynccontextmanager
+    async def suspended(self):
+        """
+        Release the slot for the duration of the block and take it back afterwards.
+
+        If taking it back is cancelled, nothing stays held, so leaving the enclosing
+        ``async with`` releases nothing twice.
+        """
+        self.release()
+        try:
+            yield
+        finally:
+            await self.acquire()
+
 
 class SOAPGenerationService:
     """Service for AI-powered SOAP note generation with validation."""
@@ -41,75 +140,51 @@ class SOAPGenerationService:
         self.ner_service = NERService()
         self.rag_service = RAGService()
         self.pii_service = PIIService()
+        self.entity_index = EntityIndexService()
+        self.prejudge = soap_prejudge
         self.soap_model = None
         self.soap_chain = None
+        self._speculative_chains = {}
         self.judge_model = None
         self.judge_chain = None
+        self.single_pass_chain = None
+        self.map_chain = None
+        self.section_chain = None
+        self.batch_judge_chain = None
+        self.draft_chain = None
+        self.judge_batcher = MicroBatcher(
+            self._judge_batch, max_batch_size=JUDGE_BATCH_SIZE, max_wait_ms=JUDGE_BATCH_WAIT_MS, name="judge"
+        )
         self.provider = None  # Track which provider is being used (both models use same provider)
         self._initialize_models()
         self._setup_prompts()
     
     def _extract_json_from_text(self, text: str) -> Dict[str, Any]:
         """
-        Extract JSON from HuggingFace model output that may contain extra text.
+        Extract the SOAP JSON from model output that may contain extra text.
+        
+        Prefers a JSON object with all four SOAP sections, then any JSON object,
+        and finally builds a minimal structure from the text.
         
         Args:
             text: Raw model output text
             
         Returns:
             Dict: Parsed JSON object
-            
-        Raises:
-            ValueError: If no valid JSON is found
         """
         if not text or not text.strip():
             logger.warning("Empty text received from model")
             return self._fallback_text_parsing("")
-            
-        try:
-            # First try to parse the entire text as JSON
-            cleaned_text = text.strip()
-            return json.loads(cleaned_text)
-        except json.JSONDecodeError:
-            logger.info("Direct JSON parsing failed, attempting extraction from text", text_preview=text[:100])
-            
-            # If that fails, try to extract JSON from text using more sophisticated regex
-            # Look for JSON objects that contain the required SOAP sections
-            json_pattern = r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}'
-            matches = re.findall(json_pattern, text, re.DOTALL)
-            
-            for match in matches:
-                try:
-                    # Try to parse each potential JSON match
-                    parsed = json.loads(match)
-                    if isinstance(parsed, dict) and all(key in parsed for key in ['subjective', 'objective', 'assessment', 'plan']):
-                        logger.info("✅ Successfully extracted valid SOAP JSON from text")
-                        return parsed
-                except json.JSONDecodeError:
-                    continue
-            
-            # If no valid JSON found, try to find JSON block markers
-            json_start = text.find('{')
-            json_end = text.rfind('}') + 1
-            
-            if json_start != -1 and json_end > json_start:
-                try:
-                    json_text = text[json_start:json_end]
-                    parsed = json.loads(json_text)
-                    if isinstance(parsed, dict):
-                        logger.info("✅ Extracted JSON using block markers")
-                        return parsed
-                except json.JSONDecodeError:
-                    pass
-            
-            # Last resort: create a minimal structure from the text
-            logger.warning("Failed to extract valid JSON, using fallback text parsing", text_preview=text[:200])
-            return self._fallback_text_parsing(text)
-            
-        except Exception as e:
-            logger.error("JSON extraction failed with exception", error=str(e), text_preview=text[:200])
-            # Don't raise an exception, use fallback instead
-            return self._fallback_text_parsing(text)
+        
+        parsed = extract_json(text, required_keys=SOAP_SECTIONS)
+        if parsed is None:
+            parsed = extract_json(text, openers="{")
+        if isinstance(parsed, dict):
+            return parsed
+        
+        # Last resort: create a minimal structure from the text
+        logger.warning("Failed to extract valid JSON, using fallback text parsing", text_preview=text[:200])
+        return self._fallback_text_parsing(text)
     
     def _fallback_text_parsing(self, text: str) -> Dict[str, Any]:
         """
@@ -199,6 +274,7 @@ class SOAPGenerationService:
         """
         try:
             logger.info("Applying PII masking to clinical text", text_length=len(text))
+            masking_start = time.time()
             
             # Define entities to mask for clinical text
             clinical_entities = [
@@ -224,6 +300,7 @@ class SOAPGenerationService:
             
             # Use the PII service for anonymization
             masked_text, has_pii = await self.pii_service.quick_anonymize(text, clinical_entities)
+            token_usage.record("pii", count_tokens(text), latency_seconds=time.time() - masking_start)
             
             if has_pii:
                 # Count entities for reporting
@@ -251,11 +328,11 @@ class SOAPGenerationService:
 
             # SOAP Generation Model: Initialize with automatic OpenAI/Google Gemini fallback
             # Use higher temperature for more creative SOAP note generation
-            self.soap_model, soap_provider = get_chat_model(temperature=0.3)
+            self.soap_model, soap_provider = get_chat_model(temperature=0.3, operation="soap")
             
             # Judge LLM: Initialize with automatic OpenAI/Google Gemini fallback
             # Use lower temperature for more consistent validation
-            self.judge_model, judge_provider = get_chat_model(temperature=0.1)
+            self.judge_model, judge_provider = get_chat_model(temperature=0.1, operation="judge")
             
             # Track the provider (both should use the same provider)
             self.provider = soap_provider
@@ -362,6 +439,159 @@ Generate the SOAP note in JSON format:"""
             HumanMessagePromptTemplate.from_template(soap_human_prompt)
         ])
         
+        # Single-pass prompt: entity extraction and SOAP generation in one call
+        single_pass_system_prompt = """You are an expert medical professional specializing in audiology and hearing care with extensive medical knowledge and practical experience. Your task is to extract the biomedical entities from clinical information and generate a structured SOAP note from it in a single response.
+
+You must return ONLY a valid JSON object with the following exact structure (no additional text):
+{{
+    "entities": [
+        {{"type": "symptom", "value": "exact substring of the clinical text", "start": 0, "end": 10, "confidence": 0.95}}
+    ],
+    "subjective": {{
+        "content": "Patient's reported symptoms, concerns, and subjective experiences",
+        "confidence": 0.95,
+        "word_count": 50
+    }},
+    "objective": {{
+        "content": "Clinical findings, test results, and objective observations",
+        "confidence": 0.90,
+        "word_count": 75
+    }},
+    "assessment": {{
+        "content": "Clinical interpretation, diagnosis, and professional assessment",
+        "confidence": 0.85,
+        "word_count": 40
+    }},
+    "plan": {{
+        "content": "Treatment recommendations, follow-up plans, and next steps",
+        "confidence": 0.88,
+        "word_count": 60
+    }}
+}}
+
+Requirements:
+- Entities use exact substring values of the clinical text and 0-based character indices
+- Entity types include disease, symptom, medication, procedure, test, measurement, device and anatomy
+- Base the SOAP sections on the entities you extracted
+- Use proper audiological and medical terminology
+- Include specific measurements and test results where available
+- Maintain professional medical language
+- Be clinically accurate and specific
+- Return ONLY the JSON structure, no additional text or explanations"""
+        
+        single_pass_human_prompt = """Extract the medical entities and generate a SOAP note from the following clinical information:
+
+Clinical Text: {text}
+{feedback}
+Generate the JSON response:"""
+        
+        self.single_pass_prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(single_pass_system_prompt),
+            HumanMessagePromptTemplate.from_template(single_pass_human_prompt)
+        ])
+        
+        # Map prompt: fact extraction from one chunk of a long input
+        map_system_prompt = """You are an expert medical professional specializing in audiology and hearing care. You are given one excerpt of a longer clinical document or visit transcript. Extract every clinically relevant fact from the excerpt so that a SOAP note can later be written from the facts of all excerpts.
+
+You must return ONLY a valid JSON object with the following exact structure (no additional text):
+{{
+    "subjective": ["Patient-reported symptoms, history and concerns"],
+    "objective": ["Clinical findings, measurements and test results, with values and units"],
+    "assessment": ["Diagnoses and clinical interpretations stated in the excerpt"],
+    "plan": ["Treatments, referrals, devices and follow-up stated in the excerpt"],
+    "entities": [
+        {{"type": "symptom", "value": "exact substring of the excerpt", "confidence": 0.95}}
+    ]
+}}
+
+Requirements:
+- Each fact is one short, self-contained statement
+- Keep all numbers, units, laterality and dates exactly as written
+- Do not infer facts that are not in the excerpt; use empty lists when a category has none
+- Return ONLY the JSON structure, no additional text or explanations"""
+        
+        map_human_prompt = """Excerpt {chunk_number} of {chunk_count}:
+
+{chunk}
+
+Extract the facts in JSON format:"""
+        
+        self.map_prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(map_system_prompt),
+            HumanMessagePromptTemplate.from_template(map_human_prompt)
+        ])
+        
+        # Section prompt: rewrite only the sections the judge rejected
+        section_system_prompt = """You are an expert medical professional specializing in audiology and hearing care with extensive medical knowledge and practical experience. A reviewer rejected some sections of a SOAP note. Your task is to rewrite only those sections so that they address the reviewer's feedback and stay consistent with the accepted sections.
+
+You must return ONLY a valid JSON object containing exactly the requested sections, each with this structure (no additional text):
+{{
+    "<section name>": {{
+        "content": "Rewritten section content",
+        "confidence": 0.90,
+        "word_count": 50
+    }}
+}}
+
+Requirements:
+- Do not contradict the accepted sections
+- Use proper audiological and medical terminology
+- Include specific measurements and test results where available
+- Be clinically accurate and specific
+- Return ONLY the JSON structure, no additional text or explanations"""
+        
+        section_human_prompt = """Rewrite the following SOAP sections: {sections}
+
+Clinical Text: {text}
+
+Extracted Medical Entities: {context_data}
+
+Accepted Sections (keep consistent, do not return them):
+{accepted_sections}
+
+Reviewer Feedback:
+{feedback}
+
+Generate the rewritten sections in JSON format:"""
+        
+        self.section_prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(section_system_prompt),
+            HumanMessagePromptTemplate.from_template(section_human_prompt)
+        ])
+        
+        # Draft prompt: fold newly transcribed text into a running draft during the visit
+        draft_system_prompt = """You are an expert medical professional specializing in audiology and hearing care with extensive medical knowledge and practical experience. You are maintaining a SOAP note while a visit is in progress. You receive the current draft and only the transcript text that arrived since the draft was last updated.
+
+You must return ONLY a valid JSON object with the complete updated note in the following exact structure (no additional text):
+{{
+    "subjective": {{"content": "...", "confidence": 0.90, "word_count": 50}},
+    "objective": {{"content": "...", "confidence": 0.90, "word_count": 50}},
+    "assessment": {{"content": "...", "confidence": 0.85, "word_count": 40}},
+    "plan": {{"content": "...", "confidence": 0.85, "word_count": 40}}
+}}
+
+Requirements:
+- Keep everything in the draft that the new text does not change
+- Add new findings to the appropriate sections and correct statements the new text revises
+- Leave a section's content empty if nothing has been said about it yet
+- Use proper audiological and medical terminology
+- Return ONLY the JSON structure, no additional text or explanations"""
+        
+        draft_human_prompt = """Current Draft:
+{draft}
+
+New Transcript Text:
+{new_text}
+
+Medical Entities in the New Text: {context_data}
+
+Return the updated SOAP note in JSON format:"""
+        
+        self.draft_prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(draft_system_prompt),
+            HumanMessagePromptTemplate.from_template(draft_human_prompt)
+        ])
+        
         # Judge LLM System Prompt with few-shot examples
         judge_system_prompt = """You are a medical compliance judge specializing in hearing care documentation. Review SOAP notes for completeness, accuracy, and compliance with medical documentation standards.
 
@@ -370,9 +600,17 @@ Return your assessment in JSON format:
     "approved": true/false,
     "reason": "Detailed explanation of approval/rejection",
     "confidence": 0.95,
-    "suggestions": ["improvement suggestion 1", "suggestion 2"]
+    "suggestions": ["improvement suggestion 1", "suggestion 2"],
+    "sections": {{
+        "subjective": {{"approved": true/false, "reason": "Why this section passes or fails", "suggestions": []}},
+        "objective": {{"approved": true/false, "reason": "...", "suggestions": []}},
+        "assessment": {{"approved": true/false, "reason": "...", "suggestions": []}},
+        "plan": {{"approved": true/false, "reason": "...", "suggestions": []}}
+    }}
 }}
 
+The note is approved only if every section is approved. Judge each section on its own so that only failing sections need to be rewritten.
+
 APPROVAL CRITERIA:
 ✅ APPROVE if the SOAP note:
 - Contains all four sections (Subjective, Objective, Assessment, Plan)
@@ -392,11 +630,15 @@ FEW-SHOT EXAMPLES:
 
 Example 1 - APPROVED:
 SOAP Note: {{"subjective": {{"content": "Patient reports bilateral hearing loss progressively worsening over 6 months, difficulty understanding speech in noisy environments, occasional tinnitus in left ear"}}, "objective": {{"content": "Audiometry shows moderate sensorineural hearing loss 40-60 dB HL bilaterally, speech discrimination 85% right ear, 80% left ear, tympanometry normal"}}, "assessment": {{"content": "Bilateral moderate sensorineural hearing loss, likely age-related presbycusis, candidate for hearing aid amplification"}}, "plan": {{"content": "Recommend bilateral hearing aids, hearing aid evaluation appointment, follow-up in 3 months, counseling on communication strategies"}}}}
-Response: {{"approved": true, "reason": "Complete SOAP note with specific audiological details, clear clinical reasoning, and appropriate treatment recommendations", "confidence": 0.95, "suggestions": []}}
+Response: {{"approved": true, "reason": "Complete SOAP note with specific audiological details, clear clinical reasoning, and appropriate treatment recommendations", "confidence": 0.95, "suggestions": [], "sections": {{"subjective": {{"approved": true, "reason": "Specific symptoms and duration", "suggestions": []}}, "objective": {{"approved": true, "reason": "Audiometric values reported", "suggestions": []}}, "assessment": {{"approved": true, "reason": "Diagnosis follows from findings", "suggestions": []}}, "plan": {{"approved": true, "reason": "Specific, actionable plan", "suggestions": []}}}}}}
 
 Example 2 - REJECTED:
 SOAP Note: {{"subjective": {{"content": "Patient has hearing problems"}}, "objective": {{"content": "Some hearing loss noted"}}, "assessment": {{"content": "Hearing loss"}}, "plan": {{"content": "Will treat"}}}}
-Response: {{"approved": false, "reason": "SOAP note lacks clinical detail, specific measurements, and actionable treatment plans. Too vague for medical documentation standards", "confidence": 0.90, "suggestions": ["Add specific audiometric results", "Include detailed symptom description", "Provide specific treatment recommendations"]}}"""
+Response: {{"approved": false, "reason": "SOAP note lacks clinical detail, specific measurements, and actionable treatment plans. Too vague for medical documentation standards", "confidence": 0.90, "suggestions": ["Add specific audiometric results", "Include detailed symptom description", "Provide specific treatment recommendations"], "sections": {{"subjective": {{"approved": false, "reason": "No symptom description", "suggestions": ["Include detailed symptom description"]}}, "objective": {{"approved": false, "reason": "No measurements", "suggestions": ["Add specific audiometric results"]}}, "assessment": {{"approved": false, "reason": "Diagnosis not characterized", "suggestions": ["Specify type and degree of hearing loss"]}}, "plan": {{"approved": false, "reason": "Plan is not actionable", "suggestions": ["Provide specific treatment recommendations"]}}}}}}
+
+Example 3 - REJECTED (plan only):
+SOAP Note: {{"subjective": {{"content": "Patient reports gradual hearing decline in both ears over 2 years, difficulty following conversations in restaurants"}}, "objective": {{"content": "Pure tone audiometry: mild sloping to moderate sensorineural hearing loss bilaterally, 30-55 dB HL; word recognition 88% bilaterally"}}, "assessment": {{"content": "Bilateral mild-to-moderate sensorineural hearing loss consistent with presbycusis"}}, "plan": {{"content": "Follow up"}}}}
+Response: {{"approved": false, "reason": "Plan is too vague; other sections are complete", "confidence": 0.90, "suggestions": ["Specify hearing aid evaluation and follow-up interval"], "sections": {{"subjective": {{"approved": true, "reason": "Specific history", "suggestions": []}}, "objective": {{"approved": true, "reason": "Measurements reported", "suggestions": []}}, "assessment": {{"approved": true, "reason": "Supported diagnosis", "suggestions": []}}, "plan": {{"approved": false, "reason": "No specific treatment or follow-up interval", "suggestions": ["Specify hearing aid evaluation and follow-up interval"]}}}}}}"""
         
         judge_human_prompt = """Review the following SOAP note for medical compliance and completeness:
 
@@ -410,40 +652,438 @@ Provide your assessment:"""
             HumanMessagePromptTemplate.from_template(judge_human_prompt)
         ])
         
+        # Batched judge: same criteria and examples, several notes per call
+        batch_judge_human_prompt = """Review each of the following {note_count} SOAP notes independently for medical compliance and completeness. Do not let one note influence the verdict on another.
+
+{soap_notes}
+
+Return ONLY a JSON object with one verdict per note, each in the assessment format above plus the note id:
+{{"verdicts": [{{"id": 1, "approved": true/false, "reason": "...", "confidence": 0.95, "suggestions": [], "sections": {{...}}}}]}}
+
+Provide your assessments:"""
+        
+        self.batch_judge_prompt = ChatPromptTemplate.from_messages([
+            SystemMessagePromptTemplate.from_template(judge_system_prompt),
+            HumanMessagePromptTemplate.from_template(batch_judge_human_prompt)
+        ])
+        
         # Setup output parsers
-        self.judge_parser = JsonOutputParser(pydantic_object=JudgeLLMResponse)
+        self.judge_parser = json_parser(JudgeLLMResponse)
         
         # Create custom SOAP parser using RunnableLambda
         self.soap_parser = RunnableLambda(lambda x: self._extract_json_from_text(x.content if hasattr(x, 'content') else str(x)))
         
-        # Create chains
+        # Create chains; every call uses native structured output, falling back to the
+        # parsers above (or lenient JSON parsing) when the provider lacks support.
+        # Map, section and batch results are validated item by item below, so their
+        # text fallback does not reject a whole response over one bad item.
         if self.soap_model and self.judge_model:
-            self.soap_chain = self.soap_prompt | self.soap_model | self.soap_parser
-            self.judge_chain = self.judge_prompt | self.judge_model | self.judge_parser
+            self.soap_chain = self.soap_prompt | self._structured_soap_model(self.soap_model)
+            self.judge_chain = self.judge_prompt | with_structured_output(
+                self.judge_model, JudgeLLMResponse
+            )
+            self.single_pass_chain = self.single_pass_prompt | with_structured_output(
+                self.soap_model, SinglePassOutput, self._extract_json_from_text
+            )
+            self.map_chain = self.map_prompt | with_structured_output(
+                self.soap_model, ChunkFactsOutput, parse_json_text
+            )
+            self.section_chain = self.section_prompt | with_structured_output(
+                self.soap_model, SOAPSectionsRewriteOutput, parse_json_text
+            )
+            self.batch_judge_chain = self.batch_judge_prompt | with_structured_output(
+                self.judge_model, BatchJudgeOutput, parse_json_text
+            )
+            self.draft_chain = self.draft_prompt | with_structured_output(self.soap_model, SOAPNoteOutput)
             logger.info(f"✅ SOAP and Judge chains constructed successfully using {self.provider.upper()}")
         else:
             logger.error("❌ Cannot create chains - missing models", soap_model=bool(self.soap_model), judge_model=bool(self.judge_model))
     
-    async def _validate_with_judge(self, soap_note: Dict[str, Any]) -> JudgeLLMResponse:
+    def _structured_soap_model(self, model):
+        """Wrap a chat model to return a SOAP note dict."""
+        return with_structured_output(model, SOAPNoteOutput, self._extract_json_from_text)
+    
+    def _soap_chain_for_temperature(self, temperature: float):
+        """Return (and cache) a SOAP chain whose model uses the given temperature."""
+        chain = self._speculative_chains.get(temperature)
+        if chain is None:
+            model, _ = get_chat_model(temperature=temperature, operation="soap")
+            chain = self.soap_prompt | self._structured_soap_model(model)
+            self._speculative_chains[temperature] = chain
+        return chain
+    
+    async def _generate_speculative(
+        self,
+        chain_input: Dict[str, Any],
+        candidates: int
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[JudgeLLMResponse], int]:
+        """
+        Generate and judge several candidates concurrently; keep the first approved one.
+        
+        Candidates differ only in temperature. As soon as one is approved (and parses
+        into a SOAPNote) the remaining generate/judge tasks are cancelled.
+        
+        Args:
+            chain_input: SOAP chain input
+            candidates: Number of concurrent candidates
+            
+        Returns:
+            Tuple: (approved SOAP dict or None, last judge result, candidates evaluated)
+        """
+        temperatures = (SPECULATIVE_TEMPERATURES or [0.3])
+        temperatures = [temperatures[i % len(temperatures)] for i in range(candidates)]
+        
+        async def run_candidate(temperature: float):
+            soap_result = await self._soap_chain_for_temperature(temperature).ainvoke(chain_input, config=usage_config("soap"))
+            judge_result = await self._validate_with_judge(soap_result)
+            return temperature, soap_result, judge_result
+        
+        tasks: List[asyncio.Task] = [asyncio.create_task(run_candidate(t)) for t in temperatures]
+        last_judge_result = None
+        evaluated = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    temperature, soap_result, judge_result = await next_done
+                except Exception as e:
+                    logger.error("❌ Speculative candidate failed", error=str(e), error_type=type(e).__name__)
+                    continue
+                
+                evaluated += 1
+                last_judge_result = judge_result
+                if not judge_result.approved:
+                    logger.warning("❌ Speculative candidate rejected", temperature=temperature, reason=judge_result.reason)
+                    continue
+                
+                try:
+                    SOAPNote(**soap_result)
+                except Exception as e:
+                    logger.warning("Approved speculative candidate is not a valid SOAP note", error=str(e))
+                    continue
+                
+                logger.info("✅ Speculative candidate approved", temperature=temperature, evaluated=evaluated)
+                return soap_result, judge_result, evaluated
+            
+            return None, last_judge_result, evaluated
+        finally:
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.info("Cancelled remaining speculative candidates", cancelled=len(pending))
+    
+    async def _generate_single_pass(
+        self, text: str, context_data: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Extract entities and generate the SOAP sections with one LLM call.
+        
+        Args:
+            text: Clinical text (potentially PII-masked)
+            context_data: Current context; judge feedback from a rejected attempt is passed on
+            
+        Returns:
+            Tuple of (SOAP sections, context data built from the returned entities)
+        """
+        feedback = ""
+        if context_data.get("validation_feedback"):
+            feedback = f"\nThe previous SOAP note was rejected: {context_data['validation_feedback']}\n"
+            if context_data.get("suggestions"):
+                feedback += "Address these suggestions: " + "; ".join(context_data["suggestions"]) + "\n"
+        
+        start_time = time.time()
+        result = await self.single_pass_chain.ainvoke(
+            {"text": text, "feedback": feedback}, config=usage_config("single_pass")
+        )
+        raw_entities = result.pop("entities", None) if isinstance(result, dict) else None
+        
+        extracted_context = self.ner_service.build_context_data(
+            text, raw_entities if isinstance(raw_entities, list) else [], time.time() - start_time
+        )
+        return result, extracted_context
+    
+    def _resolve_pipeline_mode(self, request: SOAPGenerationRequest, text: str) -> str:
+        """Pick the pipeline for a request; auto switches to map-reduce for long inputs."""
+        if request.pipeline_mode != "auto":
+            return request.pipeline_mode
+        input_tokens = count_tokens(text)
+        if input_tokens > MAP_REDUCE_THRESHOLD_TOKENS:
+            logger.info("Long input, using map-reduce SOAP generation", input_tokens=input_tokens)
+            return "map_reduce"
+        return "standard"
+    
+    async def _map_chunks(self, text: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Map step of long-input generation: extract facts from each chunk in parallel.
+        
+        Chunks are token-bounded and overlap, and at most SOAP_MAP_MAX_CONCURRENCY
+        extraction calls run at once, so latency follows the slowest chunk rather
+        than the total length.
+        
+        Args:
+            text: Full clinical text (potentially PII-masked)
+            
+        Returns:
+            Tuple of (deduplicated facts grouped by SOAP section as prompt text,
+            context data built from the extracted entities)
+        """
+        start_time = time.time()
+        chunks = split_into_chunks(text, MAP_CHUNK_TOKENS, MAP_CHUNK_OVERLAP_TOKENS)
+        semaphore = asyncio.Semaphore(MAP_MAX_CONCURRENCY)
+        
+        async def extract(index: int, chunk: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    result = await self.map_chain.ainvoke({
+                        "chunk": chunk,
+                        "chunk_number": index + 1,
+                        "chunk_count": len(chunks)
+                    }, config=usage_config("map"))
+                    return result if isinstance(result, dict) else {}
+                except Exception as e:
+                    logger.error("❌ Chunk fact extraction failed", chunk=index + 1, error=str(e))
+                    return {}
+        
+        logger.info("🔍 Extracting facts from chunks", chunks=len(chunks), max_concurrency=MAP_MAX_CONCURRENCY)
+        results = await asyncio.gather(*(extract(i, chunk) for i, chunk in enumerate(chunks)))
+        
+        # Reduce: merge facts in document order, dropping repeats from chunk overlaps
+        facts: Dict[str, List[str]] = {section: [] for section in SOAP_SECTIONS}
+        seen_facts = set()
+        raw_entities: List[Dict[str, Any]] = []
+        seen_entities = set()
+        for result in results:
+            for section in SOAP_SECTIONS:
+                for fact in result.get(section) or []:
+                    if not isinstance(fact, str) or not fact.strip():
+                        continue
+                    key = (section, " ".join(fact.lower().split()))
+                    if key not in seen_facts:
+                        seen_facts.add(key)
+                        facts[section].append(fact.strip())
+            for entity in result.get("entities") or []:
+                if not isinstance(entity, dict):
+                    continue
+                key = (str(entity.get("type", "")).lower(), str(entity.get("value", "")).lower())
+                if key not in seen_entities:
+                    seen_entities.add(key)
+                    raw_entities.append({k: v for k, v in entity.items() if k not in ("start", "end")})
+        
+        fact_text = "Facts extracted from a long clinical document, grouped by SOAP section:\n"
+        for section in SOAP_SECTIONS:
+            fact_text += f"\n{section.capitalize()}:\n"
+            fact_text += "\n".join(f"- {fact}" for fact in facts[section]) if facts[section] else "- (none stated)"
+            fact_text += "\n"
+        
+        context_data = self.ner_service.build_context_data(text, raw_entities, time.time() - start_time)
+        logger.info(
+            "✅ Chunk facts merged",
+            chunks=len(chunks),
+            facts=sum(len(v) for v in facts.values()),
+            entity_count=context_data["total_entities"]
+        )
+        return fact_text, context_data
+    
+    @staticmethod
+    def _has_sections(soap_result: Any, names: List[str]) -> bool:
+        """Whether a generated note has the given sections as objects."""
+        return isinstance(soap_result, dict) and all(isinstance(soap_result.get(name), dict) for name in names)
+    
+    @staticmethod
+    def _parse_section_verdicts(raw_sections: Any) -> Dict[str, SOAPSectionVerdict]:
+        """Parse the judge's per-section verdicts, skipping malformed entries."""
+        verdicts = {}
+        if not isinstance(raw_sections, dict):
+            return verdicts
+        for name in SOAP_SECTIONS:
+            raw = raw_sections.get(name)
+            if not isinstance(raw, dict) or not isinstance(raw.get("approved"), bool):
+                continue
+            suggestions = raw.get("suggestions")
+            verdicts[name] = SOAPSectionVerdict(
+                approved=raw["approved"],
+                reason=str(raw.get("reason") or ""),
+                suggestions=[str(s) for s in suggestions] if isinstance(suggestions, list) else []
+            )
+        return verdicts
+    
+    @staticmethod
+    def _prejudge_section_verdicts(verdict) -> Dict[str, SOAPSectionVerdict]:
+        """Turn a pre-judge rejection limited to some sections into per-section verdicts."""
+        if verdict.decision != "reject" or not verdict.failed_sections:
+            return {}
+        return {
+            name: SOAPSectionVerdict(
+                approved=name not in verdict.failed_sections,
+                reason=verdict.reason if name in verdict.failed_sections else "",
+                suggestions=[s for s in verdict.suggestions if name in s]
+            )
+            for name in SOAP_SECTIONS
+        }
+    
+    async def _regenerate_sections(
+        self,
+        text: str,
+        context_data: Dict[str, Any],
+        soap_result: Dict[str, Any],
+        judge_result: JudgeLLMResponse
+    ) -> Dict[str, Any]:
+        """
+        Rewrite only the sections the judge rejected and merge them into the note.
+        
+        Args:
+            text: Clinical text (potentially PII-masked) or map-reduce facts
+            context_data: NER context data
+            soap_result: Rejected SOAP note whose approved sections are kept
+            judge_result: Judge verdict with per-section feedback
+            
+        Returns:
+            Dict: SOAP note with the failing sections replaced
+        """
+        failing = judge_result.failing_sections()
+        feedback_lines = []
+        for name in failing:
+            verdict = judge_result.sections[name]
+            line = f"- {name}: {verdict.reason or judge_result.reason}"
+            if verdict.suggestions:
+                line += " (suggestions: " + "; ".join(verdict.suggestions) + ")"
+            feedback_lines.append(line)
+        
+        context = {k: v for k, v in context_data.items() if k not in ("validation_feedback", "suggestions")}
+        rewritten = await self.section_chain.ainvoke({
+            "sections": ", ".join(failing),
+            "text": text,
+            "context_data": compact_context(context),
+            "accepted_sections": compact_note(
+                {name: soap_result[name] for name in SOAP_SECTIONS if name not in failing}
+            ),
+            "feedback": "\n".join(feedback_lines)
+        }, config=usage_config("section"))
+        if not isinstance(rewritten, dict):
+            raise ValueError("Section regeneration did not return a JSON object")
+        
+        merged = dict(soap_result)
+        for name in failing:
+            if isinstance(rewritten.get(name), dict):
+                merged[name] = rewritten[name]
+            else:
+                logger.warning("Section missing from regeneration output, keeping previous", section=name)
+        return merged
+    
+    def _to_judge_response(self, judge_result: Dict[str, Any]) -> JudgeLLMResponse:
+        """Build a JudgeLLMResponse from the judge's raw JSON verdict."""
+        return JudgeLLMResponse(
+            approved=judge_result.get("approved", False),
+            reason=judge_result.get("reason", "Unknown validation result"),
+            confidence=judge_result.get("confidence", 0.5),
+            suggestions=judge_result.get("suggestions", []),
+            sections=self._parse_section_verdicts(judge_result.get("sections"))
+        )
+    
+    async def _judge_note(self, soap_note: Dict[str, Any]) -> JudgeLLMResponse:
+        """Judge one note with its own Judge LLM call."""
+        judge_result = await self.judge_chain.ainvoke(
+            {"soap_note": compact_note(soap_note)}, config=usage_config("judge")
+        )
+        return self._to_judge_response(judge_result)
+    
+    async def _judge_batch(self, soap_notes: List[Dict[str, Any]]) -> List[JudgeLLMResponse]:
+        """
+        Judge several notes with one Judge LLM call.
+        
+        The system prompt and few-shot examples are paid once per batch instead of
+        once per note. Notes the batch response has no valid verdict for, or every
+        note if the batch call fails, are judged individually.
+        
+        Args:
+            soap_notes: SOAP note dictionaries
+            
+        Returns:
+            List[JudgeLLMResponse]: One verdict per note, in order
+        """
+        if len(soap_notes) == 1:
+            return [await self._judge_note(soap_notes[0])]
+        
+        verdicts: Dict[int, JudgeLLMResponse] = {}
+        try:
+            batch_result = await self.batch_judge_chain.ainvoke({
+                "note_count": len(soap_notes),
+                "soap_notes": "\n\n".join(
+                    f"Note {i + 1}:\n{compact_note(note)}" for i, note in enumerate(soap_notes)
+                )
+            }, config=usage_config("judge_batch"))
+            raw_verdicts = batch_result.get("verdicts") if isinstance(batch_result, dict) else batch_result
+            for raw in raw_verdicts if isinstance(raw_verdicts, list) else []:
+                try:
+                    note_id = int(raw["id"])
+                    if 1 <= note_id <= len(soap_notes) and isinstance(raw.get("approved"), bool):
+                        verdicts[note_id - 1] = self._to_judge_response(raw)
+                except Exception:
+                    continue
+        except Exception as e:
+            logger.error("❌ Batched Judge LLM call failed, judging notes individually", batch_size=len(soap_notes), error=str(e))
+        
+        missing = [i for i in range(len(soap_notes)) if i not in verdicts]
+        if missing:
+            if len(missing) < len(soap_notes):
+                logger.warning("Batched judge response missing verdicts", missing=len(missing), batch_size=len(soap_notes))
+            results = await asyncio.gather(
+                *(self._judge_note(soap_notes[i]) for i in missing), return_exceptions=True
+            )
+            for i, result in zip(missing, results):
+                verdicts[i] = result if isinstance(result, JudgeLLMResponse) else JudgeLLMResponse(
+                    approved=False,
+                    reason=f"Validation failed: {str(result)}",
+                    confidence=0.0,
+                    suggestions=["Manual review required"]
+                )
+        else:
+            logger.info("✅ Batched judge evaluated notes", batch_size=len(soap_notes))
+        
+        return [verdicts[i] for i in range(len(soap_notes))]
+    
+    async def _validate_with_judge(
+        self, soap_note: Dict[str, Any], batched: bool = False, slot: Optional[GenerationSlot] = None
+    ) -> JudgeLLMResponse:
         """
         Validate SOAP note using Judge LLM.
         
+        Notes the pre-judge can decide locally (broken placeholders, missing or
+        empty sections, clearly complete notes) never reach the Judge LLM.
+        
         Args:
             soap_note: Generated SOAP note dictionary
+            batched: Judge together with other notes submitted at about the same time
+                (bulk/background work); interactive requests use a single-note call
+            slot: Generation slot of the request, given up while a batched call waits
             
         Returns:
             JudgeLLMResponse: Validation result
         """
-        try:
-            soap_note_str = json.dumps(soap_note, indent=2)
-            judge_result = self.judge_chain.invoke({"soap_note": soap_note_str})
-            
+        verdict = self.prejudge.evaluate(soap_note)
+        if not verdict.deferred:
+            logger.info("Pre-judge decided without Judge LLM", decision=verdict.decision, rule=verdict.rule)
             return JudgeLLMResponse(
-                approved=judge_result.get("approved", False),
-                reason=judge_result.get("reason", "Unknown validation result"),
-                confidence=judge_result.get("confidence", 0.5),
-                suggestions=judge_result.get("suggestions", [])
+                approved=verdict.decision == "approve",
+                reason=f"Pre-judge ({verdict.rule}): {verdict.reason}",
+                confidence=verdict.confidence,
+                suggestions=verdict.suggestions,
+                sections=self._prejudge_section_verdicts(verdict)
             )
+        
+        try:
+            if batched and slot is not None:
+                async with slot.suspended():
+                    judge_result = await self.judge_batcher.submit(soap_note)
+            elif batched:
+                judge_result = await self.judge_batcher.submit(soap_note)
+            else:
+                judge_result = await self._judge_note(soap_note)
+            if self.prejudge.verdict_log_path:
+                await asyncio.to_thread(self.prejudge.record_verdict, soap_note, judge_result.approved)
+            
+            return judge_result
             
         except Exception as e:
             logger.error("❌ Judge LLM validation failed", error=str(e))
@@ -454,19 +1094,38 @@ Provide your assessment:"""
                 suggestions=["Manual review required"]
             )
     
-    async def generate_soap_note(self, request: SOAPGenerationRequest) -> SOAPGenerationResponse:
+    async def generate_soap_note(
+        self, request: SOAPGenerationRequest, batch_judge: bool = False, background: bool = False
+    ) -> SOAPGenerationResponse:
         """
         Generate SOAP note from clinical text with NER context and Judge validation.
         
+        Generations beyond SOAP_MAX_CONCURRENT_GENERATIONS wait for a free slot;
+        every model call is awaited so the event loop keeps serving other requests.
+        
         Args:
             request: SOAP generation request
+            batch_judge: Judge the note in a batch with concurrent generations
+                (for bulk/background work, where latency matters less than throughput);
+                the generation slot is free while the batch fills
+            background: Bulk/background work, limited to SOAP_BULK_MAX_CONCURRENT_GENERATIONS
+                slots so it cannot starve interactive requests
             
         Returns:
             SOAPGenerationResponse: Generated and validated SOAP note
         """
+        if not background and _generation_slots.locked():
+            logger.info("SOAP generation queued, all slots busy", max_concurrent=MAX_CONCURRENT_GENERATIONS)
+        async with GenerationSlot(background) as slot:
+            return await self._generate_soap_note(request, batch_judge, slot)
+    
+    async def _generate_soap_note(
+        self, request: SOAPGenerationRequest, batch_judge: bool = False, slot: Optional[GenerationSlot] = None
+    ) -> SOAPGenerationResponse:
+        """Run the PII -> NER -> SOAP -> Judge pipeline for one request."""
         start_time = time.time()
         regeneration_count = 0
-        max_regenerations = 3
+        max_regenerations = MAX_REGENERATIONS
         
         try:
             logger.info(
@@ -500,36 +1159,78 @@ Provide your assessment:"""
             
             print("jaidev","SOAP step 1")
             # Step 1: Extract NER context data if requested
+            # (single-pass and map-reduce modes get the entities from their own calls)
+            pipeline_mode = self._resolve_pipeline_mode(request, processed_text)
+            single_pass = pipeline_mode == "single_pass" and not request.speculative
+            soap_input_text = processed_text
             context_data = {}
-            if request.include_context:
+            if pipeline_mode == "map_reduce":
+                soap_input_text, map_context = await self._map_chunks(processed_text)
+                if request.include_context:
+                    context_data = map_context
+            elif request.include_context and not single_pass:
                 # Use processed text (potentially masked) for NER extraction
                 context_data = await self.ner_service.extract_context_data(processed_text)
                 logger.info("✅ NER context extracted", entity_count=context_data.get("total_entities", 0))
             
+            # Keep the generation prompt inside the input token budget
+            soap_input_text = fit_text(soap_input_text)
+            
             # Step 2: Generate SOAP note with retry logic
             soap_note = None
             validation_feedback = ""
             ai_approved = False
+            candidates_evaluated = 0
             print("jaidev",f"context_data: {context_data}")
-            while regeneration_count <= max_regenerations:
+            
+            # Speculative mode: one concurrent round of candidates replaces the retry loop
+            if request.speculative:
+                logger.info("🔀 Speculative SOAP generation", candidates=request.speculative_candidates)
+                soap_result, judge_result, candidates_evaluated = await self._generate_speculative(
+                    {
+                        "text": soap_input_text,
+                        "context_data": compact_context(context_data)
+                    },
+                    request.speculative_candidates
+                )
+                if judge_result is not None:
+                    validation_feedback = judge_result.reason
+                if soap_result is not None:
+                    soap_note = SOAPNote(**soap_result)
+                    ai_approved = True
+            
+            # Rejected note and verdict kept so a retry can rewrite only the failing sections
+            rejected_result = None
+            rejected_judge = None
+            while not request.speculative and regeneration_count <= max_regenerations:
                 try:
                     logger.info(f"🔄 SOAP generation attempt {regeneration_count + 1}/{max_regenerations + 1}")
                     
                     # Prepare chain input
                     chain_input = {
-                        "text": processed_text,  # Use processed text (potentially PII-masked)
-                        "context_data": json.dumps(context_data, indent=2) if context_data else "{}"
+                        "text": soap_input_text,  # Processed text (potentially PII-masked) or map-reduce facts
+                        "context_data": compact_context(context_data)
                     }
                     
                     logger.info("🔍 Executing SOAP chain")
                     
                     # Execute the SOAP generation chain
-                    soap_result = self.soap_chain.invoke(chain_input)
+                    if rejected_result is not None:
+                        logger.info("🔧 Regenerating rejected sections", sections=rejected_judge.failing_sections())
+                        soap_result = await self._regenerate_sections(
+                            soap_input_text, context_data, rejected_result, rejected_judge
+                        )
+                    elif single_pass:
+                        soap_result, extracted_context = await self._generate_single_pass(soap_input_text, context_data)
+                        if request.include_context:
+                            context_data.update(extracted_context)
+                    else:
+                        soap_result = await self.soap_chain.ainvoke(chain_input, config=usage_config("soap"))
                     
                     logger.info("✅ SOAP chain executed successfully", result_type=type(soap_result).__name__)
                     
                     # Validate with Judge LLM
-                    judge_result = await self._validate_with_judge(soap_result)
+                    judge_result = await self._validate_with_judge(soap_result, batched=batch_judge, slot=slot)
                     validation_feedback = judge_result.reason
                     
                     if judge_result.approved:
@@ -552,8 +1253,18 @@ Provide your assessment:"""
                             # Add feedback to context for regeneration
                             context_data["validation_feedback"] = judge_result.reason
                             context_data["suggestions"] = judge_result.suggestions
+                            
+                            # Keep the approved sections when the judge pinned the rejection on some of them
+                            failing = judge_result.failing_sections()
+                            accepted = [name for name in SOAP_SECTIONS if name not in failing]
+                            if failing and accepted and self._has_sections(soap_result, accepted):
+                                rejected_result, rejected_judge = soap_result, judge_result
+                            else:
+                                rejected_result, rejected_judge = None, None
                 
                 except Exception as e:
+                    # Fall back to regenerating the whole note after a failed attempt
+                    rejected_result, rejected_judge = None, None
                     regeneration_count += 1
                     error_msg = str(e)
                     logger.error(
@@ -593,6 +1304,7 @@ Provide your assessment:"""
                 note_id=note_id,
                 processing_time=processing_time,
                 regeneration_count=regeneration_count,
+                candidates_evaluated=candidates_evaluated,
                 validation_feedback=validation_feedback,
                 message="SOAP note generated and approved" if ai_approved else "SOAP note generation failed validation",
                 pii_masked=pii_masked,
@@ -627,6 +1339,38 @@ Provide your assessment:"""
                 original_text_preserved=True
             )
     
+    async def _insert_document_record(
+        self,
+        session: AsyncSession,
+        session_id: uuid.UUID,
+        text_content: str
+    ) -> uuid.UUID:
+        """
+        Insert a document record for text input inside the caller's transaction.
+        
+        Args:
+            session: Open database session (caller commits)
+            session_id: Patient visit session ID
+            text_content: The clinical text content
+            
+        Returns:
+            UUID: Created document ID
+        """
+        document_id = uuid.uuid4()
+        now = datetime.utcnow()
+        stmt = insert(UploadedDocuments).values(
+            document_id=document_id,
+            session_id=session_id,
+            document_name=f"SOAP_Input_{now.strftime('%Y%m%d_%H%M%S')}.txt",
+            file_path=f"soap_inputs/{session_id}/{document_id}.txt",  # Virtual storage key for text input
+            text_extracted=True,
+            extracted_text=text_content,
+            word_count=len(text_content.split()),
+            processing_status="completed",
+            processed_at=now
+        ).returning(UploadedDocuments.document_id)
+        return (await session.execute(stmt)).scalar_one()
+    
     async def _create_document_record(
         self,
         session_id: uuid.UUID,
@@ -646,24 +1390,8 @@ Provide your assessment:"""
         """
         async with async_session_maker() as session:
             try:
-                # Generate a unique document ID
-                document_id = uuid.uuid4()
-                
-                # Create document record
-                document_record = UploadedDocuments(
-                    document_id=document_id,
-                    session_id=session_id,
-                    document_name=f"SOAP_Input_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.txt",
-                    s3_upload_link=f"soap_inputs/{session_id}/{document_id}.txt",  # Virtual S3 key for text input
-                    text_extracted=True,
-                    extracted_text=text_content,
-                    processing_status="completed",
-                    processed_at=datetime.utcnow()
-                )
-                
-                session.add(document_record)
+                document_id = await self._insert_document_record(session, session_id, text_content)
                 await session.commit()
-                await session.refresh(document_record)
                 
                 logger.info("✅ Created document record for SOAP generation", 
                            document_id=str(document_id), 
@@ -672,6 +1400,7 @@ Provide your assessment:"""
                 return document_id
                 
             except Exception as e:
+                await session.rollback()
                 logger.error("❌ Failed to create document record", error=str(e))
                 raise
 
@@ -687,6 +1416,11 @@ Provide your assessment:"""
         """
         Save SOAP note to database with proper referential integrity.
         
+        The document record (if needed), the note with its embedding, its entity
+        index rows and the patient vector update are written in one transaction.
+        The embedding is computed before the transaction opens, so no row lock
+        is held across the embedding call.
+        
         Args:
             soap_note: Generated SOAP note
             context_data: NER context data
@@ -698,58 +1432,82 @@ Provide your assessment:"""
         Returns:
             UUID: Database ID of saved SOAP note
         """
+        # Clean data for JSON serialization
+        cleaned_content = self._clean_for_json_serialization(soap_note.dict())
+        cleaned_context_data = self._clean_for_json_serialization(context_data)
+        
+        # If AI approved, compute the RAG embedding up front so it is stored with the note
+        embedding = None
+        if ai_approved:
+            try:
+                logger.info("🤖 AI approved SOAP note, computing RAG embedding")
+                embedding = await self.rag_service.compute_note_embedding(cleaned_content)
+            except Exception as e:
+                # Log error but don't fail the save process; the note can be embedded later
+                logger.error("❌ RAG embedding failed for AI-approved note", error=str(e))
+        
         async with async_session_maker() as session:
             try:
-                # Clean data for JSON serialization
-                cleaned_content = self._clean_for_json_serialization(soap_note.dict())
-                cleaned_context_data = self._clean_for_json_serialization(context_data)
-                
                 logger.info("💾 Saving SOAP note to database", 
                            content_keys=list(cleaned_content.keys()) if isinstance(cleaned_content, dict) else "not_dict",
-                           context_data_keys=list(cleaned_context_data.keys()) if isinstance(cleaned_context_data, dict) else "not_dict")
+                           context_data_keys=list(cleaned_context_data.keys()) if isinstance(cleaned_context_data, dict) else "not_dict",
+                           embedded=embedding is not None)
                 
                 # If document_id is None, create a document record for the text input
                 if document_id is None:
                     logger.info("📝 Creating document record for text input")
-                    document_id = await self._create_document_record(
+                    document_id = await self._insert_document_record(
+                        session,
                         session_id=session_id,
-                        professional_id=professional_id,
                         text_content=soap_note.subjective.content + " " + soap_note.objective.content
                     )
                 
-                # Create database record
-                db_soap_note = SessionSoapNotes(
-                    session_id=session_id,
-                    document_id=document_id,
-                    professional_id=professional_id,
-                    ai_approved=ai_approved,
-                    user_approved=False,  # Requires manual approval
-                    content=cleaned_content,  # Save cleaned content
-                    context_data=cleaned_context_data,  # Save cleaned context data
-                )
+                note_id = (await session.execute(
+                    insert(SessionSoapNotes).values(
+                        session_id=session_id,
+                        document_id=document_id,
+                        professional_id=professional_id,
+                        ai_approved=ai_approved,
+                        user_approved=False,  # Requires manual approval
+                        content=cleaned_content,
+                        context_data=cleaned_context_data,
+                        embedding=embedding
+                    ).returning(SessionSoapNotes.note_id)
+                )).scalar_one()
                 
-                session.add(db_soap_note)
-                await session.commit()
-                await session.refresh(db_soap_note)
+                visit = (await session.execute(
+                    select(PatientVisitSessions.patient_id, PatientVisitSessions.visit_date)
+                    .where(PatientVisitSessions.session_id == session_id)
+                )).first()
+                patient_id, visit_date = visit if visit else (None, None)
                 
-                note_id = db_soap_note.note_id
+                # Keep the clinical entity index in sync with the stored context data
+                try:
+                    async with session.begin_nested():
+                        await self.entity_index.index_note(
+                            session,
+                            note_id,
+                            cleaned_context_data,
+                            patient_id=patient_id,
+                            session_id=session_id
+                        )
+                except Exception as e:
+                    logger.error("❌ Clinical entity indexing failed", note_id=str(note_id), error=str(e))
                 
-                # If AI approved, trigger RAG embedding pipeline
-                if ai_approved:
+                # Fold the embedding into the patient-level vector
+                if embedding is not None and patient_id is not None:
                     try:
-                        logger.info("🤖 AI approved SOAP note, triggering RAG embedding pipeline", note_id=str(note_id))
-                        
-                        # Trigger embedding for the AI-approved note
-                        embedding_success = await self.rag_service.embed_soap_note(note_id, force_reembed=False)
-                        
-                        if embedding_success:
-                            logger.info("✅ RAG embedding completed successfully for AI-approved note", note_id=str(note_id))
-                        else:
-                            logger.warning("⚠️ RAG embedding failed for AI-approved note", note_id=str(note_id))
-                            
+                        async with session.begin_nested():
+                            await self.rag_service.patient_vectors.apply_note_embedding(
+                                session, note_id, embedding, patient_id=patient_id, visit_date=visit_date
+                            )
                     except Exception as e:
-                        # Log error but don't fail the save process
-                        logger.error("❌ RAG embedding failed for AI-approved note", note_id=str(note_id), error=str(e))
+                        logger.error("❌ Patient vector update failed", note_id=str(note_id), error=str(e))
+                
+                await session.commit()
+                
+                if embedding is not None:
+                    logger.info("✅ RAG embedding stored with AI-approved note", note_id=str(note_id))
                 
                 return note_id
                 
@@ -0,0 +1,313 @@
+"""
+SOAP Pre-Judge
+Deterministic (and optionally learned) screening of SOAP notes before the Judge LLM
+
+Obviously broken notes are rejected locally; everything else is deferred to the Judge LLM.
+Rule-based approval of clearly complete notes is opt-in (SOAP_PREJUDGE_RULE_APPROVAL). The optional learned model is a logistic regression over
+the same hand-built features, trained offline (CPU only) from logged judge verdicts:
+
+    python -m app.services.soap_prejudge --log judge_verdicts.jsonl --out prejudge_model.json
+"""
+import os
+import re
+import json
+import math
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+SECTIONS = ("subjective", "objective", "assessment", "plan")
+
+PLACEHOLDER_PATTERNS = [
+    "requires manual review",
+    "require manual review",
+    "patient information extracted from clinical text",
+    "no content available",
+]
+VAGUE_PATTERNS = [
+    r"\bwill treat\b", r"\bsome hearing loss\b", r"\bhas hearing problems\b",
+    r"(?<!\w)n/a(?!\w)", r"\bunknown\b", r"\btbd\b", r"\bto be determined\b",
+]
+CLINICAL_TERMS = [
+    "db", "hz", "audiogram", "audiometry", "tympanometry", "sensorineural", "conductive",
+    "bilateral", "unilateral", "tinnitus", "hearing aid", "cochlear", "speech discrimination",
+    "otoscopy", "presbycusis", "follow-up", "refer", "referral", "referred", "ent", "pure tone",
+    "threshold",
+]
+# Whole terms only ("ent" must not match "patient"); letter-only boundaries so "40db" still counts
+CLINICAL_TERM_PATTERN = re.compile(
+    r"(?<![a-z])(?:" + "|".join(re.escape(term) for term in CLINICAL_TERMS) + r")(?![a-z])"
+)
+
+FEATURE_NAMES = [
+    *(f"{section}_log_words" for section in SECTIONS),
+    *(f"{section}_has_number" for section in SECTIONS),
+    "min_log_words",
+    "total_log_words",
+    "clinical_term_hits",
+    "vague_hits",
+    "placeholder",
+]
+
+
+def _section_text(note: Dict[str, Any], section: str) -> Optional[str]:
+    value = note.get(section) if isinstance(note, dict) else None
+    if isinstance(value, dict):
+        value = value.get("content")
+    return value if isinstance(value, str) else None
+
+
+def extract_features(note: Dict[str, Any]) -> np.ndarray:
+    """Feature vector (ordered as FEATURE_NAMES) shared by the learned model and its training."""
+    texts = [_section_text(note, section) or "" for section in SECTIONS]
+    words = [len(text.split()) for text in texts]
+    joined = " ".join(texts).lower()
+
+    features = [
+        *(math.log1p(count) for count in words),
+        *(1.0 if re.search(r"\d", text) else 0.0 for text in texts),
+        math.log1p(min(words)),
+        math.log1p(sum(words)),
+        math.log1p(len(CLINICAL_TERM_PATTERN.findall(joined))),
+        float(sum(len(re.findall(pattern, joined)) for pattern in VAGUE_PATTERNS)),
+        1.0 if any(p in joined for p in PLACEHOLDER_PATTERNS) else 0.0,
+    ]
+    return np.asarray(features, dtype=np.float64)
+
+
+@dataclass
+class PreJudgeVerdict:
+    """Outcome of pre-judging a note: approve, reject, or defer to the Judge LLM."""
+    decision: str
+    rule: str
+    reason: str
+    confidence: float = 1.0
+    suggestions: List[str] = field(default_factory=list)
+    # Sections a rejection is limited to; empty when the whole note is at fault
+    failed_sections: List[str] = field(default_factory=list)
+
+    @property
+    def deferred(self) -> bool:
+        return self.decision == "defer"
+
+
+class LogisticPreJudgeModel:
+    """Standardized logistic regression over FEATURE_NAMES."""
+
+    def __init__(self, weights: np.ndarray, bias: float, mean: np.ndarray, scale: np.ndarray):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.scale = scale
+
+    def predict_proba(self, features: np.ndarray) -> float:
+        z = float((features - self.mean) / self.scale @ self.weights + self.bias)
+        return 1.0 / (1.0 + math.exp(-max(min(z, 50.0), -50.0)))
+
+    @classmethod
+    def load(cls, path: str) -> "LogisticPreJudgeModel":
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("features") != FEATURE_NAMES:
+            raise ValueError("Pre-judge model was trained on a different feature set")
+        return cls(
+            weights=np.asarray(data["weights"], dtype=np.float64),
+            bias=float(data["bias"]),
+            mean=np.asarray(data["mean"], dtype=np.float64),
+            scale=np.asarray(data["scale"], dtype=np.float64),
+        )
+
+    @classmethod
+    def train(cls, X: np.ndarray, y: np.ndarray, l2: float = 1e-2, epochs: int = 2000, lr: float = 0.1) -> "LogisticPreJudgeModel":
+        """Fit with full-batch gradient descent (the data is small)."""
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        Xs = (X - mean) / scale
+        weights = np.zeros(X.shape[1])
+        bias = 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(Xs @ weights + bias)))
+            error = p - y
+            weights -= lr * (Xs.T @ error / len(y) + l2 * weights)
+            bias -= lr * float(error.mean())
+        return cls(weights, bias, mean, scale)
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({
+                "features": FEATURE_NAMES,
+                "weights": self.weights.tolist(),
+                "bias": self.bias,
+                "mean": self.mean.tolist(),
+                "scale": self.scale.tolist(),
+            }, f, indent=2)
+
+
+class SOAPPreJudge:
+    """Screens SOAP notes before the Judge LLM and counts which rules fire."""
+
+    def __init__(self):
+        self.enabled = os.getenv("SOAP_PREJUDGE_ENABLED", "true").lower() == "true"
+        self.rule_approval = os.getenv("SOAP_PREJUDGE_RULE_APPROVAL", "false").lower() == "true"
+        self.min_section_words = int(os.getenv("SOAP_PREJUDGE_MIN_SECTION_WORDS", "3"))
+        self.approve_min_section_words = int(os.getenv("SOAP_PREJUDGE_APPROVE_MIN_SECTION_WORDS", "15"))
+        self.model_approve_threshold = float(os.getenv("SOAP_PREJUDGE_MODEL_APPROVE_THRESHOLD", "0.97"))
+        self.model_reject_threshold = float(os.getenv("SOAP_PREJUDGE_MODEL_REJECT_THRESHOLD", "0.03"))
+        self.verdict_log_path = os.getenv("SOAP_JUDGE_VERDICT_LOG")
+        self.model: Optional[LogisticPreJudgeModel] = None
+        self.rule_hits: Counter = Counter()
+        self.decisions: Counter = Counter()
+
+        model_path = os.getenv("SOAP_PREJUDGE_MODEL_PATH")
+        if model_path:
+            try:
+                self.model = LogisticPreJudgeModel.load(model_path)
+                logger.info("✅ Pre-judge model loaded", path=model_path)
+            except Exception as e:
+                logger.error("❌ Failed to load pre-judge model, using rules only", path=model_path, error=str(e))
+
+    def _verdict(self, decision: str, rule: str, reason: str, confidence: float = 1.0,
+                 suggestions: Optional[List[str]] = None,
+                 failed_sections: Optional[List[str]] = None) -> PreJudgeVerdict:
+        self.rule_hits[rule] += 1
+        self.decisions[decision] += 1
+        return PreJudgeVerdict(decision, rule, reason, confidence, suggestions or [], failed_sections or [])
+
+    def evaluate(self, note: Dict[str, Any]) -> PreJudgeVerdict:
+        """
+        Pre-judge a generated SOAP note.
+
+        Args:
+            note: SOAP note dictionary as produced by the SOAP chain
+
+        Returns:
+            PreJudgeVerdict: approve / reject / defer with the rule that decided
+        """
+        if not self.enabled:
+            return PreJudgeVerdict("defer", "disabled", "Pre-judge disabled")
+
+        if not isinstance(note, dict):
+            return self._verdict("reject", "not_an_object", "SOAP note is not a JSON object",
+                                 suggestions=["Return the four SOAP sections as a JSON object"])
+
+        texts = {section: _section_text(note, section) for section in SECTIONS}
+        missing = [section for section, text in texts.items() if text is None]
+        if missing:
+            return self._verdict("reject", "missing_section", f"Missing sections: {', '.join(missing)}",
+                                 suggestions=[f"Add the {section} section" for section in missing],
+                                 failed_sections=missing)
+
+        joined = " ".join(texts.values()).lower()
+        if any(pattern in joined for pattern in PLACEHOLDER_PATTERNS):
+            return self._verdict("reject", "fallback_placeholder",
+                                 "SOAP note contains fallback placeholders instead of clinical content",
+                                 suggestions=["Regenerate the note from the clinical text"])
+
+        short = [section for section, text in texts.items() if len(text.split()) < self.min_section_words]
+        if short:
+            return self._verdict("reject", "empty_section", f"Sections without content: {', '.join(short)}",
+                                 suggestions=[f"Add clinical detail to the {section} section" for section in short],
+                                 failed_sections=short)
+
+        features = extract_features(note)
+        if self.model is not None:
+            probability = self.model.predict_proba(features)
+            if probability >= self.model_approve_threshold:
+                return self._verdict("approve", "model_approve",
+                                     f"Pre-judge model approval (p={probability:.3f})", confidence=probability)
+            if probability <= self.model_reject_threshold:
+                return self._verdict("reject", "model_reject",
+                                     f"Pre-judge model rejection (p={probability:.3f})", confidence=1 - probability,
+                                     suggestions=["Add specific findings, measurements and an actionable plan"])
+
+        if self.rule_approval and self._clearly_complete(texts, features):
+            return self._verdict("approve", "complete_note",
+                                 "All sections are detailed and objective findings include measurements")
+
+        return self._verdict("defer", "deferred_to_llm", "Deferred to Judge LLM")
+
+    def _clearly_complete(self, texts: Dict[str, str], features: np.ndarray) -> bool:
+        if any(len(text.split()) < self.approve_min_section_words for text in texts.values()):
+            return False
+        if not re.search(r"\d", texts["objective"]):
+            return False
+        if features[FEATURE_NAMES.index("vague_hits")] > 0:
+            return False
+        # The model's self-reported section confidence is deliberately not trusted here
+        return features[FEATURE_NAMES.index("clinical_term_hits")] >= math.log1p(3)
+
+    def record_verdict(self, note: Dict[str, Any], approved: bool) -> None:
+        """Append a Judge LLM verdict to the training log (if SOAP_JUDGE_VERDICT_LOG is set)."""
+        if not self.verdict_log_path:
+            return
+        try:
+            with open(self.verdict_log_path, "a") as f:
+                f.write(json.dumps({
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "approved": bool(approved),
+                    "soap_note": note,
+                }, default=str) + "\n")
+        except Exception as e:
+            logger.warning("Failed to record judge verdict", error=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-rule hit counters and the share of notes decided without the Judge LLM."""
+        total = sum(self.decisions.values())
+        decided = total - self.decisions.get("defer", 0)
+        return {
+            "enabled": self.enabled,
+            "model_loaded": self.model is not None,
+            "total_evaluated": total,
+            "decisions": dict(self.decisions),
+            "rule_hits": dict(self.rule_hits),
+            "llm_calls_avoided_ratio": decided / total if total else 0.0,
+        }
+
+
+def train_from_log(log_path: str, out_path: str) -> Dict[str, Any]:
+    """Train the logistic pre-judge from a judge verdict JSONL log."""
+    X, y = [], []
+    with open(log_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record.get("soap_note"), dict):
+                X.append(extract_features(record["soap_note"]))
+                y.append(1.0 if record.get("approved") else 0.0)
+
+    if len(set(y)) < 2:
+        raise ValueError("Need both approved and rejected verdicts to train")
+
+    X_arr, y_arr = np.vstack(X), np.asarray(y)
+    model = LogisticPreJudgeModel.train(X_arr, y_arr)
+    model.save(out_path)
+
+    predictions = np.array([model.predict_proba(x) for x in X_arr])
+    return {
+        "examples": len(y),
+        "approved_share": float(y_arr.mean()),
+        "train_accuracy": float(((predictions >= 0.5) == (y_arr == 1)).mean()),
+        "model_path": out_path,
+    }
+
+
+# Shared across SOAP services within the process so counters aggregate
+soap_prejudge = SOAPPreJudge()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the SOAP pre-judge from logged judge verdicts")
+    parser.add_argument("--log", required=True, help="JSONL file written via SOAP_JUDGE_VERDICT_LOG")
+    parser.add_argument("--out", required=True, help="Where to write the model JSON")
+    cli_args = parser.parse_args()
+    print(json.dumps(train_from_log(cli_args.log, cli_args.out), indent=2))
@@ -0,0 +1,102 @@
+"""
+Stage History Service
+Persists the recent per-stage token and latency samples used by the pipeline estimator
+
+Samples recorded by the token usage tracker are written to pipeline_stage_samples every
+PIPELINE_STAGE_HISTORY_FLUSH_SECONDS, and the latest PIPELINE_STAGE_HISTORY_WINDOW of
+each stage are loaded at startup, so estimates survive restarts and agree across workers.
+"""
+import os
+import asyncio
+from typing import Optional
+
+import structlog
+
+from app.services.prompt_budget import token_usage, STAGE_HISTORY_WINDOW, TokenUsageTracker
+from app.data.pipeline_stage_samples_repository import PipelineStageSamplesRepository
+from app.database.db import async_session_maker
+
+logger = structlog.get_logger(__name__)
+
+STAGE_HISTORY_FLUSH_SECONDS = float(os.getenv("PIPELINE_STAGE_HISTORY_FLUSH_SECONDS", "60"))
+
+
+class StageHistoryService:
+    """Loads stage samples at startup and flushes new ones in the background."""
+
+    def __init__(self, tracker: TokenUsageTracker = token_usage):
+        """
+        Args:
+            tracker: Token usage tracker whose samples are persisted
+        """
+        self.tracker = tracker
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self) -> int:
+        """
+        Seed the tracker's recent windows from the database.
+
+        Returns:
+            int: Number of samples loaded
+        """
+        async with async_session_maker() as session:
+            rows = await PipelineStageSamplesRepository(session).recent(STAGE_HISTORY_WINDOW)
+        self.tracker.load_history([
+            (row.stage, row.input_tokens, row.output_tokens, row.latency_seconds) for row in rows
+        ])
+        logger.info("✅ Pipeline stage history loaded", samples=len(rows))
+        return len(rows)
+
+    async def flush(self) -> int:
+        """
+        Persist the samples recorded since the last flush and prune old ones.
+
+        Returns:
+            int: Number of samples written
+        """
+        samples = self.tracker.take_unsaved()
+        if not samples:
+            return 0
+        async with async_session_maker() as session:
+            repo = PipelineStageSamplesRepository(session)
+            await repo.add_many([
+                {
+                    "stage": stage,
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "latency_seconds": latency_seconds,
+                    "estimated": estimated,
+                }
+                for stage, input_tokens, output_tokens, latency_seconds, estimated in samples
+            ])
+            await repo.prune(STAGE_HISTORY_WINDOW)
+            await session.commit()
+        logger.debug("Pipeline stage samples flushed", samples=len(samples))
+        return len(samples)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(STAGE_HISTORY_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Failed to persist pipeline stage samples", error=str(e))
+
+    def start(self) -> None:
+        """Start the background flusher unless it is already running."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flusher and persist what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+stage_history = StageHistoryService()
@@ -0,0 +1,112 @@
+"""
+Text Chunking Utilities
+Token counting and token-bounded, overlapping chunking for long clinical inputs
+"""
+import re
+from functools import lru_cache
+from typing import List
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Rough characters-per-token ratio for English text when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Return the tiktoken encoding, or None if tiktoken is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.info("tiktoken unavailable, estimating tokens from length", error=str(e))
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count (or estimate) the tokens in a text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        int: Token count
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _split_units(text: str) -> List[str]:
+    """Split text into paragraphs, then sentences, keeping the separators."""
+    units = []
+    for paragraph in re.split(r"(?<=\n)\s*\n", text):
+        units.extend(part for part in re.split(r"(?<=[.!?])\s+", paragraph) if part.strip())
+    return units
+
+
+def _hard_split(unit: str, max_tokens: int) -> List[str]:
+    """Split a single over-long sentence on whitespace."""
+    pieces, current, current_tokens = [], [], 0
+    for word in unit.split():
+        word_tokens = count_tokens(word + " ")
+        if current and current_tokens + word_tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_into_chunks(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Split text into chunks of at most max_tokens tokens on sentence boundaries.
+
+    Consecutive chunks share roughly overlap_tokens tokens of trailing sentences,
+    so facts spanning a boundary appear whole in at least one chunk.
+
+    Args:
+        text: Text to split
+        max_tokens: Token budget per chunk
+        overlap_tokens: Tokens repeated from the end of the previous chunk
+
+    Returns:
+        List[str]: Chunks in document order
+    """
+    if count_tokens(text) <= max_tokens:
+        return [text] if text.strip() else []
+
+    units: List[str] = []
+    for unit in _split_units(text):
+        units.extend(_hard_split(unit, max_tokens) if count_tokens(unit) > max_tokens else [unit])
+    unit_tokens = [count_tokens(unit) for unit in units]
+
+    chunks: List[str] = []
+    start = 0
+    while start < len(units):
+        end, used = start, 0
+        while end < len(units) and used + unit_tokens[end] <= max_tokens:
+            used += unit_tokens[end]
+            end += 1
+        end = max(end, start + 1)
+        chunks.append(" ".join(units[start:end]))
+        if end >= len(units):
+            break
+
+        # Step back over trailing units for the overlap, always making progress
+        next_start, overlap = end, 0
+        while next_start - 1 > start and overlap + unit_tokens[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += unit_tokens[next_start]
+        start = next_start
+
+    return chunks
+
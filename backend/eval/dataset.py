@@ -0,0 +1,149 @@
+"""
+Synthetic SOAP note corpus for retrieval benchmarks.
+
+Notes, metadata and embeddings are derived deterministically from (seed, note index),
+so any note or query can be regenerated without a database or an embedding API.
+Embeddings are unit vectors clustered around per-topic centroids; each patient has a
+primary topic, so a patient's notes resemble each other the way real histories do.
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+EMBEDDING_DIM = 768
+
+# Namespace for deterministic patient/professional/note UUIDs
+CORPUS_NAMESPACE = uuid.UUID("6f1c1d1e-8a0b-4c59-9f2e-2b7c3f0d9a11")
+
+CONDITIONS = [
+    "sensorineural hearing loss", "conductive hearing loss", "mixed hearing loss", "tinnitus",
+    "otitis media", "otosclerosis", "presbycusis", "noise-induced hearing loss",
+    "meniere's disease", "cerumen impaction", "auditory processing disorder", "sudden hearing loss",
+]
+DEVICES = [
+    "behind-the-ear hearing aid", "receiver-in-canal hearing aid", "cochlear implant",
+    "bone-anchored hearing aid", "in-the-ear hearing aid", "tinnitus masker", "none",
+]
+SYMPTOMS = [
+    "difficulty hearing in noisy environments", "ringing in the left ear", "ear fullness",
+    "dizziness", "muffled speech", "ear pain", "reduced hearing on the phone",
+]
+PLANS = [
+    "hearing aid fitting and follow-up in 4 weeks", "repeat audiogram in 6 months",
+    "refer to ENT for evaluation", "cerumen removal and recheck", "tinnitus retraining therapy",
+    "adjust hearing aid programming", "counseling on hearing protection",
+]
+
+
+@dataclass
+class SyntheticNote:
+    """One synthetic SOAP note with the metadata used by RAG filters."""
+    index: int
+    note_id: uuid.UUID
+    patient_id: uuid.UUID
+    professional_id: uuid.UUID
+    visit_date: datetime
+    topic: int
+    user_approved: bool
+    content: Dict[str, Any]
+    embedding: np.ndarray
+
+
+class SyntheticCorpus:
+    """Deterministic synthetic corpus of SOAP notes."""
+
+    def __init__(
+        self,
+        num_notes: int,
+        dim: int = EMBEDDING_DIM,
+        seed: int = 42,
+        num_topics: int = 64,
+        num_patients: int = None,
+        num_professionals: int = 50,
+        start_date: datetime = datetime(2022, 1, 1, tzinfo=timezone.utc),
+        span_days: int = 3 * 365,
+        topic_noise: float = 0.75,
+        primary_topic_share: float = 0.7,
+    ):
+        self.num_notes = num_notes
+        self.dim = dim
+        self.seed = seed
+        self.num_topics = num_topics
+        self.num_patients = num_patients or max(1, num_notes // 5)
+        self.num_professionals = num_professionals
+        self.start_date = start_date
+        self.span_days = span_days
+        self.topic_noise = topic_noise
+        self.primary_topic_share = primary_topic_share
+
+        centroids = np.random.default_rng([seed, 0]).normal(size=(num_topics, dim))
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    @staticmethod
+    def _uuid(kind: str, number: int) -> uuid.UUID:
+        return uuid.uuid5(CORPUS_NAMESPACE, f"{kind}-{number}")
+
+    def patient_id(self, patient_number: int) -> uuid.UUID:
+        return self._uuid("patient", patient_number)
+
+    def professional_id(self, professional_number: int) -> uuid.UUID:
+        return self._uuid("professional", professional_number)
+
+    def note(self, index: int) -> SyntheticNote:
+        """Regenerate note `index` exactly."""
+        rng = np.random.default_rng([self.seed, 1, index])
+
+        patient_number = int(rng.integers(self.num_patients))
+        if rng.random() < self.primary_topic_share:
+            topic = patient_number % self.num_topics
+        else:
+            topic = int(rng.integers(self.num_topics))
+
+        noise = rng.normal(scale=self.topic_noise / np.sqrt(self.dim), size=self.dim)
+        embedding = self.centroids[topic] + noise
+        embedding = (embedding / np.linalg.norm(embedding)).astype(np.float32)
+
+        visit_date = self.start_date + timedelta(days=float(rng.uniform(0, self.span_days)))
+        condition = CONDITIONS[topic % len(CONDITIONS)]
+        device = DEVICES[(topic // len(CONDITIONS)) % len(DEVICES)]
+        symptom = SYMPTOMS[int(rng.integers(len(SYMPTOMS)))]
+        plan = PLANS[int(rng.integers(len(PLANS)))]
+        threshold = int(rng.integers(15, 90))
+
+        content = {
+            "subjective": {"content": f"Patient reports {symptom}. History consistent with {condition}."},
+            "objective": {"content": f"Pure tone average {threshold} dB HL. Current device: {device}."},
+            "assessment": {"content": f"Findings consistent with {condition}."},
+            "plan": {"content": f"Plan: {plan}."},
+        }
+
+        return SyntheticNote(
+            index=index,
+            note_id=self._uuid("note", index),
+            patient_id=self.patient_id(patient_number),
+            professional_id=self.professional_id(int(rng.integers(self.num_professionals))),
+            visit_date=visit_date,
+            topic=topic,
+            user_approved=bool(rng.random() < 0.9),
+            content=content,
+            embedding=embedding,
+        )
+
+    def iter_batches(self, batch_size: int = 5000) -> Iterator[List[SyntheticNote]]:
+        """Yield the corpus in index order, batch_size notes at a time."""
+        for start in range(0, self.num_notes, batch_size):
+            yield [self.note(i) for i in range(start, min(start + batch_size, self.num_notes))]
+
+    def query_indices(self, num_queries: int) -> List[int]:
+        """Deterministically choose the notes that benchmark queries are derived from."""
+        rng = np.random.default_rng([self.seed, 2])
+        return sorted(rng.choice(self.num_notes, size=min(num_queries, self.num_notes), replace=False).tolist())
+
+    def query_embedding(self, index: int, noise: float = 0.3) -> np.ndarray:
+        """Query vector paraphrasing note `index` (its embedding plus small noise)."""
+        rng = np.random.default_rng([self.seed, 3, index])
+        query = self.note(index).embedding + rng.normal(scale=noise / np.sqrt(self.dim), size=self.dim)
+        return (query / np.linalg.norm(query)).astype(np.float32)
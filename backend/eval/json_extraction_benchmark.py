@@ -0,0 +1,185 @@
+"""
+JSON extraction micro-benchmark.
+
+Compares the shared single-pass extractor (app/services/json_extraction.py) with the
+regex-based parsers it replaced: the SOAP parser's nested-brace regex followed by
+first-{ / last-} block markers, and the greedy \\{.*\\} search used by the NER, judge and
+PII parsers. Inputs range from clean model output to pathological cases (stray
+brackets in prose, deep nesting, truncated output, thousands of brace fragments).
+Reports the median time per call and whether a JSON object was recovered, as JSON.
+
+The extractor module is loaded on its own (not through app.services), so no database
+or provider configuration is needed. Progress goes to stderr and the JSON report only
+to stdout or --output.
+
+Usage:
+    python eval/json_extraction_benchmark.py
+    python eval/json_extraction_benchmark.py --size 2000 --repeats 5 --output results.json
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+
+# Keep the extractor's debug logging out of the JSON report
+structlog.configure(
+    wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING),
+    logger_factory=structlog.PrintLoggerFactory(sys.stderr),
+)
+
+
+def _load_extractor() -> Callable[..., Optional[Any]]:
+    """Import app/services/json_extraction.py without running the app.services package."""
+    path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "services", "json_extraction.py"
+    )
+    spec = importlib.util.spec_from_file_location("json_extraction", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.extract_json
+
+
+extract_json = _load_extractor()
+
+SOAP_SECTIONS = ("subjective", "objective", "assessment", "plan")
+
+
+# Parsers as they were before the shared extractor
+
+def legacy_soap_extract(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text.strip())
+    except json.JSONDecodeError:
+        for match in re.findall(r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}', text, re.DOTALL):
+            try:
+                parsed = json.loads(match)
+                if isinstance(parsed, dict) and all(key in parsed for key in SOAP_SECTIONS):
+                    return parsed
+            except json.JSONDecodeError:
+                continue
+        json_start = text.find('{')
+        json_end = text.rfind('}') + 1
+        if json_start != -1 and json_end > json_start:
+            try:
+                parsed = json.loads(text[json_start:json_end])
+                if isinstance(parsed, dict):
+                    return parsed
+            except json.JSONDecodeError:
+                pass
+    return None
+
+
+def legacy_greedy_extract(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except Exception:
+        m = re.search(r"\{.*\}", text, re.DOTALL)
+        if m:
+            try:
+                return json.loads(m.group(0))
+            except Exception:
+                return None
+        return None
+
+
+def shared_soap_extract(text: str) -> Optional[Any]:
+    parsed = extract_json(text, required_keys=SOAP_SECTIONS)
+    return parsed if parsed is not None else extract_json(text, openers="{")
+
+
+def shared_object_extract(text: str) -> Optional[Any]:
+    return extract_json(text, openers="{")
+
+
+PARSERS: Dict[str, Callable[[str], Optional[Any]]] = {
+    "legacy_soap_regex": legacy_soap_extract,
+    "legacy_greedy_regex": legacy_greedy_extract,
+    "shared_soap": shared_soap_extract,
+    "shared_object": shared_object_extract,
+}
+
+
+# Inputs
+
+def _soap_note(size: int) -> Dict[str, Any]:
+    sentence = "Patient reports {gradual} hearing loss in the [left] ear with tinnitus. "
+    return {
+        section: {"content": sentence * max(1, size // 40), "confidence": 0.9, "word_count": 12 * max(1, size // 40)}
+        for section in SOAP_SECTIONS
+    }
+
+
+def build_cases(size: int) -> Dict[str, str]:
+    note = json.dumps(_soap_note(size))
+    nested: Any = {"value": 1}
+    for _ in range(min(size, 400)):
+        nested = {"child": nested}
+    truncated = note[: len(note) - 10]
+    return {
+        "clean": note,
+        "fenced_with_prose": f"Here is the SOAP note:\n```json\n{note}\n```\nLet me know if you need changes.",
+        "large_with_trailing_prose": note + "\n\nNotes: values in {braces} came from the transcript.",
+        "stray_openers_before_json": "{ " * size + note,
+        "brace_fragments_in_prose": "see {item} and [ref] " * size + note,
+        "deeply_nested": f"Result: {json.dumps({**_soap_note(10), 'extra': nested})} done",
+        "truncated_output": "Draft: " + truncated + " {" * size,
+        "unclosed_openers": "Draft follows {" + " {a" * size,
+    }
+
+
+def measure(parser: Callable[[str], Optional[Any]], text: str, repeats: int) -> Dict[str, Any]:
+    timings: List[float] = []
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = parser(text)
+        timings.append(time.perf_counter() - started)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "found_soap": isinstance(result, dict) and all(key in result for key in SOAP_SECTIONS),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    cases = build_cases(args.size)
+    parsers = [name.strip() for name in args.parsers.split(",") if name.strip()]
+    results: Dict[str, Any] = {}
+    for case, text in cases.items():
+        results[case] = {"input_chars": len(text)}
+        for name in parsers:
+            results[case][name] = measure(PARSERS[name], text, args.repeats)
+            print(f"{case:28s} {name:20s} {results[case][name]['median_ms']:>10.3f} ms", file=sys.stderr)
+    return {"size": args.size, "repeats": args.repeats, "results": results}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark JSON extraction from LLM output")
+    parser.add_argument("--size", type=int, default=1000, help="Scale of the generated inputs")
+    parser.add_argument("--repeats", type=int, default=7, help="Calls per parser and input")
+    parser.add_argument("--parsers", default=",".join(PARSERS), help=f"Comma-separated subset of {tuple(PARSERS)}")
+    parser.add_argument("--output", help="Write JSON results to this file (default stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    report = run(args)
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()